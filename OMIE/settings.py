@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from core.backups import DEFAULT_BACKUP_PRAGMAS, backup_database, company_label, discover_backups
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'core.middleware.COOPDisableMiddleware',  # Desabilita COOP header em desenvolvimento
     'core.middleware.DatabaseSelectorMiddleware',  # Seleção de banco de dados
+    'core.middleware.QueryInstrumentationMiddleware',  # Server-Timing e /admin/perf/
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -75,43 +79,8 @@ WSGI_APPLICATION = 'OMIE.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',  # Banco para autenticação Django
-    },
-    'benjamin': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'benjamin.db',
-    },
-    'casa_da_logistica': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'casa_da_logistica.db',
-    },
-    'cdg': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'cdg.db',
-    },
-    'criarmais': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'criarmais.db',
-    },
-    'educa': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'educa.db',
-    },
-    'itamar': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'itamar.db',
-    },
-    'site': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'core' / 'backup_com_xml' / 'site.db',
-    },
-}
-
-# Database router para múltiplos bancos
-DATABASE_ROUTERS = ['core.routers.MultiDatabaseRouter']
+# Backups das empresas: abertos somente leitura (ver core/backups.py)
+BACKUP_DIR = BASE_DIR / 'core' / 'backup_com_xml'
 
 # Nomes amigáveis dos bancos para exibição
 DATABASE_NAMES = {
@@ -124,6 +93,92 @@ DATABASE_NAMES = {
     'site': 'Site',
 }
 
+# Snapshots descobertos em BACKUP_DIR ('<empresa>.db' ou '<empresa>.<versão>.db');
+# empresas sem nome cadastrado recebem um nome derivado do alias
+BACKUP_FILES = discover_backups(BACKUP_DIR, DATABASE_NAMES)
+DATABASE_NAMES.update({
+    company: company_label(company)
+    for company in BACKUP_FILES if company not in DATABASE_NAMES
+})
+
+# Modo consolidado: todos os backups anexados em uma única conexão
+CONSOLIDATED_DATABASE = 'grupo'
+CONSOLIDATED_DATABASE_NAME = 'Grupo (consolidado)'
+
+# Intervalo (segundos) entre verificações de novos snapshots em BACKUP_DIR
+BACKUP_REFRESH_INTERVAL = 30
+# Segundos em que um snapshot substituído continua disponível para as
+# requisições e downloads que já o usavam
+BACKUP_ALIAS_GRACE = 60 * 60
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',  # Banco para autenticação Django
+    },
+    **{company: backup_database(path) for company, path in BACKUP_FILES.items()},
+}
+
+# Database router para múltiplos bancos
+DATABASE_ROUTERS = ['core.routers.MultiDatabaseRouter']
+
+# PRAGMAs aplicados nas conexões dos backups (connection_created). Os
+# valores padrão ficam em core/backups.py; para ajustar, sobrescreva só as
+# chaves necessárias, ex.: {**DEFAULT_BACKUP_PRAGMAS, 'mmap_size': 0}
+BACKUP_SQLITE_PRAGMAS = DEFAULT_BACKUP_PRAGMAS
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# 'snapshots' guarda resultados por empresa/snapshot (ver core/cache.py).
+# Em produção com vários workers, aponte para um backend compartilhado
+# (Redis, Memcached ou FileBasedCache).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'snapshots': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'omie-snapshots',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Páginas do admin já renderizadas (core/pages.py), compactadas
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'omie-pages',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+SNAPSHOT_CACHE = 'snapshots'
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24  # Um snapshot novo já troca as chaves
+PAGE_CACHE = 'pages'  # None desliga o cache de páginas
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Instrumentação de SQL (core/perf.py): requisições mantidas no histórico
+# de cada processo e queries mais lentas guardadas por requisição
+PERF_HISTORY_SIZE = 1000
+PERF_SLOW_QUERIES = 5
+
+# Exportações em segundo plano (core/jobs.py): processos do pool, prioridade
+# (nice) deles, exportações ativas por usuário e dias até apagar o arquivo
+EXPORT_DIR = BASE_DIR / 'exports'
+EXPORT_WORKERS = 2
+EXPORT_NICE = 10
+EXPORT_MAX_ACTIVE_JOBS = 3
+EXPORT_RETENTION_DAYS = 7
+# Segundos sem sinal de vida até um job em andamento ser dado como morto
+EXPORT_STALE_AFTER = 30 * 60
+# Exportação de todas as empresas (core/group_exports.py): um processo por
+# empresa, para o tempo total ficar perto do da empresa mais lenta, com a
+# prioridade baixa das exportações (EXPORT_NICE) e uma CPU livre para as
+# requisições interativas
+GROUP_EXPORT_WORKERS = max(1, min(len(DATABASE_NAMES), (os.cpu_count() or 1) - 1))
+
+# Contagens dos changelists (core/pagination.py): tabelas sem filtro acima
+# deste tamanho usam estimativa enquanto o COUNT(*) exato roda em segundo plano
+CHANGELIST_COUNT_ESTIMATE_THRESHOLD = 500000
+CHANGELIST_COUNT_WORKERS = 2
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -161,7 +216,8 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_DIRS = [BASE_DIR / 'staticfiles']
+# Sem STATICFILES_DIRS: o app não tem estáticos próprios e a pasta de
+# origem não pode ser o STATIC_ROOT (destino do collectstatic)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -20,10 +20,16 @@ from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path
 from django.views.generic import RedirectView
-from core.views import select_database
+from core.sites import company_sites
+from core.views import export_job_download, export_jobs, performance, select_database
 
 urlpatterns = [
     path('', RedirectView.as_view(url='/admin/', permanent=False)),
+    path('admin/perf/', performance, name='admin_perf'),
+    path('admin/exportacoes/', export_jobs, name='admin_export_jobs'),
+    path('admin/exportacoes/<int:pk>/download/', export_job_download, name='admin_export_job_download'),
+    # /admin/<empresa>/: um AdminSite por empresa, sem depender de sessão
+    *(path(f'admin/{site.company}/', site.urls) for site in company_sites()),
     path('admin/', admin.site.urls),
     path('select-database/', select_database, name='select_database'),
 ]
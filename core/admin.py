@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html, mark_safe
-from django.http import HttpResponse
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, PatternFill, Alignment
+from .child_exports import ChildExportMixin
+from .dates import IsoDate, IsoDateListFilter
+from .details import NfDetailMixin
+from .exports import excel_export
+from .filters import CategoryListFilter
+from .lookups import category_description
+from .options import OmieModelAdmin
 from .models import (
     CategoriaCadastro, ClientesCadastro, ContaCorrenteCadastro,
     ContaPagarCadastro, ContaPagarDistribuicao, ContaReceberCadastro,
@@ -16,116 +19,25 @@ from .models import (
 
 # Função auxiliar para exportar para Excel
 def export_to_excel(modeladmin, request, queryset):
-    """Exporta os registros selecionados para Excel com otimização de queries"""
-    import re
-    from datetime import datetime, date
-    
-    model = queryset.model
-    model_name = model._meta.verbose_name_plural or model._meta.model_name
-    
-    # Otimizar queryset com select_related para ForeignKeys
-    related_fields = []
-    for field in model._meta.fields:
-        if field.is_relation and field.related_model:
-            related_fields.append(field.name)
-    
-    if related_fields:
-        queryset = queryset.select_related(*related_fields)
-    
-    # Criar workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = model_name[:31]
-    
-    # Obter campos do list_display ou todos os campos do model
-    if hasattr(modeladmin, 'list_display') and modeladmin.list_display:
-        field_names = []
-        headers = []
-        for field in modeladmin.list_display:
-            if field == '__str__':
-                continue
-            if hasattr(model, field):
-                field_names.append(field)
-                try:
-                    headers.append(model._meta.get_field(field).verbose_name.title())
-                except:
-                    headers.append(field.replace('_', ' ').title())
-            elif hasattr(modeladmin, field):
-                field_names.append(field)
-                method = getattr(modeladmin, field)
-                if hasattr(method, 'short_description'):
-                    headers.append(method.short_description)
-                else:
-                    headers.append(field.replace('_', ' ').title())
-    else:
-        field_names = [f.name for f in model._meta.fields]
-        headers = [f.verbose_name.title() for f in model._meta.fields]
-    
-    # Estilo do cabeçalho
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Escrever cabeçalhos
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Rastrear larguras máximas das colunas
-    col_widths = [len(str(h)) for h in headers]
-    
-    # Escrever dados usando iterator() para economia de memória
-    row_num = 2
-    for obj in queryset.iterator():
-        for col_num, field in enumerate(field_names, 1):
-            try:
-                if hasattr(model, field) and hasattr(getattr(model, field, None), 'field'):
-                    value = getattr(obj, field, '')
-                elif hasattr(modeladmin, field):
-                    method = getattr(modeladmin, field)
-                    value = method(obj)
-                    if isinstance(value, str) and '<' in value:
-                        value = re.sub('<[^<]+?>', '', value)
-                else:
-                    value = getattr(obj, field, '')
-                
-                # Converter valores
-                if value is None:
-                    value = ''
-                elif isinstance(value, (datetime, date)):
-                    value = value.strftime('%d/%m/%Y') if isinstance(value, date) else value.strftime('%d/%m/%Y %H:%M')
-                elif hasattr(value, '__str__') and not isinstance(value, (str, int, float, bool)):
-                    value = str(value)
-                
-                ws.cell(row=row_num, column=col_num, value=value)
-                
-                # Atualizar largura máxima (apenas primeiras 500 linhas para performance)
-                if row_num <= 500:
-                    col_widths[col_num - 1] = max(col_widths[col_num - 1], len(str(value)[:50]))
-            except Exception:
-                ws.cell(row=row_num, column=col_num, value='')
-        row_num += 1
-    
-    # Ajustar largura das colunas
-    for col, width in enumerate(col_widths, 1):
-        ws.column_dimensions[get_column_letter(col)].width = min(width + 2, 50)
-    
-    # Criar resposta HTTP
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="{model_name}.xlsx"'
-    wb.save(response)
-    return response
+    """Exporta os registros selecionados para Excel em streaming (core/exports.py)"""
+    return excel_export(modeladmin, request, queryset)
 
 export_to_excel.short_description = "📊 Exportar selecionados para Excel"
 
 
+# Colunas da distribuição por departamento (contas a pagar e a receber)
+department_export_fields = {
+    'item_index': 'Item',
+    'ccoddep': 'Departamento',
+    'cdesdep': 'Descrição do departamento',
+    'nperdep': '% Departamento',
+    'nvaldep': 'Valor do departamento',
+}
+
+
 # Configuração para CategoriaCadastro
 @admin.register(CategoriaCadastro)
-class CategoriaCadastroAdmin(admin.ModelAdmin):
+class CategoriaCadastroAdmin(OmieModelAdmin):
     list_display = ['id', 'codigo_formatado', 'descricao', 'tipo_categoria', 'natureza', 'status_conta']
     list_filter = [
         'tipo_categoria', 
@@ -210,7 +122,7 @@ class CategoriaCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para ClientesCadastro
 @admin.register(ClientesCadastro)
-class ClientesCadastroAdmin(admin.ModelAdmin):
+class ClientesCadastroAdmin(OmieModelAdmin):
     list_display = ['codigo_cliente_omie', 'razao_social', 'nome_fantasia', 'cnpj_cpf', 'cidade', 'estado', 'status_cliente']
     list_filter = [
         'estado', 
@@ -223,6 +135,7 @@ class ClientesCadastroAdmin(admin.ModelAdmin):
     ]
     search_fields = ['razao_social', 'nome_fantasia', 'cnpj_cpf', 'codigo_cliente_integracao', 'email']
     list_per_page = 25
+    autocomplete_index = True
     ordering = ['razao_social']
     
     @admin.display(description='Status')
@@ -319,7 +232,7 @@ class ClientesCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para ContaCorrenteCadastro
 @admin.register(ContaCorrenteCadastro)
-class ContaCorrenteCadastroAdmin(admin.ModelAdmin):
+class ContaCorrenteCadastroAdmin(OmieModelAdmin):
     list_display = ['ncodcc', 'descricao', 'codigo_banco_formatado', 'codigo_agencia', 'numero_conta_corrente', 'tipo', 'status_conta']
     list_filter = [
         'codigo_banco', 
@@ -419,24 +332,31 @@ class ContaCorrenteCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para ContaPagarCadastro  
 @admin.register(ContaPagarCadastro)
-class ContaPagarCadastroAdmin(admin.ModelAdmin):
+class ContaPagarCadastroAdmin(ChildExportMixin, OmieModelAdmin):
     list_display = ['codigo_lancamento_omie', 'nome_cliente', 'nome_vendedor', 'nome_projeto', 'numero_documento', 'valor_formatado', 'data_vencimento', 'status_visual']
     list_filter = [
         'status_titulo', 
-        ('data_emissao', admin.DateFieldListFilter), 
-        ('data_vencimento', admin.DateFieldListFilter), 
+        ('data_emissao', IsoDateListFilter), 
+        ('data_vencimento', IsoDateListFilter), 
         'retem_ir', 
         'retem_iss', 
         'bloqueado',
-        'codigo_categoria',
+        ('codigo_categoria', CategoryListFilter),
         ('numero_documento_fiscal', admin.EmptyFieldListFilter)
     ]
     search_fields = ['numero_documento', 'codigo_lancamento_integracao', 'cliente__razao_social', 'vendedor__nome']
     list_per_page = 25
-    ordering = ['-data_vencimento']
+    keyset_pagination = True
+    ordering = [IsoDate('data_vencimento').desc()]
+    iso_date_hierarchy = 'data_vencimento'
     autocomplete_fields = ['cliente', 'vendedor', 'projeto']
     readonly_fields = ['sync_created_at', 'sync_updated_at']
     
+    # Distribuição por departamento exportada junto com o título (core/child_exports.py)
+    child_export_model = ContaPagarDistribuicao
+    child_export_fields = department_export_fields
+    child_export_label = 'departamentos'
+    
     fieldsets = (
         ('🆔 Identificação do Título', {
             'fields': (
@@ -497,7 +417,7 @@ class ContaPagarCadastroAdmin(admin.ModelAdmin):
     def nome_cliente(self, obj):
         if obj.cliente:
             return obj.cliente.razao_social or obj.cliente.nome_fantasia
-        return f'Cód: {obj.codigo_cliente_fornecedor}' if obj.codigo_cliente_fornecedor else '-'
+        return f'Cód: {obj.cliente_id}' if obj.cliente_id else '-'
     
     @admin.display(description='Vendedor')
     def nome_vendedor(self, obj):
@@ -531,7 +451,7 @@ class ContaPagarCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para ContaPagarDistribuicao
 @admin.register(ContaPagarDistribuicao)
-class ContaPagarDistribuicaoAdmin(admin.ModelAdmin):
+class ContaPagarDistribuicaoAdmin(OmieModelAdmin):
     list_display = ['id', 'parent_id', 'item_index', 'ccoddep', 'cdesdep', 'nvaldep']
     list_filter = ['ccoddep']
     search_fields = ['cdesdep']
@@ -540,23 +460,30 @@ class ContaPagarDistribuicaoAdmin(admin.ModelAdmin):
 
 # Configuração para ContaReceberCadastro
 @admin.register(ContaReceberCadastro)
-class ContaReceberCadastroAdmin(admin.ModelAdmin):
+class ContaReceberCadastroAdmin(ChildExportMixin, OmieModelAdmin):
     list_display = ['codigo_lancamento_omie', 'nome_cliente', 'nome_vendedor', 'nome_projeto', 'numero_documento', 'valor_formatado', 'data_vencimento', 'status_visual']
     list_filter = [
         'status_titulo', 
-        ('data_emissao', admin.DateFieldListFilter), 
-        ('data_vencimento', admin.DateFieldListFilter), 
+        ('data_emissao', IsoDateListFilter), 
+        ('data_vencimento', IsoDateListFilter), 
         'vendedor_rel', 
         'bloqueado',
-        'codigo_categoria',
+        ('codigo_categoria', CategoryListFilter),
         ('numero_documento_fiscal', admin.EmptyFieldListFilter)
     ]
     search_fields = ['numero_documento', 'codigo_lancamento_integracao', 'cliente__razao_social', 'vendedor_rel__nome']
     list_per_page = 25
-    ordering = ['-data_vencimento']
+    keyset_pagination = True
+    ordering = [IsoDate('data_vencimento').desc()]
+    iso_date_hierarchy = 'data_vencimento'
     autocomplete_fields = ['cliente', 'vendedor_rel', 'projeto_rel']
     readonly_fields = ['sync_created_at', 'sync_updated_at']
     
+    # Distribuição por departamento exportada junto com o título (core/child_exports.py)
+    child_export_model = ContaReceberDistribuicao
+    child_export_fields = department_export_fields
+    child_export_label = 'departamentos'
+    
     fieldsets = (
         ('🆔 Identificação da Conta', {
             'fields': (
@@ -626,7 +553,7 @@ class ContaReceberCadastroAdmin(admin.ModelAdmin):
     def nome_cliente(self, obj):
         if obj.cliente:
             return obj.cliente.razao_social or obj.cliente.nome_fantasia
-        return f'Cód: {obj.codigo_cliente_fornecedor}' if obj.codigo_cliente_fornecedor else '-'
+        return f'Cód: {obj.cliente_id}' if obj.cliente_id else '-'
     
     @admin.display(description='Vendedor')
     def nome_vendedor(self, obj):
@@ -660,7 +587,7 @@ class ContaReceberCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para ContaReceberDistribuicao
 @admin.register(ContaReceberDistribuicao)
-class ContaReceberDistribuicaoAdmin(admin.ModelAdmin):
+class ContaReceberDistribuicaoAdmin(OmieModelAdmin):
     list_display = ['id', 'parent_id', 'item_index', 'ccoddep', 'cdesdep', 'nvaldep']
     list_filter = ['ccoddep']
     search_fields = ['cdesdep']
@@ -669,17 +596,17 @@ class ContaReceberDistribuicaoAdmin(admin.ModelAdmin):
 
 # Configuração para DocumentosXml
 @admin.register(DocumentosXml)
-class DocumentosXmlAdmin(admin.ModelAdmin):
+class DocumentosXmlAdmin(OmieModelAdmin):
     list_display = ['nidnf', 'nnumero', 'cserie', 'nvalor', 'demissao', 'cstatus']
     list_filter = ['cstatus', 'demissao', 'cserie']
     search_fields = ['nnumero', 'nchave']
     list_per_page = 20
-    ordering = ['-demissao']
+    ordering = [IsoDate('demissao').desc()]
 
 
 # Configuração para FamiliasCadastro
 @admin.register(FamiliasCadastro)
-class FamiliasCadastroAdmin(admin.ModelAdmin):
+class FamiliasCadastroAdmin(OmieModelAdmin):
     list_display = ['codigo', 'codfamilia_formatada', 'nomefamilia', 'codint', 'inativo']
     list_filter = ['inativo']
     search_fields = ['nomefamilia', 'codint']
@@ -723,7 +650,7 @@ class FamiliasCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para LocaisCadastro
 @admin.register(LocaisCadastro)
-class LocaisCadastroAdmin(admin.ModelAdmin):
+class LocaisCadastroAdmin(OmieModelAdmin):
     list_display = ['codigo_local_estoque', 'codigo', 'descricao', 'tipo_formatado', 'padrao', 'inativo']
     list_filter = [
         'tipo', 
@@ -784,12 +711,14 @@ class LocaisCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para MovimentosFinanceiros
 @admin.register(MovimentosFinanceiros)
-class MovimentosFinanceirosAdmin(admin.ModelAdmin):
+class MovimentosFinanceirosAdmin(OmieModelAdmin):
     list_display = ['id', 'detalhes_cnumtitulo', 'nome_cliente', 'nome_conta_corrente', 'nome_vendedor', 'nome_categoria', 'valor_formatado', 'detalhes_ddtvenc', 'detalhes_ddtpagamento', 'status_visual']
-    list_filter = ['detalhes_cstatus', 'detalhes_corigem', 'detalhes_cnatureza', 'detalhes_ccodcateg']
+    list_filter = ['detalhes_cstatus', 'detalhes_corigem', 'detalhes_cnatureza', ('detalhes_ccodcateg', CategoryListFilter)]
     search_fields = ['detalhes_cnumtitulo', 'cliente__razao_social', 'conta_corrente__descricao']
     list_per_page = 25
-    ordering = ['-detalhes_ddtvenc']
+    keyset_pagination = True
+    ordering = [IsoDate('detalhes_ddtvenc').desc()]
+    iso_date_hierarchy = 'detalhes_ddtvenc'
     readonly_fields = ['sync_created_at', 'sync_updated_at']
     autocomplete_fields = ['cliente', 'conta_corrente', 'vendedor', 'projeto']
     list_select_related = ['cliente', 'conta_corrente', 'vendedor', 'projeto']
@@ -886,16 +815,8 @@ class MovimentosFinanceirosAdmin(admin.ModelAdmin):
     @admin.display(description='Categoria')
     def nome_categoria(self, obj):
         if obj.detalhes_ccodcateg:
-            try:
-                # Tentar buscar por codigo_dre primeiro, depois por codigo
-                categoria = CategoriaCadastro.objects.filter(codigo_dre=obj.detalhes_ccodcateg).first()
-                if not categoria:
-                    categoria = CategoriaCadastro.objects.filter(codigo=obj.detalhes_ccodcateg).first()
-                if categoria:
-                    return categoria.descricao or obj.detalhes_ccodcateg
-            except Exception:
-                pass
-            return obj.detalhes_ccodcateg
+            # Busca por codigo_dre primeiro, depois por codigo, no mapa do snapshot
+            return category_description(obj.detalhes_ccodcateg, getattr(obj, 'company', None))
         return '-'
     
     @admin.display(description='Valor')
@@ -918,23 +839,53 @@ class MovimentosFinanceirosAdmin(admin.ModelAdmin):
 
 # Configuração para NfCadastro
 @admin.register(NfCadastro)
-class NfCadastroAdmin(admin.ModelAdmin):
+class NfCadastroAdmin(NfDetailMixin, ChildExportMixin, OmieModelAdmin):
     list_display = ['nidnf', 'ide_nnf', 'destinatario_nome', 'total_icmstot_vnf', 'ide_diemi']
     list_filter = [
-        ('ide_diemi', admin.DateFieldListFilter),
-        ('ide_demi', admin.DateFieldListFilter),
-        ('ide_dsaient', admin.DateFieldListFilter),
+        ('ide_diemi', IsoDateListFilter),
+        ('ide_demi', IsoDateListFilter),
+        ('ide_dsaient', IsoDateListFilter),
         'ide_mod', 
         'ide_tpnf',
-        ('ide_dcan', admin.DateFieldListFilter),
-        ('ide_dinut', admin.DateFieldListFilter),
+        ('ide_dcan', IsoDateListFilter),
+        ('ide_dinut', IsoDateListFilter),
         ('destinatario_cnpjcpf', admin.EmptyFieldListFilter)
     ]
     search_fields = ['ide_nnf', 'destinatario_nome', 'destinatario_cnpjcpf']
     list_per_page = 20
-    ordering = ['-ide_diemi']
+    keyset_pagination = True
+    ordering = [IsoDate('ide_diemi').desc()]
+    iso_date_hierarchy = 'ide_diemi'
     readonly_fields = ['sync_created_at', 'sync_updated_at']
     
+    # Seções do detalhe carregadas em lote (core/details.py)
+    detail_items_model = NfCadastroItens
+    detail_item_fields = {
+        'item_index': 'Item',
+        'prod_cprod': 'Código',
+        'prod_xprod': 'Produto',
+        'prod_ncm': 'NCM',
+        'prod_cfop': 'CFOP',
+        'prod_ucom': 'Unidade',
+        'prod_qcom': 'Quantidade',
+        'prod_vuncom': 'Valor unitário',
+        'prod_vdesc': 'Desconto',
+        'prod_vprod': 'Valor total',
+    }
+    detail_installment_fields = {
+        'nparcela': 'Parcela',
+        'cnumtitulo': 'Número',
+        'ddtemissao': 'Emissão',
+        'ddtvenc': 'Vencimento',
+        'nvalortitulo': 'Valor',
+        'cpagforma': 'Forma de pagamento',
+        'ccodcateg': 'Categoria',
+    }
+    
+    # Itens exportados junto com a nota (core/child_exports.py)
+    child_export_model = NfCadastroItens
+    child_export_fields = detail_item_fields
+    
     fieldsets = (
         ('🏷️ Identificação da NF-e', {
             'fields': (
@@ -989,7 +940,7 @@ class NfCadastroItensInline(admin.TabularInline):
 
 # Configuração para NfCadastroItens
 @admin.register(NfCadastroItens)
-class NfCadastroItensAdmin(admin.ModelAdmin):
+class NfCadastroItensAdmin(OmieModelAdmin):
     list_display = ['id', 'parent_id', 'item_index', 'prod_xprod', 'prod_vprod', 'prod_qcom']
     list_filter = ['prod_cfop', 'prod_ncm']
     search_fields = ['prod_xprod', 'prod_cprod']
@@ -999,21 +950,24 @@ class NfCadastroItensAdmin(admin.ModelAdmin):
 
 # Configuração para NfseEncontrada
 @admin.register(NfseEncontrada)
-class NfseEncontradaAdmin(admin.ModelAdmin):
+class NfseEncontradaAdmin(OmieModelAdmin):
     list_display = ['id', 'cabecalho_ncodnf', 'cabecalho_crazaodestinatario', 'cabecalho_nvalornfse', 'emissao_cdataemissao']
     list_filter = [
         'cabecalho_cstatusnfse', 
-        ('emissao_cdataemissao', admin.DateFieldListFilter),
+        ('emissao_cdataemissao', IsoDateListFilter),
         ('cabecalho_crazaodestinatario', admin.EmptyFieldListFilter)
     ]
     search_fields = ['cabecalho_crazaodestinatario', 'cabecalho_ncodnf']
     list_per_page = 20
+    keyset_pagination = True
+    ordering = [IsoDate('emissao_cdataemissao').desc()]
+    iso_date_hierarchy = 'emissao_cdataemissao'
     readonly_fields = ['sync_created_at', 'sync_updated_at']
 
 
 # Configuração para PedidoVendaItens
 @admin.register(PedidoVendaItens)
-class PedidoVendaItensAdmin(admin.ModelAdmin):
+class PedidoVendaItensAdmin(OmieModelAdmin):
     list_display = ['id', 'parent_id', 'produto_codigo_produto', 'produto_descricao', 'produto_quantidade', 'produto_valor_total']
     list_filter = ['produto_cfop', 'produto_reservado']
     search_fields = ['produto_descricao', 'produto_codigo']
@@ -1023,7 +977,7 @@ class PedidoVendaItensAdmin(admin.ModelAdmin):
 
 # Configuração para PedidoVendaProduto
 @admin.register(PedidoVendaProduto)
-class PedidoVendaProdutoAdmin(admin.ModelAdmin):
+class PedidoVendaProdutoAdmin(ChildExportMixin, OmieModelAdmin):
     list_display = ['cabecalho_codigo_pedido', 'cabecalho_numero_pedido', 'data_emissao', 'cliente_fantasia', 'cliente_razao_social', 'cliente_cnpj', 'valor_sem_frete', 'nome_projeto', 'nome_vendedor', 'status_pedido']
     list_filter = [
         'cabecalho_encerrado', 
@@ -1032,7 +986,7 @@ class PedidoVendaProdutoAdmin(admin.ModelAdmin):
         'cabecalho_bloqueado', 
         'infocadastro_faturado', 
         'infocadastro_cancelado',
-        ('cabecalho_data_previsao', admin.DateFieldListFilter)
+        ('cabecalho_data_previsao', IsoDateListFilter)
     ]
     search_fields = ['cabecalho_numero_pedido', 'cabecalho_codigo_pedido_integracao', 'cliente__razao_social', 'vendedor__nome']
     list_per_page = 25
@@ -1042,6 +996,21 @@ class PedidoVendaProdutoAdmin(admin.ModelAdmin):
     list_select_related = ['cliente', 'vendedor', 'projeto']
     actions = [export_to_excel]
     
+    # Itens exportados junto com o pedido (core/child_exports.py)
+    child_export_model = PedidoVendaItens
+    child_export_fields = {
+        'item_index': 'Item',
+        'produto_codigo': 'Código',
+        'produto_descricao': 'Produto',
+        'produto_ncm': 'NCM',
+        'produto_cfop': 'CFOP',
+        'produto_unidade': 'Unidade',
+        'produto_quantidade': 'Quantidade',
+        'produto_valor_unitario': 'Valor unitário',
+        'produto_valor_desconto': 'Desconto',
+        'produto_valor_total': 'Valor total',
+    }
+    
     @admin.display(description='Data Emissão')
     def data_emissao(self, obj):
         return obj.infocadastro_dinc or '-'
@@ -1112,11 +1081,12 @@ class PedidoVendaProdutoAdmin(admin.ModelAdmin):
 
 # Configuração para ProjetosCadastro
 @admin.register(ProjetosCadastro)
-class ProjetosCadastroAdmin(admin.ModelAdmin):
+class ProjetosCadastroAdmin(OmieModelAdmin):
     list_display = ['codigo', 'nome', 'codint', 'status_projeto']
     list_filter = ['inativo']
     search_fields = ['nome', 'codint']
     list_per_page = 25
+    autocomplete_index = True
     ordering = ['nome']
     readonly_fields = ['sync_created_at', 'sync_updated_at']
     
@@ -1146,7 +1116,7 @@ class ProjetosCadastroAdmin(admin.ModelAdmin):
 
 # Configuração para VendedoresCadastro
 @admin.register(VendedoresCadastro)
-class VendedoresCadastroAdmin(admin.ModelAdmin):
+class VendedoresCadastroAdmin(OmieModelAdmin):
     list_display = ['codigo', 'nome', 'email', 'comissao_formatada', 'status_vendedor']
     list_filter = [
         'inativo', 
@@ -1157,6 +1127,7 @@ class VendedoresCadastroAdmin(admin.ModelAdmin):
     ]
     search_fields = ['nome', 'email', 'codint']
     list_per_page = 25
+    autocomplete_index = True
     ordering = ['nome']
     readonly_fields = ['sync_created_at', 'sync_updated_at']
     
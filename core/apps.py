@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+
+    def ready(self):
+        from .backups import configure_backup_connection
+        from .registry import close_retired_connections, track_backup_connection
+        connection_created.connect(configure_backup_connection, dispatch_uid='core.backup_connection')
+        connection_created.connect(track_backup_connection, dispatch_uid='core.track_backup_connection')
+        request_finished.connect(close_retired_connections, dispatch_uid='core.close_retired_connections')
@@ -0,0 +1,215 @@
+"""
+Índice em memória para os campos de autocomplete do admin.
+
+Os ``autocomplete_fields`` dos lançamentos consultam clientes, vendedores
+e projetos com ``LIKE '%termo%'`` a cada tecla. Nos ModelAdmins com
+``autocomplete_index = True`` a busca do autocomplete usa um índice de
+prefixos guardado no cache local do processo por empresa/snapshot
+(core/cache.py): um backup novo troca o índice sozinho. A primeira busca
+dispara a montagem em segundo plano e, até o índice ficar pronto, vale a
+busca de sempre (FTS5 ou LIKE).
+
+Cada palavra dos search_fields vira um token sem acentos e em minúsculas;
+documentos (CNPJ/CPF, códigos) também entram só com os dígitos, então
+'12.345' e '12345' encontram '12.345.678/0001-90'. Todas as palavras do
+termo precisam ser prefixo de alguma palavra do registro. Os resultados
+saem na ordem do ``ordering`` do ModelAdmin, limitados a MAX_RESULTS.
+"""
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from array import array
+
+from django.db import connections
+
+from .cache import get_or_set, local_value
+from .search import search_columns
+
+logger = logging.getLogger(__name__)
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+# Registros devolvidos por busca (o select2 pagina de 20 em 20)
+MAX_RESULTS = 200
+# Acima de tantas ocorrências o prefixo é "denso": em vez de unir as listas
+# dos tokens, percorre os registros em ordem até juntar MAX_RESULTS
+DENSE_PREFIX = 5000
+# Dígitos mínimos para um valor entrar também como documento
+DOCUMENT_DIGITS = 5
+
+_DOCUMENT = re.compile(r'\d[\d.\-/]*\d')
+_NON_DIGIT = re.compile(r'\D')
+_DOCUMENT_TERM = re.compile(r'[\d.\-/\s]+')
+
+
+class _TokenTable(dict):
+    """
+    Tabela do str.translate que deixa só os tokens: letras sem acento e em
+    minúsculas, dígitos, e espaço no lugar do resto. Preenchida a cada
+    caractere novo.
+    """
+
+    def __missing__(self, code):
+        decomposed = unicodedata.normalize('NFKD', chr(code))
+        self[code] = folded = ''.join(
+            char.casefold() if char.isalnum() else ' '
+            for char in decomposed if not unicodedata.combining(char)
+        )
+        return folded
+
+
+_tokens_table = _TokenTable()
+
+
+def text_tokens(text):
+    """Tokens de um texto: palavras sem acentos e, para documentos, só os dígitos"""
+    tokens = set(text.translate(_tokens_table).split())
+    for document in _DOCUMENT.findall(text):
+        digits = _NON_DIGIT.sub('', document)
+        if len(digits) >= DOCUMENT_DIGITS:
+            tokens.add(digits)
+    return tokens
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Códigos gravados como REAL: 1234.0 -> '1234'
+        return str(int(value))
+    return str(value)
+
+
+def term_words(term):
+    """Palavras do termo buscado (um documento digitado vira só os dígitos)"""
+    if _DOCUMENT_TERM.fullmatch(term) and any(char.isdigit() for char in term):
+        return [_NON_DIGIT.sub('', term)]
+    return term.translate(_tokens_table).split()
+
+
+class AutocompleteIndex:
+    """
+    Índice de prefixos sobre os registros, na ordem do ``ordering``.
+
+    Os registros são numerados pela posição na ordenação. Os tokens ficam
+    ordenados, cada um com a lista crescente das posições que o contêm
+    (todas num único array, ``offsets`` marca onde começa cada token), e o
+    texto de cada registro (' token token ...') confere as demais palavras
+    do termo.
+    """
+
+    def __init__(self, rows):
+        self.pks = []
+        self.texts = []
+        # Posições de cada token em array('I'): arrays de inteiros não são
+        # acompanhados pelo coletor de ciclos, então a carga não cria milhões
+        # de listas e ints que ele percorreria a cada coleta
+        postings = {}
+        for position, row in enumerate(rows):
+            tokens = text_tokens(' '.join(map(_text, row[1:])))
+            self.pks.append(row[0])
+            self.texts.append(' ' + ' '.join(tokens))
+            for token in tokens:
+                found = postings.get(token)
+                if found is None:
+                    postings[token] = array('I', (position,))
+                else:
+                    found.append(position)
+        self.tokens = sorted(postings)
+        self.positions = array('I')
+        self.offsets = array('I', [0])
+        for token in self.tokens:
+            self.positions.extend(postings[token])
+            self.offsets.append(len(self.positions))
+
+    def __len__(self):
+        return len(self.pks)
+
+    def _range(self, word):
+        """(início, fim) das ocorrências dos tokens que começam pela palavra"""
+        low = bisect.bisect_left(self.tokens, word)
+        high = bisect.bisect_left(self.tokens, word + '\U0010ffff', low)
+        return self.offsets[low], self.offsets[high]
+
+    def _count(self, word):
+        """Ocorrências dos tokens que começam pela palavra (escolhe a mais seletiva)"""
+        start, end = self._range(word)
+        return end - start
+
+    def _candidates(self, word):
+        """Posições dos registros com algum token começando pela palavra, em ordem"""
+        start, end = self._range(word)
+        if end - start <= DENSE_PREFIX:
+            return sorted(set(self.positions[start:end]))
+        needle = ' ' + word
+        return (position for position, text in enumerate(self.texts) if needle in text)
+
+    def search(self, term, limit=MAX_RESULTS):
+        """pks dos registros que casam com o termo, na ordem do índice (None sem palavras)"""
+        words = term_words(term)
+        if not words:
+            return None
+        # Percorre a palavra mais seletiva e confere as outras no texto do registro
+        words.sort(key=self._count)
+        others = [' ' + word for word in words[1:]]
+        found = []
+        texts = self.texts
+        for position in self._candidates(words[0]):
+            text = texts[position]
+            if all(word in text for word in others):
+                found.append(self.pks[position])
+                if len(found) >= limit:
+                    break
+        return found
+
+
+def is_autocomplete(request):
+    """Indica se a requisição é do autocomplete do admin"""
+    match = getattr(request, 'resolver_match', None)
+    return match is not None and match.url_name == 'autocomplete'
+
+
+def _build_in_background(key_parts, alias, label, queryset):
+    """Monta o índice em uma thread e guarda no cache local do processo"""
+    with _pending_lock:
+        if (alias, *key_parts) in _pending:
+            return
+        _pending.add((alias, *key_parts))
+
+    def run():
+        try:
+            get_or_set(key_parts, lambda: AutocompleteIndex(queryset.iterator(chunk_size=5000)), alias=alias, local=True)
+        except Exception:
+            logger.exception('Falha ao montar o índice de autocomplete de %s', label)
+        finally:
+            with _pending_lock:
+                _pending.discard((alias, *key_parts))
+            connections.close_all()
+
+    threading.Thread(target=run, name='omie-autocomplete', daemon=True).start()
+
+
+def autocomplete_index(model_admin, request):
+    """
+    AutocompleteIndex do ModelAdmin no snapshot em uso, ou None enquanto é
+    montado em segundo plano (a primeira busca dispara a montagem).
+    """
+    columns = search_columns(model_admin.get_search_fields(request))
+    key_parts = ('autocomplete', model_admin.model._meta.label_lower, *columns)
+    index = local_value(key_parts)
+    if index is None:
+        queryset = model_admin.get_queryset(request)
+        ordering = [*(model_admin.get_ordering(request) or ()), 'pk']
+        # Fixa o alias: a thread não enxerga o contexto da requisição
+        queryset = queryset.using(queryset.db).order_by(*ordering).values_list('pk', *columns)
+        _build_in_background(key_parts, queryset.db, model_admin.model.__name__, queryset)
+    return index
+
+
+def autocomplete_search(model_admin, request, term):
+    """pks encontrados pelo índice para o termo (None quando o índice não se aplica ou não está pronto)"""
+    index = autocomplete_index(model_admin, request)
+    return index.search(term) if index is not None else None
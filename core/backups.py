@@ -0,0 +1,272 @@
+"""
+Perfil de conexão para os bancos de backup das empresas.
+
+Os backups são arquivos SQLite estáticos: são abertos em modo somente
+leitura (URI ``mode=ro`` e, por padrão, ``immutable=1``) e recebem PRAGMAs
+de cache/mmap no ``connection_created``. Escritas são rejeitadas pelo
+próprio SQLite (``query_only``).
+
+O modo consolidado usa uma única conexão com todos os backups anexados
+(ATTACH) e expõe cada tabela do app core como uma view TEMP ``UNION ALL``
+com a coluna ``company``. O SQLite limita os bancos anexados por conexão
+(10, no padrão de compilação): acima disso o consolidado não é montado.
+
+O índice de busca de cada snapshot (``<snapshot>.fts5``, ver core/search.py)
+é anexado como ``busca`` nas conexões de uma empresa.
+
+Este módulo é importado pelo settings, então não deve acessar
+``django.conf.settings`` em tempo de importação.
+"""
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+# PRAGMAs aplicados em toda conexão de backup: única definição dos valores
+# padrão (o settings parte deles em BACKUP_SQLITE_PRAGMAS)
+DEFAULT_BACKUP_PRAGMAS = {
+    'query_only': 'ON',
+    'mmap_size': 1024 * 1024 * 1024,  # 1 GB mapeado em memória
+    'cache_size': -262144,  # 256 MB (valor negativo = KiB)
+    'temp_store': 'MEMORY',
+}
+
+# Arquivo FTS5 ao lado do snapshot e schema em que é anexado
+SEARCH_INDEX_SUFFIX = '.fts5'
+SEARCH_SCHEMA = 'busca'
+
+
+def backup_uri(path, immutable=True):
+    """Monta a URI SQLite somente leitura para o arquivo de backup"""
+    uri = Path(path).resolve().as_uri() + '?mode=ro'
+    if immutable:
+        # immutable=1 dispensa locks e checagem de alterações do arquivo; por
+        # isso um snapshot em uso nunca é sobrescrito (ver install_backup)
+        uri += '&immutable=1'
+    return uri
+
+
+def backup_database(path, immutable=True):
+    """Retorna a entrada de DATABASES para um arquivo de backup"""
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': backup_uri(path, immutable),
+        'BACKUP_PATH': str(path),  # Caminho real, usado fora da conexão
+        'BACKUP_COMPANY': snapshot_company(path),
+    }
+
+
+def is_backup_connection(connection):
+    """Indica se a conexão usa o perfil de backup"""
+    return connection.vendor == 'sqlite' and 'BACKUP_PATH' in connection.settings_dict
+
+
+def backup_pragmas():
+    """PRAGMAs configurados para as conexões de backup"""
+    from django.conf import settings
+    return getattr(settings, 'BACKUP_SQLITE_PRAGMAS', DEFAULT_BACKUP_PRAGMAS)
+
+
+def configure_backup_connection(sender, connection, **kwargs):
+    """Handler do connection_created: anexa os bancos federados e aplica os PRAGMAs"""
+    if not is_backup_connection(connection):
+        return
+    pragmas = dict(backup_pragmas())
+    query_only = pragmas.pop('query_only', None)
+    for pragma, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {pragma} = {value}')
+    # As views TEMP vêm depois dos PRAGMAs (alterar temp_store apaga o schema
+    # temporário) e antes do query_only
+    federated = connection.settings_dict.get('ATTACH')
+    if federated:
+        create_federated_views(connection.connection, federated)
+    else:
+        attach_search_index(connection)
+    if query_only is not None:
+        connection.connection.execute(f'PRAGMA query_only = {query_only}')
+
+
+def search_index_path(path):
+    """Arquivo do índice de busca do snapshot: 'cdg.<versão>.db' -> 'cdg.<versão>.fts5'"""
+    return Path(path).with_suffix(SEARCH_INDEX_SUFFIX)
+
+
+def attach_search_index(connection):
+    """Anexa o índice de busca do snapshot, se existir (``connection.search_index``)"""
+    path = search_index_path(connection.settings_dict['BACKUP_PATH'])
+    connection.search_index = None
+    if path.is_file():
+        connection.connection.execute(f'ATTACH DATABASE ? AS "{SEARCH_SCHEMA}"', (backup_uri(path),))
+        connection.search_index = str(path)
+
+
+# Fator usado para qualificar ids e parent_id por empresa no modo
+# consolidado: o id 1234 da empresa de índice 3 vira 123403
+FEDERATED_ID_FACTOR = 100
+
+
+class TooManyBackups(ValueError):
+    """Mais backups do que o SQLite consegue anexar em uma conexão"""
+
+
+def attach_limit():
+    """Máximo de bancos anexados por conexão no SQLite em uso"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    finally:
+        conn.close()
+
+
+def federated_database(company, backups):
+    """
+    Entrada de DATABASES do modo consolidado.
+
+    ``backups`` é {empresa: caminho}; a ordem define o índice de cada
+    empresa nos ids qualificados. Empresas sem arquivo são ignoradas.
+    Levanta TooManyBackups se os backups não couberem em uma conexão (o
+    primeiro é o banco principal, os demais são anexados).
+    """
+    sources = [
+        (name, index, str(path))
+        for index, (name, path) in enumerate(backups.items())
+        if path and Path(path).exists()
+    ]
+    if not sources:
+        return None
+    limit = attach_limit()
+    if len(sources) - 1 > limit:
+        raise TooManyBackups(
+            f'O modo consolidado precisa anexar {len(sources) - 1} backups, acima do limite '
+            f'de {limit} bancos anexados do SQLite (SQLITE_MAX_ATTACHED).'
+        )
+    database = backup_database(sources[0][2])
+    database['BACKUP_COMPANY'] = company
+    database['ATTACH'] = sources
+    return database
+
+
+def federated_columns():
+    """
+    {tabela: colunas} qualificadas pela empresa: o id e, nas tabelas
+    filhas, o parent_id que aponta para ele. Os códigos do Omie, inclusive
+    as duas pontas das ForeignKeys, ficam como no backup (o JOIN compara a
+    coluna ``company``, ver core/consolidated.py) e continuam usando os
+    índices das tabelas.
+    """
+    from django.apps import apps
+
+    columns = {}
+    for model in apps.get_app_config('core').get_models():
+        if model._meta.managed:
+            continue
+        table = columns.setdefault(model._meta.db_table, {'id'})
+        if any(field.column == 'parent_id' for field in model._meta.concrete_fields):
+            table.add('parent_id')
+    return columns
+
+
+def create_federated_views(conn, sources):
+    """Anexa os backups e cria as views TEMP UNION ALL de cada tabela do core"""
+    from django.apps import apps
+
+    schemas = []
+    for position, (company, index, path) in enumerate(sources):
+        # O primeiro backup é o banco principal da conexão
+        schema = 'main' if position == 0 else f'empresa_{index}'
+        if position:
+            conn.execute(f'ATTACH DATABASE ? AS "{schema}"', (backup_uri(path),))
+        schemas.append((company, index, schema))
+
+    qualified = federated_columns()
+    for model in apps.get_app_config('core').get_models():
+        if model._meta.managed:
+            continue
+        table = model._meta.db_table
+        columns = [field.column for field in model._meta.concrete_fields]
+        arms = []
+        for company, index, schema in schemas:
+            available = {row[1] for row in conn.execute(f'PRAGMA "{schema}".table_info("{table}")')}
+            if not available:
+                continue
+            company_literal = company.replace("'", "''")
+            expressions = [f"'{company_literal}' AS company"]
+            for column in columns:
+                if column not in available:
+                    expressions.append(f'NULL AS "{column}"')
+                elif column in qualified.get(table, ()):
+                    expressions.append(f'"{column}" * {FEDERATED_ID_FACTOR} + {index} AS "{column}"')
+                else:
+                    expressions.append(f'"{column}"')
+            arms.append(f'SELECT {", ".join(expressions)} FROM "{schema}"."{table}"')
+        if arms:
+            conn.execute(f'CREATE TEMP VIEW "{table}" AS ' + ' UNION ALL '.join(arms))
+
+
+def snapshot_company(path):
+    """Empresa de um arquivo de snapshot: 'cdg.db' ou 'cdg.<versão>.db' -> 'cdg'"""
+    return Path(path).name.split('.', 1)[0]
+
+
+def new_snapshot_path(directory, company):
+    """Caminho livre para um novo snapshot da empresa: '<empresa>.<versão>.db'"""
+    directory = Path(directory)
+    version = datetime.now().strftime('%Y%m%dT%H%M%S')
+    path = directory / f'{company}.{version}.db'
+    counter = 1
+    # Nunca reutiliza o nome de um snapshot que pode estar aberto
+    while path.exists():
+        path = directory / f'{company}.{version}-{counter}.db'
+        counter += 1
+    return path
+
+
+def prune_snapshots(directory, company, keep):
+    """
+    Remove os snapshots mais antigos da empresa, mantendo ``keep``.
+    Retorna [(caminho, erro)]; erro é None quando o arquivo foi removido.
+    """
+    snapshots = sorted(
+        (path for path in Path(directory).glob(f'{company}*.db') if snapshot_company(path) == company),
+        key=lambda path: (path.stat().st_mtime_ns, path.name),
+        reverse=True,
+    )
+    removed = []
+    for path in snapshots[keep:]:
+        try:
+            path.unlink()
+            search_index_path(path).unlink(missing_ok=True)
+        except OSError as exc:
+            # Ainda aberto por algum worker (Windows): fica para a próxima
+            removed.append((path, exc))
+        else:
+            removed.append((path, None))
+    return removed
+
+
+def discover_backups(directory, companies=()):
+    """
+    Procura os snapshots .db em ``directory`` e retorna {empresa: caminho},
+    escolhendo o arquivo mais recente de cada empresa.
+
+    Empresas informadas em ``companies`` sem arquivo no diretório continuam
+    registradas com o caminho padrão ``<empresa>.db``.
+    """
+    directory = Path(directory)
+    found = {}
+    if directory.is_dir():
+        for path in directory.glob('*.db'):
+            try:
+                key = (path.stat().st_mtime_ns, path.name)
+            except OSError:
+                continue
+            company = snapshot_company(path)
+            if company not in found or key > found[company][0]:
+                found[company] = (key, path)
+    backups = {company: directory / f'{company}.db' for company in companies}
+    backups.update({company: path for company, (key, path) in found.items()})
+    return dict(sorted(backups.items()))
+
+
+def company_label(company):
+    """Nome amigável derivado do alias, para empresas sem nome cadastrado"""
+    return company.replace('_', ' ').title()
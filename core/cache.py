@@ -0,0 +1,142 @@
+"""
+Cache atrelado ao snapshot de backup de cada empresa.
+
+Os dados do core só mudam quando um backup novo é instalado, então as
+chaves incluem a empresa e uma impressão digital barata do arquivo
+(mtime, tamanho, schema cookie e contador de alterações do cabeçalho
+SQLite). Quando um snapshot novo entra, as chaves mudam sozinhas e as
+entradas antigas apenas expiram: não há invalidação manual.
+
+Há dois níveis:
+- o cache do Django (SNAPSHOT_CACHE), para resultados serializáveis que
+  podem ser compartilhados;
+- um cache local do processo (``local=True``), para objetos Python grandes
+  consultados muitas vezes por requisição (ex.: mapas de lookup).
+"""
+import functools
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .registry import backup_registry
+from .routers import get_current_database
+
+# Segundos em que a impressão digital de um alias é reaproveitada
+FINGERPRINT_TTL = 5
+
+# Quantidade de entradas mantidas no cache local do processo
+LOCAL_CACHE_SIZE = 256
+
+_fingerprints = {}  # alias -> (instante, impressão digital)
+_local_cache = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """(mtime, tamanho, schema cookie, contador de alterações) do arquivo SQLite"""
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as fh:
+            header = fh.read(100)
+    except OSError:
+        return None
+    change_counter, = struct.unpack('>I', header[24:28]) if len(header) >= 28 else (0,)
+    schema_cookie, = struct.unpack('>I', header[40:44]) if len(header) >= 44 else (0,)
+    return (stat.st_mtime_ns, stat.st_size, schema_cookie, change_counter)
+
+
+def snapshot_paths(alias):
+    """Arquivos que compõem o alias (inclui os anexados do modo consolidado)"""
+    database = connections.settings.get(alias, {})
+    paths = [database['BACKUP_PATH']] if database.get('BACKUP_PATH') else []
+    paths += [path for company, index, path in database.get('ATTACH', ()) if path not in paths]
+    return paths
+
+
+def snapshot_fingerprint(alias=None):
+    """Impressão digital curta do snapshot do alias (padrão: o do contexto)"""
+    alias = alias or get_current_database()
+    now = time.monotonic()
+    cached = _fingerprints.get(alias)
+    if cached and now - cached[0] < FINGERPRINT_TTL:
+        return cached[1]
+    parts = [file_fingerprint(path) for path in snapshot_paths(alias)]
+    fingerprint = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    _fingerprints[alias] = (now, fingerprint)
+    return fingerprint
+
+
+def snapshot_key(*parts, alias=None):
+    """Chave de cache com empresa e snapshot; as partes longas viram hash"""
+    alias = alias or get_current_database()
+    suffix = ':'.join(str(part) for part in parts)
+    if len(suffix) > 150 or any(char.isspace() for char in suffix):
+        suffix = hashlib.blake2b(suffix.encode(), digest_size=16).hexdigest()
+    return f'omie:{backup_registry.company_for(alias)}:{snapshot_fingerprint(alias)}:{suffix}'
+
+
+def snapshot_cache():
+    """Backend do Django usado para os resultados por snapshot"""
+    return caches[getattr(settings, 'SNAPSHOT_CACHE', 'default')]
+
+
+def get_or_set(key_parts, compute, timeout=None, alias=None, local=False):
+    """
+    Retorna o valor em cache para (empresa, snapshot, *key_parts) ou calcula
+    com ``compute()`` e guarda. ``local=True`` usa o cache do processo.
+    """
+    key = snapshot_key(*key_parts, alias=alias)
+    if local:
+        with _local_lock:
+            if key in _local_cache:
+                _local_cache.move_to_end(key)
+                return _local_cache[key]
+        value = compute()
+        with _local_lock:
+            _local_cache[key] = value
+            while len(_local_cache) > LOCAL_CACHE_SIZE:
+                _local_cache.popitem(last=False)
+        return value
+
+    cache = snapshot_cache()
+    sentinel = object()
+    value = cache.get(key, sentinel)
+    if value is sentinel:
+        value = compute()
+        if timeout is None:
+            timeout = getattr(settings, 'SNAPSHOT_CACHE_TIMEOUT', None)
+        cache.set(key, value, timeout)
+    return value
+
+
+def local_value(key_parts, alias=None, default=None):
+    """Valor do cache local do processo para (empresa, snapshot, *key_parts), sem calcular"""
+    key = snapshot_key(*key_parts, alias=alias)
+    with _local_lock:
+        return _local_cache.get(key, default)
+
+
+def snapshot_memoize(name=None, timeout=None, local=False):
+    """
+    Decorator que memoriza o resultado da função por empresa/snapshot.
+    Os argumentos entram na chave via repr(), então use valores simples.
+    """
+    def decorator(func):
+        prefix = name or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = repr((args, sorted(kwargs.items())))
+            return get_or_set(
+                (prefix, arguments), lambda: func(*args, **kwargs),
+                timeout=timeout, local=local,
+            )
+        return wrapper
+    return decorator
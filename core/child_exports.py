@@ -0,0 +1,92 @@
+"""
+Exportação para Excel dos registros com as linhas das tabelas filhas.
+
+Itens da NF-e e do pedido e a distribuição por departamento das contas
+só se ligam ao registro pai pelo ``parent_id`` (ordem em ``item_index``):
+exportar as notas com os itens exigia um PROCV entre duas planilhas.
+``<changelist>/export/itens/`` exporta a listagem (mesma query string,
+mesmas colunas do Excel) com uma linha por filho, as colunas do pai
+repetidas à esquerda das do filho; um pai sem filhos sai em uma linha só,
+com as colunas do filho vazias.
+
+Os pais são lidos em blocos pelo ColumnPlan do export (core/exports.py) e
+os filhos de cada bloco de PARENT_BATCH pais em uma única consulta
+``parent_id IN (...)`` (``child_rows``, core/details.py), sobre o índice
+(parent_id, item_index) do build_indexes. No modo consolidado o
+``parent_id`` já é qualificado pela empresa.
+"""
+import itertools
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest
+from django.urls import path
+
+from .details import PARENT_BATCH, child_rows
+from .exports import ColumnPlan, export_columns, plain_value, stream_xlsx, xlsx_response
+
+
+def parent_child_rows(modeladmin, request, queryset, field_names):
+    """
+    Linhas das colunas ``field_names`` dos registros seguidas das colunas
+    ``child_export_fields`` de cada filho (uma linha por filho).
+    """
+    child_fields = list(modeladmin.child_export_fields)
+    empty = [''] * len(child_fields)
+    plan = ColumnPlan(modeladmin, request, [modeladmin.model._meta.pk.attname, *field_names])
+    rows = plan.rows(queryset)
+    while True:
+        batch = list(itertools.islice(rows, PARENT_BATCH))
+        if not batch:
+            return
+        children = child_rows(modeladmin.child_export_model, [row[0] for row in batch], child_fields)
+        for parent_id, *values in batch:
+            items = children.get(parent_id)
+            if not items:
+                yield values + empty
+            for item in items or ():
+                yield values + [plain_value(item[name]) for name in child_fields]
+
+
+def child_export(modeladmin, request):
+    """Resposta do Excel com os registros do changelist da query string e os filhos, em streaming"""
+    queryset = modeladmin.get_changelist_instance(request).queryset
+    field_names, headers = export_columns(modeladmin, request)
+    headers = [*headers, *modeladmin.child_export_fields.values()]
+    title = str(modeladmin.model._meta.verbose_name_plural)
+    rows = parent_child_rows(modeladmin, request, queryset, field_names)
+    filename = f'{title} - {modeladmin.child_export_label}'
+    return xlsx_response(filename, stream_xlsx(title, headers, rows), queryset.db)
+
+
+class ChildExportMixin:
+    """
+    Mixin de ModelAdmin dos registros com tabela filha: a URL
+    ``export/itens/`` e o link na listagem (admin/core/change_list.html).
+    """
+    child_export_model = None
+    # {campo: rótulo} das colunas do filho exportadas
+    child_export_fields = {}
+    # Nome dos filhos no link e no nome do arquivo
+    child_export_label = 'itens'
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path(
+                'export/itens/',
+                self.admin_site.admin_view(self.export_children_view),
+                name='%s_%s_export_children' % info,
+            ),
+            *super().get_urls(),
+        ]
+
+    def export_children_view(self, request):
+        """Excel dos registros do changelist da query string com uma linha por filho"""
+        child_admin = self.admin_site._registry[self.child_export_model]
+        if not self.has_view_or_change_permission(request) or not child_admin.has_view_or_change_permission(request):
+            raise PermissionDenied
+        try:
+            return child_export(self, request)
+        except IncorrectLookupParameters as error:
+            return HttpResponseBadRequest(str(error))
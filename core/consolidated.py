@@ -0,0 +1,94 @@
+"""
+Suporte do admin ao modo consolidado (todas as empresas em uma consulta).
+
+No modo consolidado as tabelas do core são views UNION ALL com a coluna
+``company`` (ver core/backups.py). Só os ids e o ``parent_id``, que não têm
+significado fora do backup, são qualificados pela empresa (``id * 100 +
+índice``); os códigos do Omie aparecem como estão no backup. Como esses
+códigos se repetem entre empresas, as ForeignKeys (CompanyForeignKey)
+comparam também a coluna ``company`` no JOIN, e a listagem, os filtros e a
+exportação rodam em um único plano de consulta sem misturar empresas.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.db import models
+from django.db.models.expressions import RawSQL
+
+from .registry import consolidated_database, get_current_company
+
+
+def is_consolidated():
+    """Indica se o contexto atual está no modo consolidado"""
+    consolidated = consolidated_database()
+    return bool(consolidated) and get_current_company() == consolidated
+
+
+class CompanyJoin:
+    """Condição extra do JOIN: as duas tabelas da mesma empresa"""
+
+    def __init__(self, alias, related_alias):
+        self.alias = alias
+        self.related_alias = related_alias
+
+    def as_sql(self, compiler, connection):
+        qn = compiler.quote_name_unless_alias
+        return f'{qn(self.alias)}."company" = {qn(self.related_alias)}."company"', []
+
+
+class CompanyForeignKey(models.ForeignKey):
+    """
+    ForeignKey pelos códigos do Omie: no modo consolidado o JOIN compara
+    também a empresa das duas pontas.
+    """
+
+    def get_extra_restriction(self, alias, related_alias):
+        # alias None: subconsulta do exclude(), que não compara a empresa
+        if alias is None or not is_consolidated():
+            return None
+        return CompanyJoin(alias, related_alias)
+
+
+class CompanyListFilter(admin.SimpleListFilter):
+    """Filtro por empresa no modo consolidado"""
+    title = 'Empresa'
+    parameter_name = 'empresa'
+
+    def lookups(self, request, model_admin):
+        return list(settings.DATABASE_NAMES.items())
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(company=self.value())
+        return queryset
+
+
+class ConsolidatedAdminMixin:
+    """
+    Mixin de ModelAdmin: no modo consolidado anota a coluna ``company``,
+    exibe a coluna Empresa e adiciona o filtro por empresa.
+    """
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if is_consolidated():
+            queryset = queryset.annotate(
+                company=RawSQL(f'"{self.model._meta.db_table}"."company"', ())
+            )
+        return queryset
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if is_consolidated():
+            return ['empresa', *list_display]
+        return list_display
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if is_consolidated():
+            return [CompanyListFilter, *list_filter]
+        return list_filter
+
+    @admin.display(description='Empresa', ordering='company')
+    def empresa(self, obj):
+        company = getattr(obj, 'company', None)
+        return settings.DATABASE_NAMES.get(company, company or '-')
@@ -0,0 +1,259 @@
+"""
+Datas em texto do Omie ('dd/mm/aaaa') tratadas como datas ISO.
+
+Nos backups as datas são colunas TEXT no formato do Omie: ordenar por
+``data_vencimento`` ordena pelo dia, e os filtros de data comparam textos.
+``IsoDate`` converte a coluna para 'aaaa-mm-dd' no SQL; o build_indexes
+cria índices sobre exatamente a mesma expressão (core/indexes.py), então
+ordenação, filtros por período e a hierarquia de datas viram buscas por
+intervalo no índice e ordenam na ordem do calendário.
+
+Nos ModelAdmins:
+- ``ordering = [IsoDate('data_vencimento').desc()]``;
+- ``('data_vencimento', IsoDateListFilter)`` no list_filter;
+- ``iso_date_hierarchy = 'data_vencimento'`` no lugar do date_hierarchy
+  (que exige DateField).
+"""
+import datetime
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import build_q_object_from_lookup_parameters
+from django.db import models
+from django.db.models.functions import Substr
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from .cache import get_or_set
+
+# 'dd/mm/aaaa' -> 'aaaa-mm-dd'; valores já em ISO (ou com hora) ficam nos 10
+# primeiros caracteres. O mesmo texto é usado nos índices de expressão
+ISO_DATE_TEMPLATE = (
+    "CASE WHEN substr({column}, 3, 1) = '/' "
+    "THEN substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2) "
+    "ELSE substr({column}, 1, 10) END"
+)
+
+
+def iso_date_sql(column):
+    """Expressão SQL da data ISO de uma coluna (já citada)"""
+    return ISO_DATE_TEMPLATE.format(column=column)
+
+
+def iso_date(value):
+    """Equivalente em Python da expressão SQL"""
+    if value is None:
+        return None
+    value = str(value)
+    if value[2:3] == '/':
+        return f'{value[6:10]}-{value[3:5]}-{value[0:2]}'
+    return value[:10]
+
+
+class IsoDate(models.Func):
+    """Data de uma coluna de texto do Omie como 'aaaa-mm-dd'"""
+    output_field = models.CharField()
+    arity = 1
+
+    def as_sql(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        return f'({iso_date_sql(column)})', tuple(params) * ISO_DATE_TEMPLATE.count('{column}')
+
+
+def iso_date_field(expression):
+    """Nome do campo de um ``IsoDate('campo')`` (ou do seu asc()/desc())"""
+    if isinstance(expression, models.OrderBy):
+        expression = expression.expression
+    if isinstance(expression, IsoDate):
+        source = expression.source_expressions[0]
+        if isinstance(source, models.F):
+            return source.name
+    return None
+
+
+class IsoDateListFilter(admin.DateFieldListFilter):
+    """DateFieldListFilter para datas em texto: compara a data ISO da coluna"""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.iso_alias = f'{field_path}_iso'
+
+    def iso_lookup(self, parameter):
+        """Parâmetro da URL -> lookup equivalente sobre a data ISO"""
+        if parameter == self.lookup_kwarg_since:
+            return f'{self.iso_alias}__gte'
+        if parameter == self.lookup_kwarg_until:
+            return f'{self.iso_alias}__lt'
+        return parameter
+
+    def queryset(self, request, queryset):
+        parameters = {self.iso_lookup(key): value for key, value in self.used_parameters.items()}
+        try:
+            queryset = queryset.alias(**{self.iso_alias: IsoDate(self.field_path)})
+            return queryset.filter(build_q_object_from_lookup_parameters(parameters))
+        except (ValueError, TypeError) as error:
+            raise IncorrectLookupParameters(error)
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        iso = IsoDate(self.field_path)
+        lookups = {self.lookup_kwarg_since: GreaterThanOrEqual, self.lookup_kwarg_until: LessThan}
+        counts = {}
+        for index, (title, param_dict) in enumerate(self.links):
+            conditions = [
+                lookups[key](iso, str(value)) if key in lookups else models.Q(**{key: value})
+                for key, value in param_dict.items()
+            ]
+            counts[f'{index}__c'] = models.Count(pk_attname, filter=models.Q(*conditions))
+        return counts
+
+
+def iso_date_fields(model_admin):
+    """Campos tratados como datas ISO pelo ModelAdmin (filtros, ordering, hierarquia)"""
+    fields = set()
+    for spec in model_admin.list_filter:
+        if isinstance(spec, (list, tuple)) and issubclass(spec[1], IsoDateListFilter):
+            fields.add(spec[0])
+    fields.update(filter(None, map(iso_date_field, model_admin.ordering or ())))
+    if getattr(model_admin, 'iso_date_hierarchy', None):
+        fields.add(model_admin.iso_date_hierarchy)
+    return fields
+
+
+def _parse(value, minimum, maximum):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise IncorrectLookupParameters(f'Data inválida: {value!r}')
+    if not minimum <= number <= maximum:
+        raise IncorrectLookupParameters(f'Data inválida: {value!r}')
+    return number
+
+
+class IsoDateHierarchy:
+    """
+    date_hierarchy (ano > mês > dia) sobre uma data em texto, com os mesmos
+    parâmetros da URL do Django (``campo__year``, ``__month``, ``__day``).
+    Anos, meses e dias disponíveis ficam no cache do snapshot por consulta.
+    """
+
+    def __init__(self, field_name, params):
+        self.field_name = field_name
+        self.year_field = f'{field_name}__year'
+        self.month_field = f'{field_name}__month'
+        self.day_field = f'{field_name}__day'
+        self.year = self.month = self.day = None
+        if params.get(self.year_field):
+            self.year = _parse(params[self.year_field], 1, 9999)
+            if params.get(self.month_field):
+                self.month = _parse(params[self.month_field], 1, 12)
+                if params.get(self.day_field):
+                    self.day = _parse(params[self.day_field], 1, 31)
+        try:
+            self.since, self.until = self.period()
+        except ValueError as error:
+            raise IncorrectLookupParameters(error)
+
+    def parameters(self):
+        return [self.year_field, self.month_field, self.day_field]
+
+    def period(self):
+        """(início, fim exclusivo) da seleção, como datas (None sem seleção)"""
+        if self.day:
+            since = datetime.date(self.year, self.month, self.day)
+            return since, since + datetime.timedelta(days=1)
+        if self.month:
+            since = datetime.date(self.year, self.month, 1)
+            return since, (since + datetime.timedelta(days=32)).replace(day=1)
+        if self.year:
+            return datetime.date(self.year, 1, 1), datetime.date(self.year + 1, 1, 1)
+        return None, None
+
+    def queryset(self, queryset):
+        if self.since is None:
+            return queryset
+        iso = f'{self.field_name}_iso'
+        return queryset.alias(**{iso: IsoDate(self.field_name)}).filter(**{
+            f'{iso}__gte': self.since.isoformat(), f'{iso}__lt': self.until.isoformat(),
+        })
+
+    def dates(self, queryset, length):
+        """Datas distintas (início do ano/mês/dia) da consulta, pelo cache do snapshot"""
+        parts = queryset.order_by().annotate(
+            iso_part=Substr(IsoDate(self.field_name), 1, length)
+        ).values_list('iso_part', flat=True).distinct()
+        sql, params = parts.query.sql_with_params()
+
+        def compute():
+            found = set()
+            for part in parts:
+                try:
+                    found.add(datetime.date.fromisoformat((part or '') + '-01-01'[length - 4:]))
+                except ValueError:
+                    # Texto que não é data
+                    continue
+            return sorted(found)
+
+        return get_or_set(('hierarquia', self.field_name, length, sql, repr(params)), compute)
+
+    def context(self, changelist):
+        """Contexto do template admin/date_hierarchy.html"""
+        def link(filters):
+            return changelist.get_query_string(filters, [f'{self.field_name}__'])
+
+        queryset = changelist.queryset
+        year, month = self.year, self.month
+        if not year:
+            # Como o Django: começa pelo ano (ou mês) quando só há um
+            years = self.dates(queryset, 4)
+            if len(years) == 1:
+                year = years[0].year
+                months = self.dates(queryset, 7)
+                if len(months) == 1:
+                    month = months[0].month
+
+        if self.day:
+            day = datetime.date(self.year, self.month, self.day)
+            return {
+                'show': True,
+                'back': {
+                    'link': link({self.year_field: self.year, self.month_field: self.month}),
+                    'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+                },
+                'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+            }
+        if year and month:
+            days = self.dates(queryset, 10)
+            return {
+                'show': True,
+                'back': {'link': link({self.year_field: year}), 'title': str(year)},
+                'choices': [
+                    {
+                        'link': link({self.year_field: year, self.month_field: month, self.day_field: day.day}),
+                        'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT')),
+                    }
+                    for day in days if (day.year, day.month) == (year, month)
+                ],
+            }
+        if year:
+            months = self.dates(queryset, 7)
+            return {
+                'show': True,
+                'back': {'link': link({}), 'title': _('All dates')},
+                'choices': [
+                    {
+                        'link': link({self.year_field: year, self.month_field: month.month}),
+                        'title': capfirst(formats.date_format(month, 'YEAR_MONTH_FORMAT')),
+                    }
+                    for month in months if month.year == year
+                ],
+            }
+        return {
+            'show': True,
+            'back': None,
+            'choices': [
+                {'link': link({self.year_field: year.year}), 'title': str(year.year)}
+                for year in self.dates(queryset, 4)
+            ],
+        }
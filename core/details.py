@@ -0,0 +1,157 @@
+"""
+Detalhe da NF-e com itens, parcelas e XML em lotes.
+
+A nota (nf_cadastro) não tem ForeignKey para as partes: os itens apontam
+para ela pelo ``parent_id`` e o XML pelo ``nidnf``. O detalhe do admin
+busca cada parte uma única vez, qualquer que seja o tamanho da nota:
+
+- a própria nota (o get_object do admin);
+- todos os itens do parent_id, já na ordem de ``item_index`` (índice
+  (parent_id, item_index) do build_indexes), só com as colunas exibidas;
+- os documentos XML do nidnf, sem o texto do XML (só o tamanho).
+
+As parcelas (``titulos_N_*``) são colunas da própria nota e não custam
+consulta. O XML, que passa de centenas de KB, só é lido quando a seção é
+aberta na página (``xml_view``).
+"""
+import re
+
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Length
+from django.http import Http404, HttpResponse
+from django.urls import path
+from django.utils.decorators import method_decorator
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+
+from .consolidated import is_consolidated
+from .filters import display_value
+from .models import DocumentosXml
+
+# Parents por consulta em child_rows (limite de parâmetros do SQLite)
+PARENT_BATCH = 500
+
+_INSTALLMENT = re.compile(r'^(?P<prefix>[a-z]+)_(?P<index>\d+)_(?P<name>\w+)$')
+
+
+def child_rows(model, parent_ids, fields):
+    """
+    {parent_id: [linhas]} da tabela filha para os pais, em lotes de
+    ``parent_id IN (...)``; cada linha é um dict só com ``fields``, na ordem
+    de item_index.
+    """
+    parent_ids = sorted({parent_id for parent_id in parent_ids if parent_id is not None})
+    rows = {parent_id: [] for parent_id in parent_ids}
+    for start in range(0, len(parent_ids), PARENT_BATCH):
+        batch = parent_ids[start:start + PARENT_BATCH]
+        queryset = model._default_manager.filter(parent_id__in=batch).order_by('parent_id', 'item_index')
+        for row in queryset.values('parent_id', *fields):
+            rows[row['parent_id']].append(row)
+    return rows
+
+
+def installments(obj, fields, prefix='titulos'):
+    """
+    Parcelas gravadas nas colunas ``<prefix>_<n>_<campo>`` da nota, como
+    dicts com ``fields``; vai até ``<prefix>_count`` quando informado e
+    ignora as posições vazias.
+    """
+    indexes = sorted({
+        int(match['index'])
+        for match in map(_INSTALLMENT.match, (field.attname for field in obj._meta.concrete_fields))
+        if match and match['prefix'] == prefix
+    })
+    count = getattr(obj, f'{prefix}_count', None)
+    if count is not None:
+        indexes = [index for index in indexes if index < count]
+    found = []
+    for index in indexes:
+        row = {name: getattr(obj, f'{prefix}_{index}_{name}', None) for name in fields}
+        if any(value not in (None, '') for value in row.values()):
+            found.append(row)
+    return found
+
+
+def xml_queryset(obj):
+    """Documentos XML da nota (mesmo nidnf e, no consolidado, mesma empresa)"""
+    queryset = DocumentosXml._default_manager.filter(nidnf=obj.nidnf)
+    if is_consolidated():
+        # O nidnf não é qualificado pela empresa nas views consolidadas
+        queryset = queryset.annotate(
+            company=RawSQL('"documentos_xml"."company"', ())
+        ).filter(company=getattr(obj, 'company', None))
+    return queryset
+
+
+def xml_documents(obj):
+    """Documentos XML da nota sem o texto do XML, com o tamanho em ``xml_size``"""
+    if obj.nidnf is None:
+        return []
+    queryset = xml_queryset(obj).annotate(xml_size=Length('cxml')).order_by('pk')
+    return list(queryset.values('pk', 'nnumero', 'cserie', 'demissao', 'hemissao', 'cstatus', 'nvalor', 'xml_size'))
+
+
+def cells(row, fields):
+    """Valores da linha para exibição, na ordem de ``fields``"""
+    return ['-' if row[name] in (None, '') else display_value(row[name]) for name in fields]
+
+
+class NfDetailMixin:
+    """
+    Mixin de ModelAdmin da NF-e: seções de itens, parcelas e XML no detalhe
+    (template admin/core/nfcadastro/change_form.html) e a URL
+    ``<id>/xml/<documento>/`` que devolve o texto de um XML.
+    """
+    detail_items_model = None
+    # {campo: rótulo} das colunas exibidas
+    detail_item_fields = {}
+    detail_installment_fields = {}
+
+    def detail_indexes(self):
+        """[(model, colunas, motivo)] dos índices usados pelas seções (build_indexes)"""
+        return [
+            (self.detail_items_model, ['parent_id', 'item_index'], 'detalhe: itens'),
+            (DocumentosXml, ['nidnf'], 'detalhe: XML'),
+        ]
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path(
+                '<path:object_id>/xml/<int:xml_id>/',
+                self.admin_site.admin_view(self.xml_view),
+                name='%s_%s_xml' % info,
+            ),
+            *super().get_urls(),
+        ]
+
+    def render_change_form(self, request, context, add=False, change=False, form_url='', obj=None):
+        if obj is not None:
+            context['nf_detail'] = self.nf_detail(obj)
+        return super().render_change_form(request, context, add, change, form_url, obj)
+
+    def nf_detail(self, obj):
+        """Contexto das seções de itens, parcelas e XML (linhas como listas de células)"""
+        items = child_rows(self.detail_items_model, [obj.pk], self.detail_item_fields).get(obj.pk, [])
+        titles = installments(obj, self.detail_installment_fields)
+        return {
+            'item_columns': self.detail_item_fields.values(),
+            'items': [cells(row, self.detail_item_fields) for row in items],
+            'installment_columns': self.detail_installment_fields.values(),
+            'installments': [cells(row, self.detail_installment_fields) for row in titles],
+            'xml_documents': xml_documents(obj),
+        }
+
+    @method_decorator(xframe_options_sameorigin)
+    def xml_view(self, request, object_id, xml_id):
+        """Texto do XML de um documento da nota, carregado sob demanda pela página"""
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None:
+            raise Http404
+        if not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+        document = xml_queryset(obj).filter(pk=xml_id).values_list('cxml', flat=True).first()
+        if document is None:
+            raise Http404
+        return HttpResponse(document, content_type='text/plain; charset=utf-8')
@@ -0,0 +1,608 @@
+"""
+Exportações em streaming: Excel, CSV e NDJSON.
+
+O ``export_to_excel`` montava um Workbook inteiro na memória, célula por
+célula, e só no fim gravava na resposta: 500 mil movimentos custavam
+gigabytes e prendiam o worker até o último byte. Aqui o XML da aba é
+escrito direto em uma entrada do zip, que vai para o cliente à medida que
+é gerado:
+
+- os registros vêm do banco em blocos (``iterator(chunk_size=...)``);
+- as larguras das colunas saem das primeiras WIDTH_SAMPLE linhas (como
+  antes), as únicas que ficam na memória;
+- cada bloco de linhas escrito vira um pedaço da StreamingHttpResponse.
+
+A memória fica constante qualquer que seja o número de linhas. O começo e
+o fim da aba (colunas, margens) e as demais partes do arquivo (estilos,
+workbook, content types) são gerados pelo openpyxl, por partes internas
+dele (``WorksheetWriter``); o XML das células é escrito à mão aqui, no
+formato que o openpyxl grava, sem um objeto por célula.
+
+As linhas vêm de um ColumnPlan: cada coluna é resolvida uma única vez em
+um acessor direto, e o queryset lê só as colunas do banco que esses
+acessores usam (``values_list`` quando todas são campos; Records leves
+com os campos lidos pelos métodos do admin, quando não). Nas tabelas de
+150 colunas isso evita montar models inteiros para exportar meia dúzia.
+
+CSV e NDJSON saem direto do changelist (``<changelist>/export/csv/``
+com a query string da listagem): os mesmos filtros, busca, hierarquia de
+datas e ordenação, sem seleção por checkbox e sem lista de ids. Só as
+colunas exportadas são lidas (``values_list``), em blocos.
+"""
+import csv
+import io
+import itertools
+import json
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.safestring import SafeData
+# Além da API pública, o streaming usa partes internas do openpyxl
+# (openpyxl.worksheet._writer.WorksheetWriter, sheet._writer, ws._rels,
+# ws._drawing e sheet._id): o código vale para a versão fixada em
+# requirements.txt (openpyxl==3.1.5) e precisa ser revisto a cada
+# atualização (core/tests/test_exports.py compara com o próprio openpyxl)
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.writer.excel import ExcelWriter
+
+from .consolidated import is_consolidated
+from .filters import display_value
+from .pagination import SnapshotChangeList
+from .routers import using_database
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Formatos do export do changelist: (content type, extensão)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+# Parâmetro da URL com as colunas exportadas (padrão: as do list_display)
+FIELDS_VAR = 'campos'
+
+# Registros lidos do banco por vez
+CHUNK_SIZE = 2000
+# Linhas usadas para calcular a largura das colunas
+WIDTH_SAMPLE = 500
+# Linhas escritas entre dois pedaços enviados ao cliente
+FLUSH_ROWS = 1000
+
+# Textos (sem HTML) dos valores SafeData já vistos: os badges de status são constantes
+STRIPPED_CACHE_SIZE = 1024
+
+_TAG = re.compile('<[^<]+?>')
+_XML_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+_PLAIN_TYPES = (str, int, float, bool)
+_stripped = {}
+
+
+def header_style():
+    """(fonte, preenchimento, alinhamento) do cabeçalho das planilhas"""
+    return (
+        Font(bold=True, color='FFFFFF'),
+        PatternFill(start_color='366092', end_color='366092', fill_type='solid'),
+        Alignment(horizontal='center', vertical='center'),
+    )
+
+
+def export_columns(modeladmin, request):
+    """(campos, cabeçalhos) exportados: o list_display ou todos os campos do model"""
+    model = modeladmin.model
+    list_display = modeladmin.get_list_display(request)
+    if not list_display:
+        return [f.name for f in model._meta.fields], [f.verbose_name.title() for f in model._meta.fields]
+    field_names = []
+    headers = []
+    for field in list_display:
+        if field == '__str__':
+            continue
+        if hasattr(model, field):
+            field_names.append(field)
+            try:
+                headers.append(model._meta.get_field(field).verbose_name.title())
+            except Exception:
+                headers.append(field.replace('_', ' ').title())
+        elif hasattr(modeladmin, field):
+            field_names.append(field)
+            method = getattr(modeladmin, field)
+            if hasattr(method, 'short_description'):
+                headers.append(method.short_description)
+            else:
+                headers.append(field.replace('_', ' ').title())
+    return field_names, headers
+
+
+def plain_value(value):
+    """Valor da célula: texto, número ou booleano (datas como texto, None vazio)"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, _PLAIN_TYPES):
+        return value
+    return str(value)
+
+
+def text_value(value):
+    """Valor de um método do admin: HTML (SafeData) vira texto, o resto como plain_value"""
+    if not isinstance(value, SafeData):
+        return plain_value(value)
+    text = _stripped.get(value)
+    if text is None:
+        text = _TAG.sub('', str(value))
+        if len(_stripped) < STRIPPED_CACHE_SIZE:
+            _stripped[value] = text
+    return text
+
+
+class Record:
+    """
+    Registro leve no lugar do model: só os atributos que as colunas leem
+    (campos, attnames das ForeignKeys, ``pk``, anotações e as relações
+    como outros Records, ou None).
+    """
+
+
+def _record(attributes):
+    record = Record.__new__(Record)
+    record.__dict__ = attributes
+    return record
+
+
+class ColumnPlan:
+    """
+    Colunas exportadas resolvidas uma única vez: um acessor por coluna e os
+    caminhos ('campo', 'fk__campo') que ele lê no banco.
+
+    Campos do model viram ``attrgetter``; métodos do ModelAdmin são
+    chamados direto e só o que é HTML (SafeData) passa pela remoção de
+    tags; atributos do model são lidos (e chamados, se forem métodos) como
+    no admin. Conforme o que as colunas leem, as linhas saem de:
+
+    - ``values_list``, quando todas as colunas são campos;
+    - Records montados de um ``values_list`` com os campos lidos pelos
+      métodos (``display_fields`` do OmieModelAdmin), sem instanciar models;
+    - models com ``only()`` e o select_related só das relações usadas,
+      quando uma ForeignKey é exportada inteira (o str do objeto);
+    - models com todas as colunas, como antes, se algum método não puder
+      ser analisado.
+    """
+
+    def __init__(self, modeladmin, request, field_names):
+        self.modeladmin = modeladmin
+        self.request = request
+        self.field_names = list(field_names)
+        self.getters = []
+        self.attnames = []
+        self.paths = set()
+        # Relações exportadas como coluna (str do objeto): lidas inteiras
+        self.full_relations = set()
+        for name in self.field_names:
+            getter, attname, paths = self.compile(name)
+            self.getters.append(getter)
+            self.attnames.append(attname)
+            if self.paths is not None:
+                self.paths = self.paths | paths if paths is not None else None
+
+    def compile(self, name):
+        """(acessor, attname para o values_list ou None, caminhos lidos ou None) da coluna"""
+        model = self.modeladmin.model
+        field = getattr(getattr(model, name, None), 'field', None)
+        if field is not None and name in (field.name, field.attname):
+            if field.is_relation:
+                self.full_relations.add(field.name)
+                return lambda obj: plain_value(getattr(obj, name)), None, {field.name}
+            read = attrgetter(field.attname)
+            return lambda obj: plain_value(read(obj)), field.attname, {field.name}
+        if hasattr(self.modeladmin, name):
+            method = getattr(self.modeladmin, name)
+            display_fields = getattr(self.modeladmin, 'display_fields', None)
+            paths = display_fields(name) if display_fields is not None else None
+            return lambda obj: text_value(method(obj)), None, paths
+
+        def attribute(obj):
+            value = getattr(obj, name)
+            return text_value(value() if callable(value) else value)
+        return attribute, None, None
+
+    def select_related(self):
+        """Relações do select_related do admin que as colunas usam (True: todas)"""
+        related = self.modeladmin.get_list_select_related(self.request)
+        if related is True or self.paths is None:
+            return related
+        return [
+            relation for relation in related or ()
+            if any(path == relation or path.startswith(relation + '__') for path in self.paths)
+        ]
+
+    def only(self):
+        """Campos do ``only()`` (None: todas as colunas)"""
+        if self.paths is None:
+            return None
+        return sorted(
+            path for path in self.paths
+            if not any(path.startswith(relation + '__') for relation in self.full_relations)
+        )
+
+    def queryset(self, queryset):
+        """Queryset com o select_related e a projeção das colunas"""
+        related = self.select_related()
+        if related is True:
+            return queryset.select_related()
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        only = self.only()
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+    def record_layout(self, queryset):
+        """
+        (colunas do values_list, [(relação, atributo)], relações) para montar
+        Records; a relação é a tupla de nomes desde o model (() é o próprio
+        registro).
+        """
+        model = self.modeladmin.model
+        keys = ['pk']
+        slots = [((), 'pk')]
+        relations = []
+        for name in queryset.query.annotation_select:
+            keys.append(name)
+            slots.append(((), name))
+        for path in sorted(self.paths):
+            current = model
+            parts = path.split('__')
+            for depth, name in enumerate(parts):
+                field = current._meta.get_field(name)
+                holder = tuple(parts[:depth])
+                if depth == len(parts) - 1:
+                    keys.append(path)
+                    slots.append((holder, field.attname))
+                if field.is_relation:
+                    relation = tuple(parts[:depth + 1])
+                    if relation not in relations:
+                        relations.append(relation)
+                        keys.append('__'.join(relation) + '__pk')
+                        slots.append((relation, 'pk'))
+                    current = field.related_model
+        return keys, slots, relations
+
+    def records(self, queryset):
+        """Records com os valores lidos pelas colunas, sem instanciar models"""
+        keys, slots, relations = self.record_layout(queryset)
+        # Relações mais profundas primeiro: uma relação vazia vira None no registro pai
+        nested = sorted(relations, key=len, reverse=True)
+        pk_names = {(): self.modeladmin.model._meta.pk.attname}
+        for relation in relations:
+            model = self.modeladmin.model
+            for name in relation:
+                model = model._meta.get_field(name).related_model
+            pk_names[relation] = model._meta.pk.attname
+        for values in queryset.values_list(*keys).iterator(chunk_size=CHUNK_SIZE):
+            found = {relation: {} for relation in pk_names}
+            for (holder, attribute), value in zip(slots, values):
+                found[holder][attribute] = value
+            for relation, attributes in found.items():
+                attributes[pk_names[relation]] = attributes['pk']
+            for relation in nested:
+                attributes = found[relation]
+                found[relation[:-1]][relation[-1]] = None if attributes['pk'] is None else _record(attributes)
+            yield _record(found[()])
+
+    def objects(self, queryset):
+        """Objetos lidos pelas colunas: Records quando possível, senão models"""
+        if self.paths is not None and not self.full_relations:
+            return self.records(queryset)
+        return self.queryset(queryset).iterator(chunk_size=CHUNK_SIZE)
+
+    def rows(self, queryset):
+        """Linhas (listas de valores) dos registros, lidas do banco em blocos"""
+        if self.field_names and None not in self.attnames:
+            for values in queryset.values_list(*self.attnames).iterator(chunk_size=CHUNK_SIZE):
+                yield [plain_value(value) for value in values]
+            return
+        getters = self.getters
+        for obj in self.objects(queryset):
+            row = []
+            for getter in getters:
+                try:
+                    row.append(getter(obj))
+                except Exception:
+                    row.append('')
+            yield row
+
+
+def export_rows(modeladmin, request, queryset, field_names):
+    """Linhas (listas de valores) das colunas ``field_names`` dos registros"""
+    return ColumnPlan(modeladmin, request, field_names).rows(queryset)
+
+
+def column_widths(headers, rows):
+    """Larguras das colunas pelo cabeçalho e pelas linhas de amostra (máx. 50)"""
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)[:50]))
+    return [min(width + 2, 50) for width in widths]
+
+
+class _Chunks:
+    """Destino do zip: guarda os bytes escritos até o gerador repassá-los"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+class _StreamedSheetsWriter(ExcelWriter):
+    """ExcelWriter que não copia as abas: o XML delas já foi escrito no zip"""
+
+    def write_worksheet(self, ws):
+        ws._drawing = SpreadsheetDrawing()
+        ws._rels = ws._writer._rels
+        self.manifest.append(ws)
+
+
+def cell_xml(attributes, value):
+    """
+    XML de uma célula no formato que o openpyxl grava. ``attributes`` traz
+    a referência e o estilo (' r="B2" s="1"'); sem referência a célula
+    vazia é gravada, para as seguintes não mudarem de coluna.
+    """
+    if value is None or value == '' or (isinstance(value, float) and not math.isfinite(value)):
+        return '' if attributes else '<c/>'
+    if value is True or value is False:
+        return f'<c{attributes} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c{attributes} t="n"><v>{value:.16g}</v></c>'
+    text = ILLEGAL_CHARACTERS_RE.sub('', str(value)).translate(_XML_ESCAPES)
+    return f'<c{attributes} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def row_xml(index, letters, values, style=''):
+    """
+    XML de uma linha da aba (``letters``: as letras das colunas). Com
+    ``index`` None a linha sai sem referências (r é opcional no formato) e
+    pode ser concatenada em qualquer posição da aba.
+    """
+    if index is None:
+        return f'<row>{"".join([cell_xml(style, value) for value in values])}</row>'
+    cells = ''.join([cell_xml(f' r="{letter}{index}"{style}', value) for letter, value in zip(letters, values)])
+    return f'<row r="{index}">{cells}</row>'
+
+
+def xml_rows(letters, rows, start=2):
+    """Bytes do XML das linhas (a partir da linha ``start``; None: sem referências), FLUSH_ROWS por bloco"""
+    numbers = itertools.count(start) if start is not None else itertools.repeat(None)
+    lines = []
+    for index, row in zip(numbers, rows):
+        lines.append(row_xml(index, letters, row))
+        if len(lines) == FLUSH_ROWS:
+            yield ''.join(lines).encode()
+            lines.clear()
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def sheet_xml(sheet):
+    """(começo, fim) do XML da aba gerado pelo openpyxl, sem as linhas"""
+    buffer = io.BytesIO()
+    sheet._writer = WorksheetWriter(sheet, out=buffer)
+    sheet._writer.write_top()
+    xf = sheet._writer.xf.send(True)
+    with xf.element('sheetData'):
+        pass
+    sheet._writer.xf.send(None)
+    sheet._writer.write_tail()
+    sheet._writer.close()
+    content = buffer.getvalue()
+    for empty in (b'<sheetData></sheetData>', b'<sheetData />', b'<sheetData/>'):
+        if empty in content:
+            top, tail = content.split(empty)
+            return top + b'<sheetData>', b'</sheetData>' + tail
+    raise ValueError('XML da aba sem sheetData')
+
+
+def stream_sheets(sheets):
+    """
+    Bytes do arquivo .xlsx, gerados à medida que as abas são consumidas;
+    ``sheets`` produz (título, cabeçalhos, larguras, blocos) de cada aba,
+    em ordem, com os blocos de bytes do XML das linhas de dados.
+    """
+    sink = _Chunks()
+    archive = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+    workbook = Workbook(write_only=True)
+    header = None
+    for number, (title, headers, widths, blocks) in enumerate(sheets, 1):
+        sheet = workbook.create_sheet(title[:31])
+        sheet._id = number
+        if header is None:
+            # Estilo do cabeçalho registrado no workbook (o openpyxl grava styles.xml no final)
+            cell = WriteOnlyCell(sheet)
+            cell.font, cell.fill, cell.alignment = header_style()
+            header = f' s="{cell.style_id}"'
+        for index, width in enumerate(widths, 1):
+            sheet.column_dimensions[get_column_letter(index)].width = width
+        top, tail = sheet_xml(sheet)
+        letters = [get_column_letter(index) for index in range(1, len(headers) + 1)]
+
+        entry = archive.open(sheet.path[1:], 'w', force_zip64=True)
+        entry.write(top)
+        entry.write(row_xml(1, letters, headers, header).encode())
+        for block in blocks:
+            entry.write(block)
+            data = sink.drain()
+            if data:
+                yield data
+        entry.write(tail)
+        entry.close()
+    _StreamedSheetsWriter(workbook, archive).save()
+    yield sink.drain()
+
+
+def stream_workbook(sheets):
+    """Bytes do arquivo .xlsx; ``sheets`` produz (título, cabeçalhos, linhas) de cada aba"""
+    return stream_sheets(
+        (title, headers, *sheet_rows(headers, rows)) for title, headers, rows in sheets
+    )
+
+
+def sheet_rows(headers, rows):
+    """(larguras, blocos de XML) das linhas de uma aba; as larguras saem das primeiras WIDTH_SAMPLE"""
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, WIDTH_SAMPLE))
+    letters = [get_column_letter(index) for index in range(1, len(headers) + 1)]
+    return column_widths(headers, sample), xml_rows(letters, itertools.chain(sample, rows))
+
+
+def stream_xlsx(title, headers, rows):
+    """Bytes do arquivo .xlsx com uma aba, gerados à medida que ``rows`` é consumido"""
+    return stream_workbook([(title, headers, rows)])
+
+
+def pinned(alias, chunks):
+    """
+    Itera ``chunks`` com o banco ``alias`` no contexto: o corpo da resposta é
+    gerado depois que a view retornou e o middleware restaurou o banco.
+    """
+    chunks = iter(chunks)
+    while True:
+        with using_database(alias):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def xlsx_response(filename, chunks, alias):
+    """StreamingHttpResponse de download do .xlsx"""
+    response = StreamingHttpResponse(pinned(alias, chunks), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+    return response
+
+
+def excel_export(modeladmin, request, queryset):
+    """Resposta da exportação dos registros do queryset para Excel, em streaming"""
+    model = queryset.model
+    model_name = str(model._meta.verbose_name_plural or model._meta.model_name)
+    field_names, headers = export_columns(modeladmin, request)
+    rows = export_rows(modeladmin, request, queryset, field_names)
+    return xlsx_response(model_name, stream_xlsx(model_name, headers, rows), queryset.db)
+
+
+def is_export(request):
+    """Indica se a requisição é de um export do changelist"""
+    match = getattr(request, 'resolver_match', None)
+    return match is not None and (match.url_name or '').endswith(('_export', '_export_children'))
+
+
+class ExportChangeList(SnapshotChangeList):
+    """ChangeList usado só para montar o queryset do export: não conta nem pagina"""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(FIELDS_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        self.result_count = self.full_result_count = None
+        self.result_list = []
+        self.multi_page = self.can_show_all = self.show_all = False
+
+
+def data_columns(modeladmin, request):
+    """
+    [(nome, attname)] exportados em CSV/NDJSON: as colunas do parâmetro
+    ``campos`` ou os campos do list_display (ForeignKeys pelo código); na
+    falta deles, todos os campos. No consolidado, a empresa vem primeiro.
+    """
+    model = modeladmin.model
+    requested = request.GET.get(FIELDS_VAR)
+    names = requested.split(',') if requested else modeladmin.get_list_display(request)
+    columns = []
+    for name in names:
+        try:
+            field = model._meta.get_field(name.strip())
+        except FieldDoesNotExist:
+            if requested:
+                raise ValueError(f'Campo desconhecido: {name}')
+            continue
+        if field.concrete:
+            columns.append((field.column, field.attname))
+        elif requested:
+            raise ValueError(f'Campo sem coluna: {name}')
+    if not columns:
+        columns = [(field.column, field.attname) for field in model._meta.concrete_fields]
+    if is_consolidated():
+        columns.insert(0, ('empresa', 'company'))
+    return columns
+
+
+def csv_chunks(names, rows):
+    """Bytes do CSV (UTF-8), um pedaço a cada FLUSH_ROWS linhas"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(['' if value is None else display_value(value) for value in row])
+        if count % FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(names, rows):
+    """Bytes do NDJSON (um objeto JSON por linha), um pedaço a cada FLUSH_ROWS linhas"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder, ensure_ascii=False))
+        if len(lines) == FLUSH_ROWS:
+            lines.append('')
+            yield '\n'.join(lines).encode()
+            lines.clear()
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines).encode()
+
+
+def changelist_export(modeladmin, request, format):
+    """StreamingHttpResponse com os registros do changelist da query string"""
+    content_type, extension = FORMATS[format]
+    changelist = modeladmin.get_changelist_instance(request)
+    columns = data_columns(modeladmin, request)
+    names = [name for name, attname in columns]
+    queryset = changelist.queryset.values_list(*(attname for name, attname in columns))
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    chunks = csv_chunks(names, rows) if format == 'csv' else ndjson_chunks(names, rows)
+    response = StreamingHttpResponse(pinned(queryset.db, chunks), content_type=content_type)
+    filename = modeladmin.model._meta.model_name
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
@@ -0,0 +1,136 @@
+"""
+Filtros do admin com as opções calculadas uma vez por snapshot.
+
+Os filtros padrão do Django rodam um ``SELECT DISTINCT`` na tabela inteira
+(ou leem o cadastro relacionado inteiro) a cada listagem. Aqui os valores
+usados e a quantidade de registros de cada um saem de um único
+``GROUP BY`` guardado no cache com a chave da empresa e do snapshot
+(core/cache.py); um backup novo recalcula sozinho.
+
+Códigos de categoria e vendedores aparecem com o nome, resolvidos pelos
+lookups em memória (core/lookups.py) ou por uma única consulta guardada
+junto com as opções.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.options import IS_FACETS_VAR, ShowFacets
+from django.db import models
+from django.utils.translation import gettext as _
+
+from .cache import get_or_set
+from .consolidated import is_consolidated
+from .lookups import category_lookup
+
+
+def value_counts(model_admin, request, field_path):
+    """[(valor, quantidade)] da coluna no snapshot atual, em ordem de valor"""
+    def compute():
+        queryset = model_admin.get_queryset(request).order_by(field_path)
+        return list(queryset.values_list(field_path).annotate(total=models.Count('pk')))
+
+    return get_or_set(('filtro', model_admin.model._meta.label_lower, field_path), compute)
+
+
+def facets_requested(request, model_admin):
+    """Indica se o changelist vai mostrar as contagens do próprio Django (facets)"""
+    return model_admin.show_facets is ShowFacets.ALWAYS or (
+        model_admin.show_facets is ShowFacets.ALLOW and IS_FACETS_VAR in request.GET
+    )
+
+
+def display_value(value):
+    """Valor para exibição: códigos gravados como REAL sem o '.0'"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class CachedValuesListFilter(admin.AllValuesFieldListFilter):
+    """Filtro por valor da coluna com as opções e contagens do cache do snapshot"""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        counts = value_counts(model_admin, request, field_path)
+        self.lookup_choices = [value for value, total in counts]
+        self.counts = dict(counts)
+
+    def label(self, value):
+        """Texto da opção (sobrescreva para trocar códigos por nomes)"""
+        return display_value(value)
+
+    def choices(self, changelist):
+        # Com facets, as contagens do Django (filtradas); sem, as do snapshot
+        facet_counts = self.get_facet_queryset(changelist) if changelist.add_facets else None
+        yield {
+            'selected': self.lookup_val is None and self.lookup_val_isnull is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            'display': _('All'),
+        }
+        empty_display = None
+        for index, value in enumerate(self.lookup_choices):
+            count = facet_counts[f'{index}__c'] if facet_counts is not None else self.counts[value]
+            if value is None:
+                empty_display = f'{self.empty_value_display} ({count})'
+                continue
+            yield {
+                'selected': self.lookup_val is not None and str(value) in self.lookup_val,
+                'query_string': changelist.get_query_string({self.lookup_kwarg: str(value)}, [self.lookup_kwarg_isnull]),
+                'display': f'{self.label(value)} ({count})',
+            }
+        if empty_display:
+            yield {
+                'selected': bool(self.lookup_val_isnull),
+                'query_string': changelist.get_query_string({self.lookup_kwarg_isnull: 'True'}, [self.lookup_kwarg]),
+                'display': empty_display,
+            }
+
+
+class CategoryListFilter(CachedValuesListFilter):
+    """Filtro por código de categoria exibindo a descrição da categoria"""
+
+    def label(self, value):
+        lookup = category_lookup()
+        # No modo consolidado as categorias são indexadas por empresa
+        companies = list(settings.DATABASE_NAMES) if is_consolidated() else [None]
+        for company in companies:
+            found, description = lookup.find(value, company)
+            if found and description:
+                return f'{display_value(value)} - {description}'
+        return display_value(value)
+
+
+class CachedRelatedListFilter(admin.RelatedFieldListFilter):
+    """
+    Filtro por ForeignKey com apenas os registros relacionados em uso,
+    com nome e contagem, calculados uma vez por snapshot.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        show_counts = not facets_requested(request, model_admin)
+        target = field.target_field.attname
+
+        def compute():
+            counts = value_counts(model_admin, request, field.attname)
+            values = [value for value, total in counts if value is not None]
+            related = field.related_model._default_manager.filter(**{f'{target}__in': values})
+            names = {getattr(obj, target): str(obj) for obj in related}
+            return sorted(
+                ((value, names.get(value, display_value(value)), total) for value, total in counts if value is not None),
+                key=lambda choice: choice[1].lower(),
+            )
+
+        choices = get_or_set(('filtro', model_admin.model._meta.label_lower, field.name, 'nomes'), compute)
+        return [(value, f'{name} ({total})' if show_counts else name) for value, name, total in choices]
+
+
+def cached_list_filter(model, item):
+    """Troca o filtro padrão de um item do list_filter pela versão em cache, quando houver"""
+    if not isinstance(item, str) or '__' in item:
+        return item
+    field = model._meta.get_field(item)
+    if field.many_to_one:
+        return (item, CachedRelatedListFilter)
+    if field.choices or isinstance(field, (models.BooleanField, models.DateField)):
+        # Opções fixas: o filtro padrão não consulta o banco
+        return item
+    return (item, CachedValuesListFilter)
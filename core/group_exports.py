@@ -0,0 +1,231 @@
+"""
+Exportação para Excel de todas as empresas de uma vez.
+
+O mesmo relatório (contas em aberto, movimentos do mês...) para todas as
+empresas exigia trocar a empresa no seletor e exportar uma vez por
+empresa. ``<changelist>/export/empresas/`` aplica a query string da
+listagem ao backup de cada empresa em paralelo, em um pool de processos
+(GROUP_EXPORT_WORKERS, com a prioridade baixa EXPORT_NICE das demais
+exportações): cada processo lê as linhas da sua empresa com o
+ColumnPlan do export (core/exports.py) e grava o XML delas em arquivos
+temporários, já pronto para a aba da empresa e para a consolidada (essa
+sem as referências de linha, que são opcionais no formato, para as partes
+de cada empresa poderem ser só concatenadas).
+
+A planilha tem uma aba por empresa, na ordem do seletor, e a aba
+Consolidado com as linhas de todas e a coluna Empresa. O processo web só
+junta e compacta os arquivos, então o tempo total fica perto do da
+empresa mais lenta, não da soma: a aba de uma empresa começa a ser
+enviada assim que ela termina, enquanto as seguintes ainda são lidas.
+No modo consolidado o filtro por empresa limita as empresas exportadas;
+os ids saem como no backup de cada empresa.
+"""
+import itertools
+import logging
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db import connections
+from django.http import StreamingHttpResponse
+from openpyxl.utils import get_column_letter
+
+from . import workers
+from .consolidated import CompanyListFilter, is_consolidated
+from .exports import (
+    FLUSH_ROWS, WIDTH_SAMPLE, XLSX_CONTENT_TYPE, column_widths, export_columns, export_rows, row_xml,
+    stream_sheets,
+)
+from .jobs import export_request, submit_to
+from .registry import backup_registry
+from .routers import using_database
+
+logger = logging.getLogger(__name__)
+
+CONSOLIDATED_TITLE = 'Consolidado'
+# Erro das empresas lidas depois que a resposta foi fechada
+CANCELLED = 'Exportação cancelada'
+# Bytes lidos por vez dos arquivos temporários
+READ_SIZE = 1024 * 1024
+
+_SHEET_TITLE = re.compile(r'[\\/*?:\[\]]')
+
+
+def group_companies(request):
+    """Empresas com backup, na ordem do seletor (só a do filtro por empresa, se houver)"""
+    companies = []
+    for company in settings.DATABASE_NAMES:
+        path = backup_registry.path_for(company) if backup_registry.is_registered(company) else None
+        if path is not None and path.is_file():
+            companies.append(company)
+    chosen = request.GET.get(CompanyListFilter.parameter_name)
+    return [company for company in companies if company == chosen] if chosen else companies
+
+
+def company_query(request):
+    """
+    Query string aplicada a cada empresa: sem o filtro por empresa e, no
+    modo consolidado, com a ordenação sem a coluna Empresa (que desloca os
+    índices do ``o``).
+    """
+    query = request.GET.copy()
+    query.pop(CompanyListFilter.parameter_name, None)
+    if is_consolidated() and query.get(ORDER_VAR):
+        ordering = []
+        for part in query[ORDER_VAR].split('.'):
+            index = part.lstrip('-')
+            if index.isdigit() and int(index) > 0:
+                ordering.append(f'{part[:len(part) - len(index)]}{int(index) - 1}')
+        query[ORDER_VAR] = '.'.join(ordering)
+    return query.urlencode()
+
+
+def part_paths(directory, company):
+    """(XML das linhas da aba da empresa, XML das linhas dela na aba consolidada)"""
+    return Path(directory) / f'{company}.xml', Path(directory) / f'{company}.consolidado.xml'
+
+
+def company_part(company, model_label, user_pk, query_string, directory):
+    """
+    (Processo do pool) Lê as linhas da empresa e grava o XML delas nos
+    arquivos de part_paths. Devolve (cabeçalhos, larguras, erro).
+    """
+    from django.apps import apps
+    from django.contrib.auth import get_user_model
+
+    if not Path(directory).is_dir():
+        # A resposta já foi fechada e os temporários apagados
+        return None, None, CANCELLED
+    try:
+        backup_registry.refresh()
+        modeladmin = admin.site._registry[apps.get_model(model_label)]
+        user = get_user_model()._default_manager.get(pk=user_pk)
+        label = settings.DATABASE_NAMES.get(company, company)
+        with using_database(backup_registry.alias_for(company)):
+            request = export_request(modeladmin, user, query_string, 'xlsx')
+            queryset = modeladmin.get_changelist_instance(request).queryset
+            field_names, headers = export_columns(modeladmin, request)
+            rows = iter(export_rows(modeladmin, request, queryset, field_names))
+            sample = list(itertools.islice(rows, WIDTH_SAMPLE))
+            letters = [get_column_letter(index) for index in range(1, len(headers) + 1)]
+            own_path, group_path = part_paths(directory, company)
+            with open(own_path, 'wb') as own, open(group_path, 'wb') as group:
+                own_lines, group_lines = [], []
+                for index, row in enumerate(itertools.chain(sample, rows), 2):
+                    own_lines.append(row_xml(index, letters, row))
+                    group_lines.append(row_xml(None, None, [label, *row]))
+                    if len(own_lines) == FLUSH_ROWS:
+                        own.write(''.join(own_lines).encode())
+                        group.write(''.join(group_lines).encode())
+                        own_lines.clear()
+                        group_lines.clear()
+                own.write(''.join(own_lines).encode())
+                group.write(''.join(group_lines).encode())
+        return [str(header) for header in headers], column_widths(headers, sample), None
+    except Exception as error:
+        if not Path(directory).is_dir():
+            return None, None, CANCELLED
+        logger.exception('Falha ao exportar %s de %s', model_label, company)
+        return None, None, str(error) or error.__class__.__name__
+    finally:
+        connections.close_all()
+
+
+def file_blocks(path):
+    """Conteúdo do arquivo em blocos de READ_SIZE"""
+    with open(path, 'rb') as fh:
+        while block := fh.read(READ_SIZE):
+            yield block
+
+
+def sheet_titles(companies):
+    """{empresa: título da aba} (nome do seletor sem os caracteres proibidos, sem repetir)"""
+    titles = {}
+    used = {CONSOLIDATED_TITLE.lower()}
+    for company in companies:
+        base = _SHEET_TITLE.sub('', str(settings.DATABASE_NAMES.get(company, company)))[:31] or company[:31]
+        title = base
+        for number in itertools.count(2):
+            if title.lower() not in used:
+                break
+            title = f'{base[:28]} {number}'
+        used.add(title.lower())
+        titles[company] = title
+    return titles
+
+
+def group_sheets(companies, futures, directory):
+    """Abas (título, cabeçalhos, larguras, blocos): uma por empresa, na ordem, e a consolidada no final"""
+    titles = sheet_titles(companies)
+    exported = []
+    columns = None
+    widths = []
+    for company, future in zip(companies, futures):
+        headers, company_widths, error = future.result()
+        if error is not None:
+            error_row = row_xml(2, ['A'], [error]).encode()
+            yield titles[company], ['Erro'], [min(len(error) + 2, 50)], [error_row]
+            continue
+        columns = columns or headers
+        widths = [max(pair) for pair in itertools.zip_longest(widths, company_widths, fillvalue=0)]
+        exported.append(company)
+        yield titles[company], headers, company_widths, file_blocks(part_paths(directory, company)[0])
+    if columns is not None:
+        labels = [str(settings.DATABASE_NAMES.get(company, company)) for company in exported]
+        yield (
+            CONSOLIDATED_TITLE,
+            ['Empresa', *columns],
+            [*column_widths(['Empresa'], [[label] for label in labels]), *widths],
+            itertools.chain.from_iterable(file_blocks(part_paths(directory, company)[1]) for company in exported),
+        )
+
+
+class _CleanedChunks:
+    """
+    Pedaços da planilha para a StreamingHttpResponse. A resposta chama
+    ``close()`` ao terminar, inclusive quando o envio nem começou (cliente
+    desconectado antes do primeiro byte): cancela as empresas que ainda
+    estão na fila e apaga os temporários.
+    """
+
+    def __init__(self, chunks, futures, directory):
+        self.chunks = chunks
+        self.futures = futures
+        self.directory = directory
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        try:
+            # Fecha antes os arquivos temporários que estiverem sendo lidos
+            self.chunks.close()
+        finally:
+            for future in self.futures:
+                future.cancel()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def group_export(modeladmin, request):
+    """StreamingHttpResponse da planilha com uma aba por empresa e a consolidada"""
+    companies = group_companies(request)
+    query = company_query(request)
+    directory = tempfile.mkdtemp(prefix='omie-empresas-')
+    max_workers = getattr(settings, 'GROUP_EXPORT_WORKERS', 4)
+    futures = [
+        submit_to(
+            'empresas', max_workers, workers.company_part,
+            company, modeladmin.model._meta.label_lower, request.user.pk, query, directory,
+            nice=getattr(settings, 'EXPORT_NICE', 10),
+        )
+        for company in companies
+    ]
+    chunks = stream_sheets(group_sheets(companies, futures, directory))
+    response = StreamingHttpResponse(_CleanedChunks(chunks, futures, directory), content_type=XLSX_CONTENT_TYPE)
+    filename = f'{modeladmin.model._meta.verbose_name_plural} - empresas'
+    response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+    return response
@@ -0,0 +1,212 @@
+"""
+Índices para as colunas que o admin consulta nos backups.
+
+Os backups chegam sem índices. O plano é derivado do próprio código:
+- ForeignKeys: a coluna local (db_column) e o código de destino (to_field);
+- tabelas filhas: (parent_id, item_index);
+- list_filter (seguido das colunas do ordering) e ordering dos ModelAdmins;
+- search_fields com prefixo '^' ou '=' (``icontains`` não usa índice);
+- as buscas das seções do detalhe (``detail_indexes``, core/details.py);
+- datas em texto ordenadas ou filtradas como ISO (core/dates.py): índice
+  sobre a expressão ``IsoDate``, anotado no plano como 'iso:<coluna>'.
+
+Os índices só podem ser criados com o arquivo aberto para escrita, então
+nunca são aplicados em um snapshot em uso (ver o comando build_indexes).
+"""
+import re
+import sqlite3
+
+from django.contrib import admin
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.core.exceptions import FieldDoesNotExist
+
+from .dates import IsoDate, iso_date_field, iso_date_fields, iso_date_sql
+
+_PLACEHOLDER = re.compile(r'(?<!%)%s')
+ISO_PREFIX = 'iso:'
+
+
+def index_name(table, columns):
+    """Nome determinístico do índice (idempotente entre execuções)"""
+    return f'ix_{table}_{"_".join(column.replace(":", "_") for column in columns)}'[:120]
+
+
+def column_sql(column):
+    """Coluna (ou expressão 'iso:<coluna>') para o CREATE INDEX"""
+    if column.startswith(ISO_PREFIX):
+        return iso_date_sql(f'"{column[len(ISO_PREFIX):]}"')
+    return f'"{column}"'
+
+
+def iso_column(model, name):
+    """Entrada do plano para a data ISO de um campo"""
+    column = field_column(model, name)
+    return f'{ISO_PREFIX}{column}' if column else None
+
+
+def field_column(model, path):
+    """Coluna local usada por um caminho de lookup (FK para caminhos relacionados)"""
+    try:
+        fields = get_fields_from_path(model, path)
+    except (FieldDoesNotExist, NotRelationField):
+        return None
+    field = fields[0]
+    return getattr(field, 'column', None)
+
+
+def ordering_column(model, item):
+    """Coluna de um item do ordering (nome, '-nome' ou ``IsoDate``)"""
+    if isinstance(item, str):
+        return field_column(model, item.lstrip('-'))
+    name = iso_date_field(item)
+    return iso_column(model, name) if name else None
+
+
+def add_index(plan, model, columns, reason):
+    """Acrescenta o índice ao plano da tabela, sem duplicatas"""
+    columns = tuple(columns)
+    if not columns or None in columns or columns == (model._meta.pk.column,):
+        return
+    indexes = plan.setdefault(model._meta.db_table, {})
+    indexes.setdefault(columns, set()).add(reason)
+
+
+def index_plan(site=None):
+    """{tabela: {(colunas...): {motivos}}} para os models do core"""
+    from django.apps import apps
+
+    site = site or admin.site
+    plan = {}
+    for model in apps.get_app_config('core').get_models():
+        if model._meta.managed:
+            continue
+        field_names = {field.name for field in model._meta.concrete_fields}
+        for field in model._meta.concrete_fields:
+            if field.is_relation:
+                add_index(plan, model, [field.column], f'fk {field.name}')
+                target = field.target_field
+                add_index(plan, field.related_model, [target.column], f'to_field de {model.__name__}.{field.name}')
+        if {'parent_id', 'item_index'} <= field_names:
+            add_index(plan, model, ['parent_id', 'item_index'], 'tabela filha')
+
+        modeladmin = site._registry.get(model)
+        if modeladmin is None:
+            continue
+        ordering = [ordering_column(model, item) for item in modeladmin.ordering or ()]
+        if ordering:
+            add_index(plan, model, ordering, 'ordering')
+        iso_fields = iso_date_fields(modeladmin)
+        for name in sorted(iso_fields):
+            # Filtro por período e hierarquia: intervalo na data ISO
+            add_index(plan, model, [iso_column(model, name)], f'data ISO {name}')
+        for spec in modeladmin.list_filter:
+            if isinstance(spec, (list, tuple)):
+                spec = spec[0]
+            if isinstance(spec, str) and spec not in iso_fields:
+                # Filtro + ordering: a página filtrada sai do índice já ordenada
+                column = field_column(model, spec)
+                add_index(plan, model, [column, *(col for col in ordering if col != column)], f'list_filter {spec}')
+        for name in modeladmin.search_fields:
+            if name[:1] in '^=':
+                add_index(plan, model, [field_column(model, name[1:])], f'search_fields {name}')
+        if hasattr(modeladmin, 'detail_indexes'):
+            for related, columns, reason in modeladmin.detail_indexes():
+                add_index(plan, related, columns, reason)
+
+    # Índices de uma coluna cobertos por um composto que começa por ela
+    for indexes in plan.values():
+        composites = [columns for columns in indexes if len(columns) > 1]
+        for columns in [columns for columns in indexes if len(columns) == 1]:
+            covering = next((other for other in composites if other[0] == columns[0]), None)
+            if covering:
+                indexes[covering] |= indexes.pop(columns)
+    return plan
+
+
+def table_columns(conn, table):
+    """Colunas existentes da tabela (vazio se a tabela não existe)"""
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def apply_index_plan(conn, plan):
+    """Cria os índices que faltam e roda ANALYZE; retorna [(tabela, colunas)] criados"""
+    created = []
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    for table, indexes in plan.items():
+        columns_available = table_columns(conn, table)
+        for columns in indexes:
+            name = index_name(table, columns)
+            plain = {column.removeprefix(ISO_PREFIX) for column in columns}
+            if name in existing or not plain <= columns_available:
+                continue
+            column_list = ', '.join(map(column_sql, columns))
+            conn.execute(f'CREATE INDEX "{name}" ON "{table}" ({column_list})')
+            created.append((table, columns))
+    conn.execute('ANALYZE')
+    conn.commit()
+    return created
+
+
+def sample_queries(site=None):
+    """
+    [(rótulo, sql, params)] representativos do admin: primeira página do
+    changelist (ordering + list_select_related), cada list_filter, os
+    períodos das datas ISO, a busca dos filhos por parent_id e as buscas
+    por código das ForeignKeys.
+    """
+    from django.apps import apps
+
+    site = site or admin.site
+    queries = []
+
+    def add(label, queryset):
+        sql, params = queryset.query.sql_with_params()
+        queries.append((label, _PLACEHOLDER.sub('?', sql).replace('%%', '%'), params))
+
+    for model, modeladmin in site._registry.items():
+        if model._meta.app_label != 'core':
+            continue
+        name = model._meta.model_name
+        queryset = model._default_manager.all()
+        if modeladmin.list_select_related:
+            queryset = queryset.select_related(*(
+                () if modeladmin.list_select_related is True else modeladmin.list_select_related
+            ))
+        ordering = [*(modeladmin.ordering or ()), '-pk']
+        add(f'{name}: changelist', queryset.order_by(*ordering)[:modeladmin.list_per_page])
+        for spec in modeladmin.list_filter:
+            if isinstance(spec, (list, tuple)):
+                spec = spec[0]
+            if isinstance(spec, str) and field_column(model, spec):
+                add(f'{name}: filtro {spec}', model._default_manager.filter(**{spec: '1'}).order_by(*ordering)[:100])
+        for field_name in sorted(iso_date_fields(modeladmin)):
+            period = model._default_manager.alias(iso=IsoDate(field_name)).filter(iso__gte='2024-01-01', iso__lt='2024-02-01')
+            add(f'{name}: período {field_name}', period.order_by(*ordering)[:100])
+        field_names = {field.name for field in model._meta.concrete_fields}
+        if {'parent_id', 'item_index'} <= field_names:
+            add(f'{name}: itens do pai', model._default_manager.filter(parent_id=1).order_by('item_index'))
+
+    for model in apps.get_app_config('core').get_models():
+        if model._meta.managed:
+            continue
+        for field in model._meta.concrete_fields:
+            if field.is_relation:
+                target = field.target_field
+                add(
+                    f'{field.related_model._meta.model_name}: por {target.name}',
+                    field.related_model._default_manager.filter(**{target.name: 1}),
+                )
+    # Cada destino aparece uma vez, mesmo referenciado por vários models
+    return list({label: (label, sql, params) for label, sql, params in queries}.values())
+
+
+def query_plans(conn, queries):
+    """{rótulo: [linhas do EXPLAIN QUERY PLAN]} (ignora tabelas inexistentes)"""
+    plans = {}
+    for label, sql, params in queries:
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        except sqlite3.Error:
+            continue
+        plans[label] = [row[-1] for row in rows]
+    return plans
@@ -0,0 +1,270 @@
+"""
+Exportações em segundo plano.
+
+Exportar uma tabela inteira para Excel dentro da requisição esbarra no
+timeout do proxy e prende um worker web por minutos. Um ExportJob guarda
+o pedido (empresa, model, query string da listagem e colunas) e roda em
+um pool de processos local:
+
+- EXPORT_WORKERS processos, criados com 'spawn' e com prioridade baixa
+  (EXPORT_NICE): uma exportação pesada disputa CPU com as outras, não com
+  as requisições interativas, e não segura o GIL do processo web;
+- cada usuário tem no máximo EXPORT_MAX_ACTIVE_JOBS exportações na fila
+  ou em andamento;
+- o progresso é gravado no job a cada PROGRESS_ROWS linhas, junto com o
+  sinal de vida (``heartbeat_at``); um job em andamento sem sinal há
+  EXPORT_STALE_AFTER segundos ficou para trás quando o processo morreu e
+  é marcado como erro, para não ocupar a vaga do usuário para sempre;
+- jobs na fila de um processo que reiniciou voltam para o pool na próxima
+  visita à página de exportações ou no próximo pedido
+  (``resume_pending_jobs``);
+- o arquivo vai para EXPORT_DIR e é apagado, junto com o job, depois de
+  EXPORT_RETENTION_DAYS dias.
+
+O job reaplica a query string na mesma ChangeList do export em streaming
+(core/exports.py): filtros, busca e ordenação são os da tela no momento
+do pedido, sobre o snapshot da empresa no momento da execução.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.db.models import Q
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import workers
+from .exports import (
+    CHUNK_SIZE, csv_chunks, data_columns, export_columns, export_rows, ndjson_chunks, stream_xlsx,
+)
+from .models import ExportJob
+from .registry import backup_registry
+from .routers import using_database
+
+logger = logging.getLogger(__name__)
+
+# Linhas entre duas gravações do progresso
+PROGRESS_ROWS = 5000
+
+# Nome do pool de processos das exportações
+EXPORT_POOL = 'exportacoes'
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def export_dir():
+    """Pasta dos arquivos gerados (criada se preciso)"""
+    path = Path(getattr(settings, 'EXPORT_DIR', Path(settings.BASE_DIR) / 'exports'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def process_pool(name, max_workers, nice=0, on_create=None):
+    """
+    Pool de processos ``name`` do processo web, criado na primeira
+    utilização ('spawn', Django configurado em cada processo).
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=workers.init_worker,
+                initargs=(nice,),
+            )
+            if on_create is not None:
+                on_create(pool)
+        return pool
+
+
+def submit_to(name, max_workers, function, *args, nice=0, on_create=None):
+    """Envia a tarefa ao pool ``name``; recria o pool se um processo dele morreu"""
+    try:
+        return process_pool(name, max_workers, nice, on_create).submit(function, *args)
+    except BrokenProcessPool:
+        with _pools_lock:
+            _pools.pop(name, None)
+        return process_pool(name, max_workers, nice, on_create).submit(function, *args)
+
+
+def fail_stale_jobs():
+    """Marca como erro os jobs em andamento sem sinal de vida há EXPORT_STALE_AFTER segundos"""
+    now = timezone.now()
+    limit = now - timedelta(seconds=getattr(settings, 'EXPORT_STALE_AFTER', 30 * 60))
+    return ExportJob.objects.filter(
+        Q(heartbeat_at__lt=limit) | Q(heartbeat_at__isnull=True, started_at__lt=limit),
+        status=ExportJob.RUNNING,
+    ).update(status=ExportJob.FAILED, error='Exportação interrompida: o processo foi encerrado', finished_at=now)
+
+
+def _requeue(pool):
+    """Jobs que ficaram na fila de um processo anterior (os que morreram em andamento viram erro)"""
+    fail_stale_jobs()
+    for pk in ExportJob.objects.filter(status=ExportJob.PENDING).values_list('pk', flat=True):
+        pool.submit(workers.run, pk)
+
+
+def submit(job):
+    """Coloca o job na fila do pool de exportações"""
+    submit_to(
+        EXPORT_POOL, getattr(settings, 'EXPORT_WORKERS', 2), workers.run, job.pk,
+        nice=getattr(settings, 'EXPORT_NICE', 10), on_create=_requeue,
+    )
+
+
+def resume_pending_jobs():
+    """
+    Jobs na fila quando este processo ainda não tem o pool (o processo que
+    os recebeu reiniciou): criar o pool reenvia todos eles (``_requeue``).
+    Um job enviado duas vezes roda uma só (``run_job`` reivindica o job).
+    """
+    if EXPORT_POOL not in _pools and ExportJob.objects.filter(status=ExportJob.PENDING).exists():
+        process_pool(
+            EXPORT_POOL, getattr(settings, 'EXPORT_WORKERS', 2),
+            nice=getattr(settings, 'EXPORT_NICE', 10), on_create=_requeue,
+        )
+
+
+def active_jobs(user):
+    """Exportações do usuário na fila ou em andamento"""
+    return ExportJob.objects.filter(user=user, status__in=[ExportJob.PENDING, ExportJob.RUNNING])
+
+
+def can_enqueue(user):
+    fail_stale_jobs()
+    resume_pending_jobs()
+    return active_jobs(user).count() < getattr(settings, 'EXPORT_MAX_ACTIVE_JOBS', 3)
+
+
+def job_columns(modeladmin, request, format):
+    """Colunas gravadas no job: campos do list_display (xlsx) ou attnames (csv/ndjson)"""
+    if format == 'xlsx':
+        return export_columns(modeladmin, request)[0]
+    return [attname for name, attname in data_columns(modeladmin, request)]
+
+
+def create_job(modeladmin, request, format, query_string):
+    """Grava o pedido de exportação do changelist e coloca na fila"""
+    purge_expired()
+    company = backup_registry.company_for(modeladmin.get_queryset(request).db)
+    job = ExportJob.objects.create(
+        user=request.user,
+        company=company,
+        model=modeladmin.model._meta.label_lower,
+        format=format,
+        query_string=query_string.lstrip('?'),
+        columns=job_columns(modeladmin, request, format),
+    )
+    submit(job)
+    return job
+
+
+def export_request(modeladmin, user, query_string, format):
+    """Requisição GET equivalente à do export do changelist, fora de uma requisição"""
+    opts = modeladmin.model._meta
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(query_string)
+    request.user = user
+    request.path = request.path_info = reverse(f'admin:{opts.app_label}_{opts.model_name}_export', args=[format])
+    request.resolver_match = resolve(request.path)
+    return request
+
+
+def tracked(job, rows):
+    """Repassa as linhas gravando o progresso do job a cada PROGRESS_ROWS"""
+    count = 0
+    for count, row in enumerate(rows, 1):
+        if count % PROGRESS_ROWS == 0:
+            ExportJob.objects.filter(pk=job.pk).update(rows_done=count, heartbeat_at=timezone.now())
+        yield row
+    job.rows_done = count
+
+
+def job_chunks(job, modeladmin, request, queryset):
+    """Bytes do arquivo do job no formato pedido"""
+    if job.format == 'xlsx':
+        field_names, headers = export_columns(modeladmin, request)
+        labels = dict(zip(field_names, headers))
+        field_names = [name for name in job.columns if name in labels]
+        rows = tracked(job, export_rows(modeladmin, request, queryset, field_names))
+        title = str(modeladmin.model._meta.verbose_name_plural)
+        return stream_xlsx(title, [labels[name] for name in field_names], rows)
+    available = dict((attname, name) for name, attname in data_columns(modeladmin, request))
+    attnames = [attname for attname in job.columns if attname in available]
+    rows = tracked(job, queryset.values_list(*attnames).iterator(chunk_size=CHUNK_SIZE))
+    names = [available[attname] for attname in attnames]
+    return csv_chunks(names, rows) if job.format == 'csv' else ndjson_chunks(names, rows)
+
+
+def write_job_file(job):
+    """Gera o arquivo do job em EXPORT_DIR (no snapshot atual da empresa)"""
+    from django.apps import apps
+
+    model = apps.get_model(job.model)
+    modeladmin = admin.site._registry[model]
+    request = export_request(modeladmin, job.user, job.query_string, job.format)
+    queryset = modeladmin.get_changelist_instance(request).queryset
+    ExportJob.objects.filter(pk=job.pk).update(total_rows=queryset.count(), heartbeat_at=timezone.now())
+
+    path = export_dir() / f'{job.pk}-{model._meta.model_name}.{job.format}'
+    partial = path.with_name(path.name + '.part')
+    with open(partial, 'wb') as fh:
+        for chunk in job_chunks(job, modeladmin, request, queryset):
+            fh.write(chunk)
+    os.replace(partial, path)
+    return path
+
+
+def run_job(pk):
+    """Executa o job (em um processo do pool); ignora jobs já assumidos por outro"""
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(pk=pk, status=ExportJob.PENDING).update(
+        status=ExportJob.RUNNING, started_at=now, heartbeat_at=now,
+    )
+    if not claimed:
+        return
+    job = ExportJob.objects.select_related('user').get(pk=pk)
+    try:
+        backup_registry.refresh()
+        with using_database(backup_registry.alias_for(job.company)):
+            path = write_job_file(job)
+        ExportJob.objects.filter(pk=pk).update(
+            status=ExportJob.DONE, rows_done=job.rows_done, file_name=path.name,
+            file_size=path.stat().st_size, finished_at=timezone.now(),
+        )
+    except Exception as error:
+        logger.exception('Falha na exportação %s', pk)
+        ExportJob.objects.filter(pk=pk).update(
+            status=ExportJob.FAILED, error=str(error) or error.__class__.__name__, finished_at=timezone.now(),
+        )
+
+
+def job_file(job):
+    """Caminho do arquivo de um job concluído (None se não existir mais)"""
+    if job.status != ExportJob.DONE or not job.file_name:
+        return None
+    path = export_dir() / job.file_name
+    return path if path.is_file() else None
+
+
+def purge_expired():
+    """Apaga os jobs (e arquivos) mais antigos que EXPORT_RETENTION_DAYS"""
+    limit = timezone.now() - timedelta(days=getattr(settings, 'EXPORT_RETENTION_DAYS', 7))
+    expired = ExportJob.objects.filter(created_at__lt=limit)
+    for job in expired:
+        path = job_file(job)
+        if path:
+            path.unlink(missing_ok=True)
+        export_dir().joinpath(f'{job.pk}-{job.model.rpartition(".")[2]}.{job.format}.part').unlink(missing_ok=True)
+    expired.delete()
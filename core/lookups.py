@@ -0,0 +1,75 @@
+"""
+Mapas de lookup em memória, carregados uma vez por snapshot de cada empresa.
+
+Os cadastros pequenos (categorias, ...) são lidos inteiros na primeira
+consulta e guardados no cache local do processo (core/cache.py), com a
+chave da empresa e do snapshot: listagens e exportações resolvem os nomes
+sem uma query por linha, e um backup novo troca o mapa sozinho.
+"""
+from django.db.models.expressions import RawSQL
+
+from .cache import get_or_set
+from .consolidated import is_consolidated
+from .models import CategoriaCadastro
+
+
+class CategoryLookup:
+    """
+    Descrição das categorias pelo código usado nos lançamentos.
+
+    O código pode ser o ``codigo_dre`` ('1.01.02') ou o ``codigo`` numérico;
+    o ``codigo_dre`` tem precedência e, havendo repetição, vale a categoria
+    de menor id. No modo consolidado as chaves incluem a empresa.
+    """
+
+    def __init__(self, rows):
+        self.by_dre = {}
+        self.by_code = {}
+        for company, codigo, codigo_dre, descricao in rows:
+            if codigo_dre not in (None, ''):
+                self.by_dre.setdefault((company, str(codigo_dre)), descricao)
+            if codigo is not None:
+                self.by_code.setdefault((company, float(codigo)), descricao)
+
+    def __len__(self):
+        return len(self.by_dre) + len(self.by_code)
+
+    def find(self, code, company=None):
+        """Retorna (encontrada, descrição) para o código"""
+        if code in (None, ''):
+            return False, None
+        key = (company, str(code))
+        if key in self.by_dre:
+            return True, self.by_dre[key]
+        try:
+            key = (company, float(code))
+        except (TypeError, ValueError):
+            return False, None
+        if key in self.by_code:
+            return True, self.by_code[key]
+        return False, None
+
+    def describe(self, code, company=None):
+        """Descrição da categoria; o próprio código se não houver descrição"""
+        found, descricao = self.find(code, company)
+        return (descricao or code) if found else code
+
+
+def _load_categories():
+    queryset = CategoriaCadastro.objects.order_by('id')
+    if is_consolidated():
+        queryset = queryset.annotate(company=RawSQL('"categoria_cadastro"."company"', ()))
+        rows = queryset.values_list('company', 'codigo', 'codigo_dre', 'descricao')
+    else:
+        rows = ((None, *row) for row in queryset.values_list('codigo', 'codigo_dre', 'descricao'))
+    return CategoryLookup(rows)
+
+
+def category_lookup():
+    """CategoryLookup do snapshot em uso no contexto atual"""
+    return get_or_set(('lookup', 'categorias'), _load_categories, local=True)
+
+
+def category_description(code, company=None):
+    """Atalho: descrição da categoria do código no snapshot atual"""
+    return category_lookup().describe(code, company)
@@ -0,0 +1,236 @@
+"""
+Benchmark reproduzível das páginas do admin por ModelAdmin.
+
+Para cada empresa e cada ModelAdmin do core, mede (mediana de --repeat):
+- changelist: primeira página renderizada;
+- search: changelist com um termo tirado do próprio banco;
+- filter:<campo>: changelist com um valor de cada list_filter;
+- detail: página de edição do primeiro registro;
+- export: ação export_to_excel com --export-rows registros.
+
+Cada medição tem uma execução de aquecimento descartada.
+
+As views rodam com RequestFactory e um superusuário em memória, então não
+dependem de login, sessão ou servidor. O resultado é JSON (com o commit
+atual) para comparar execuções: ``--compare anterior.json`` mostra a
+variação de cada medição.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+
+from core.admin import export_to_excel
+from core.perf import QueryProfile
+from core.registry import available_databases, backup_registry
+from core.routers import using_database
+
+SCENARIOS = ('changelist', 'search', 'filter', 'detail', 'export')
+
+
+def git_revision():
+    """Commit atual do repositório (None fora de um checkout git)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def admin_request(modeladmin, params=None):
+    """GET do changelist autenticado como superusuário em memória, pronto para as views do admin"""
+    opts = modeladmin.model._meta
+    request = RequestFactory().get(f'/admin/{opts.app_label}/{opts.model_name}/', params or {})
+    request.user = User(username='benchmark', is_active=True, is_staff=True, is_superuser=True)
+    request.session = {}
+    request._messages = CookieStorage(request)
+    # Mede a view, não o cache de páginas (que responderia sem renderizar)
+    request.skip_page_cache = True
+    return request
+
+
+def filter_params(modeladmin, request):
+    """[(nome, parâmetros GET)] com um valor existente para cada list_filter"""
+    queryset = modeladmin.get_queryset(request)
+    params = []
+    for spec in modeladmin.get_list_filter(request):
+        if isinstance(spec, (list, tuple)):
+            field, filter_class = spec
+            if filter_class is admin.EmptyFieldListFilter:
+                params.append((field, {f'{field}__isempty': '1'}))
+            continue
+        if not isinstance(spec, str):
+            continue  # SimpleListFilter: depende de lookups próprios
+        value = (
+            queryset.exclude(**{f'{spec}__isnull': True})
+            .values_list(spec, flat=True).order_by().first()
+        )
+        if value is not None:
+            params.append((spec, {f'{spec}__exact': str(value)}))
+    return params
+
+
+def search_term(modeladmin, request):
+    """Trecho de um valor real do primeiro search_field direto do model"""
+    for field in modeladmin.get_search_fields(request):
+        field = field.lstrip('^=@')
+        if '__' in field:
+            continue
+        value = (
+            modeladmin.get_queryset(request).exclude(**{f'{field}__isnull': True})
+            .values_list(field, flat=True).order_by().first()
+        )
+        if value not in (None, ''):
+            return str(value).split()[0][:6]
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Mede changelist, busca, filtros, detalhe e exportação de cada ModelAdmin (saída JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Empresa a medir (padrão: todas, sem o consolidado)')
+        parser.add_argument('--file', help='Backup avulso a medir (registrado como "benchmark")')
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Nome do model a medir (ex.: movimentosfinanceiros)')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Cenários a medir (padrão: todos)')
+        parser.add_argument('--repeat', type=int, default=3, help='Repetições por medição (usa a mediana)')
+        parser.add_argument('--export-rows', type=int, default=1000,
+                            help='Registros selecionados na exportação')
+        parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+        parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            if not Path(options['file']).is_file():
+                raise CommandError(f'Arquivo não encontrado: {options["file"]}')
+            databases = ['benchmark']
+            backup_registry.register('benchmark', options['file'])
+        else:
+            databases = options['databases'] or backup_registry.companies()
+            unknown = set(databases) - set(available_databases())
+            if unknown:
+                raise CommandError(f'Banco(s) desconhecido(s): {", ".join(sorted(unknown))}')
+
+        model_admins = [
+            modeladmin for model, modeladmin in admin.site._registry.items()
+            if model._meta.app_label == 'core'
+            and (not options['models'] or model._meta.model_name in options['models'])
+        ]
+        self.repeat = options['repeat']
+        self.export_rows = options['export_rows']
+        scenarios = options['scenarios'] or SCENARIOS
+
+        results = []
+        for company in databases:
+            alias = backup_registry.alias_for(company)
+            with using_database(alias):
+                for modeladmin in model_admins:
+                    results.extend(self.benchmark(company, alias, modeladmin, scenarios))
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': self.repeat,
+            'export_rows': self.export_rows,
+            'results': results,
+        }
+        content = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            Path(options['output']).write_text(content, encoding='utf-8')
+        else:
+            self.stdout.write(content)
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text(encoding='utf-8')), report)
+
+    def request(self, modeladmin, params=None):
+        return admin_request(modeladmin, params)
+
+    def measure(self, alias, action):
+        """Mediana/mín./máx. em ms e queries por execução de ``action()``"""
+        action()  # Aquecimento: templates compilados e páginas do SQLite em cache
+        timings = []
+        for _ in range(self.repeat):
+            profile = QueryProfile()
+            with connections[alias].execute_wrapper(profile):
+                start = time.perf_counter()
+                action()
+                timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': sum(stats['count'] for stats in profile.summary().values()),
+        }
+
+    def benchmark(self, company, alias, modeladmin, scenarios):
+        """Medições de um ModelAdmin em uma empresa"""
+        model_name = modeladmin.model._meta.model_name
+        probe = self.request(modeladmin)
+        cases = []
+        if 'changelist' in scenarios:
+            cases.append(('changelist', lambda: modeladmin.changelist_view(self.request(modeladmin)).render()))
+        if 'search' in scenarios:
+            term = search_term(modeladmin, probe)
+            if term:
+                cases.append(('search', lambda: modeladmin.changelist_view(
+                    self.request(modeladmin, {'q': term})).render()))
+        if 'filter' in scenarios:
+            for name, params in filter_params(modeladmin, probe):
+                cases.append((f'filter:{name}', lambda params=params: modeladmin.changelist_view(
+                    self.request(modeladmin, params)).render()))
+        ids = list(modeladmin.get_queryset(probe).order_by('pk').values_list('pk', flat=True)[:self.export_rows])
+        if 'detail' in scenarios and ids:
+            object_id = str(ids[0])
+            cases.append(('detail', lambda: modeladmin.change_view(
+                self.request(modeladmin), object_id).render()))
+        if 'export' in scenarios and ids:
+            # A exportação é uma resposta em streaming: o custo está em consumi-la
+            cases.append(('export', lambda: b''.join(export_to_excel(
+                modeladmin, probe, modeladmin.get_queryset(probe).filter(pk__in=ids)).streaming_content)))
+
+        results = []
+        for scenario, action in cases:
+            try:
+                measurement = self.measure(alias, action)
+            except Exception as exc:
+                self.stderr.write(f'{company}/{model_name}/{scenario}: {exc}')
+                continue
+            results.append({'database': company, 'model': model_name, 'scenario': scenario, **measurement})
+            self.stderr.write(f'{company:<12} {model_name:<28} {scenario:<36} {measurement["median_ms"]:>10.1f} ms')
+        return results
+
+    def compare(self, previous, current):
+        """Mostra a variação da mediana entre duas execuções"""
+        def key(result):
+            return (result['database'], result['model'], result['scenario'])
+
+        before = {key(result): result for result in previous.get('results', [])}
+        self.stderr.write(f'\nComparação com {previous.get("revision") or "execução anterior"}:')
+        for result in current['results']:
+            old = before.get(key(result))
+            if not old or not old['median_ms']:
+                continue
+            ratio = result['median_ms'] / old['median_ms']
+            self.stderr.write(
+                f'{" / ".join(key(result)):<70} {old["median_ms"]:>10.1f} -> '
+                f'{result["median_ms"]:>10.1f} ms ({ratio:.2f}x)'
+            )
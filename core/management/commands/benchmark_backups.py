@@ -0,0 +1,110 @@
+"""
+Benchmark das consultas de changelist com e sem o perfil de backup.
+
+Para cada empresa e cada ModelAdmin do app core, executa a contagem e a
+primeira página do changelist em uma conexão nova (cache de páginas frio):
+uma vez com a conexão padrão do SQLite e outra com o perfil somente
+leitura (mode=ro/immutable + PRAGMAs de core/backups.py).
+"""
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from core.backups import backup_pragmas, backup_uri
+from core.registry import backup_registry
+
+
+def changelist_queries(modeladmin, alias):
+    """SQL da contagem e da primeira página do changelist"""
+    model = modeladmin.model
+    request = RequestFactory().get('/')
+    queryset = modeladmin.get_queryset(request).using(alias)
+    if modeladmin.list_select_related is True:
+        queryset = queryset.select_related()
+    elif modeladmin.list_select_related:
+        queryset = queryset.select_related(*modeladmin.list_select_related)
+    ordering = list(modeladmin.get_ordering(request) or []) + ['-pk']
+    page = queryset.order_by(*ordering)[:modeladmin.list_per_page]
+    sql, params = page.query.get_compiler(using=alias).as_sql()
+    return [
+        (f'SELECT COUNT(*) FROM "{model._meta.db_table}"', ()),
+        (sql, params),
+    ]
+
+
+def open_default(path):
+    """Conexão SQLite padrão (leitura/escrita, PRAGMAs padrão)"""
+    return sqlite3.connect(path)
+
+
+def open_backup_profile(path):
+    """Conexão com o perfil de backup"""
+    conn = sqlite3.connect(backup_uri(path), uri=True)
+    for pragma, value in backup_pragmas().items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+
+def measure(opener, path, queries, repeat):
+    """Mediana (ms) de abrir a conexão e executar as consultas"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn = opener(path)
+        try:
+            for sql, params in queries:
+                conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Compara a latência dos changelists com a conexão padrão e com o perfil de backup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Empresa a medir (padrão: todas de DATABASE_NAMES)')
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Nome do model a medir (ex.: movimentosfinanceiros)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Repetições por medição (usa a mediana)')
+
+    def handle(self, *args, **options):
+        databases = options['databases'] or list(settings.DATABASE_NAMES)
+        unknown = set(databases) - set(settings.DATABASE_NAMES)
+        if unknown:
+            raise CommandError(f'Banco(s) desconhecido(s): {", ".join(sorted(unknown))}')
+
+        model_admins = [
+            modeladmin for model, modeladmin in admin.site._registry.items()
+            if model._meta.app_label == 'core'
+            and (not options['models'] or model._meta.model_name in options['models'])
+        ]
+
+        self.stdout.write(f'{"empresa":<20} {"model":<28} {"padrão ms":>10} {"perfil ms":>10} {"ganho":>7}')
+        for alias in databases:
+            path = backup_registry.path_for(alias)
+            if not path or not Path(path).exists():
+                self.stderr.write(f'{alias}: arquivo de backup não encontrado, ignorando')
+                continue
+            for modeladmin in model_admins:
+                queries = changelist_queries(modeladmin, alias)
+                try:
+                    default_ms = measure(open_default, path, queries, options['repeat'])
+                    profile_ms = measure(open_backup_profile, path, queries, options['repeat'])
+                except sqlite3.Error as exc:
+                    self.stderr.write(f'{alias}/{modeladmin.model._meta.model_name}: {exc}')
+                    continue
+                speedup = default_ms / profile_ms if profile_ms else 0
+                self.stdout.write(
+                    f'{alias:<20} {modeladmin.model._meta.model_name:<28} '
+                    f'{default_ms:>10.1f} {profile_ms:>10.1f} {speedup:>6.2f}x'
+                )
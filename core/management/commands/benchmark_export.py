@@ -0,0 +1,221 @@
+"""
+Benchmark da exportação para Excel: Workbook em memória x streaming.
+
+Mede, para o mesmo queryset e as mesmas colunas do export_to_excel:
+- memoria: a implementação original da ação (Workbook comum, célula por
+  célula, gravado na resposta só no fim);
+- celula: o arquivo em streaming com a leitura original das linhas
+  (models inteiros, hasattr/getattr e regex a cada célula);
+- streaming: core/exports.py (ColumnPlan com projeção das colunas,
+  write-only, enviado enquanto é gerado).
+
+Cada variante roda em um processo novo, para que o pico de RSS de uma não
+contamine a outra. O resultado mostra linhas por segundo, tempo até o
+primeiro byte, tamanho do arquivo e o pico de RSS acima do processo ocioso.
+"""
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from core.exports import (
+    CHUNK_SIZE, XLSX_CONTENT_TYPE, WIDTH_SAMPLE, column_widths, export_columns, export_rows,
+    header_style, stream_xlsx,
+)
+from core.management.commands.benchmark_admin import admin_request
+from core.registry import available_databases, backup_registry
+from core.routers import using_database
+
+VARIANTS = ('memoria', 'celula', 'streaming')
+
+_TAG = re.compile('<[^<]+?>')
+
+
+def cell_value(modeladmin, obj, field):
+    """A leitura original de uma célula: hasattr/getattr no model e no admin a cada valor"""
+    model = type(obj)
+    try:
+        if hasattr(model, field) and hasattr(getattr(model, field, None), 'field'):
+            value = getattr(obj, field, '')
+        elif hasattr(modeladmin, field):
+            value = getattr(modeladmin, field)(obj)
+            if isinstance(value, str) and '<' in value:
+                value = _TAG.sub('', value)
+        else:
+            value = getattr(obj, field, '')
+    except Exception:
+        return ''
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if not isinstance(value, (str, int, float, bool)):
+        return str(value)
+    return value
+
+
+def cell_rows(modeladmin, request, queryset, field_names):
+    """As linhas lidas do jeito original: models inteiros, célula por célula"""
+    related_fields = modeladmin.get_list_select_related(request)
+    if related_fields is True:
+        queryset = queryset.select_related()
+    elif related_fields:
+        queryset = queryset.select_related(*related_fields)
+    for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield [cell_value(modeladmin, obj, field) for field in field_names]
+
+
+def workbook_export(modeladmin, request, queryset):
+    """A exportação original: Workbook inteiro na memória, gravado no final"""
+    field_names, headers = export_columns(modeladmin, request)
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = str(queryset.model._meta.verbose_name_plural)[:31]
+    font, fill, alignment = header_style()
+    for col, header in enumerate(headers, 1):
+        cell = sheet.cell(row=1, column=col, value=header)
+        cell.font, cell.fill, cell.alignment = font, fill, alignment
+    sample = []
+    for row_num, row in enumerate(cell_rows(modeladmin, request, queryset, field_names), 2):
+        for col_num, value in enumerate(row, 1):
+            sheet.cell(row=row_num, column=col_num, value=value)
+        if len(sample) < WIDTH_SAMPLE:
+            sample.append(row)
+    for col, width in enumerate(column_widths(headers, sample), 1):
+        sheet.column_dimensions[get_column_letter(col)].width = width
+    response = HttpResponse(content_type=XLSX_CONTENT_TYPE)
+    workbook.save(response)
+    return response
+
+
+def rss_kb():
+    """RSS atual do processo em KB (Linux), ou o pico até aqui nos demais sistemas"""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return peak_rss_kb()
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KB no Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Command(BaseCommand):
+    help = 'Compara linhas/s e pico de RSS da exportação para Excel (em memória, célula a célula e com ColumnPlan)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help='Empresa a usar (padrão: a primeira disponível)')
+        parser.add_argument('--file', help='Backup avulso a usar (registrado como "benchmark")')
+        parser.add_argument('--model', default='movimentosfinanceiros',
+                            help='Nome do model a exportar (padrão: movimentosfinanceiros)')
+        parser.add_argument('--rows', type=int, help='Limite de registros exportados (padrão: todos)')
+        parser.add_argument('--variant', action='append', dest='variants', choices=VARIANTS,
+                            help='Variantes a medir (padrão: todas)')
+        parser.add_argument('--worker', choices=VARIANTS, help='(interno) executa uma variante neste processo')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            if not Path(options['file']).is_file():
+                raise CommandError(f'Arquivo não encontrado: {options["file"]}')
+            company = 'benchmark'
+            backup_registry.register(company, options['file'])
+        else:
+            company = options['database'] or next(iter(backup_registry.companies()), None)
+            if company not in available_databases():
+                raise CommandError(f'Banco desconhecido: {company}')
+        modeladmin = next((
+            modeladmin for model, modeladmin in admin.site._registry.items()
+            if model._meta.app_label == 'core' and model._meta.model_name == options['model']
+        ), None)
+        if modeladmin is None:
+            raise CommandError(f'Model desconhecido: {options["model"]}')
+
+        if options['worker']:
+            with using_database(backup_registry.alias_for(company)):
+                result = self.run(modeladmin, options['worker'], options['rows'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(
+            f'{"variante":<10} {"linhas":>9} {"segundos":>9} {"linhas/s":>10} '
+            f'{"1º byte s":>10} {"MB arquivo":>11} {"pico RSS MB":>12}'
+        )
+        for variant in options['variants'] or VARIANTS:
+            result = self.spawn(options, variant)
+            if result is None:
+                continue
+            self.stdout.write(
+                f'{variant:<10} {result["rows"]:>9} {result["seconds"]:>9.2f} '
+                f'{result["rows"] / result["seconds"] if result["seconds"] else 0:>10.0f} '
+                f'{result["first_byte_seconds"]:>10.2f} {result["bytes"] / 2**20:>11.1f} '
+                f'{(result["peak_rss_kb"] - result["start_rss_kb"]) / 1024:>12.1f}'
+            )
+
+    def spawn(self, options, variant):
+        """Executa a variante em um processo novo e devolve o resultado (None em erro)"""
+        command = [sys.executable, '-m', 'django', 'benchmark_export', '--skip-checks',
+                   '--model', options['model'], '--worker', variant]
+        if options['file']:
+            command += ['--file', options['file']]
+        elif options['database']:
+            command += ['--database', options['database']]
+        if options['rows']:
+            command += ['--rows', str(options['rows'])]
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'OMIE.settings')}
+        process = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if process.returncode != 0:
+            self.stderr.write(f'{variant}: {process.stderr.strip()}')
+            return None
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def run(self, modeladmin, variant, limit):
+        """Exporta e mede neste processo"""
+        request = admin_request(modeladmin)
+        queryset = modeladmin.get_queryset(request).order_by('pk')
+        if limit:
+            queryset = queryset.filter(pk__in=queryset.values('pk')[:limit])
+        rows = queryset.count()
+        start_rss = rss_kb()
+        start = time.perf_counter()
+        first_byte = None
+        size = 0
+        if variant == 'memoria':
+            content = workbook_export(modeladmin, request, queryset).content
+            first_byte = time.perf_counter()
+            size = len(content)
+            del content
+        else:
+            field_names, headers = export_columns(modeladmin, request)
+            title = str(queryset.model._meta.verbose_name_plural)
+            read_rows = cell_rows if variant == 'celula' else export_rows
+            for chunk in stream_xlsx(title, headers, read_rows(modeladmin, request, queryset, field_names)):
+                if first_byte is None and chunk:
+                    first_byte = time.perf_counter()
+                size += len(chunk)
+        seconds = time.perf_counter() - start
+        return {
+            'variant': variant,
+            'rows': rows,
+            'seconds': seconds,
+            'first_byte_seconds': (first_byte or time.perf_counter()) - start,
+            'bytes': size,
+            'start_rss_kb': start_rss,
+            'peak_rss_kb': peak_rss_kb(),
+        }
@@ -0,0 +1,118 @@
+"""
+Cria nos backups os índices das colunas usadas pelo admin (core/indexes.py).
+
+Os snapshots em uso são abertos com immutable=1 e não podem ser alterados:
+por padrão o snapshot atual de cada empresa é copiado, indexado e instalado
+como um snapshot novo, que os workers adotam na próxima verificação do
+registro. Com ``--file`` o arquivo informado é indexado no lugar (para
+arquivos recém-entregues, antes do install_backup).
+
+Mostra as consultas representativas cujo plano mudou (EXPLAIN QUERY PLAN).
+"""
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.backups import new_snapshot_path, prune_snapshots, search_index_path
+from core.indexes import apply_index_plan, index_name, index_plan, query_plans, sample_queries
+from core.registry import backup_registry
+
+
+class Command(BaseCommand):
+    help = 'Cria os índices usados pelo admin nos backups das empresas e roda ANALYZE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Empresa a indexar (padrão: todas)')
+        parser.add_argument('--file', action='append', dest='files',
+                            help='Arquivo a indexar no lugar (não pode estar em uso)')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas mostra o plano de índices')
+        parser.add_argument('--keep', type=int, default=2,
+                            help='Snapshots mantidos por empresa ao instalar o indexado (0 = todos)')
+
+    def handle(self, *args, **options):
+        plan = index_plan()
+        if options['dry_run']:
+            for table, indexes in plan.items():
+                for columns, reasons in indexes.items():
+                    self.stdout.write(f'{index_name(table, columns):<70} {", ".join(sorted(reasons))}')
+            return
+
+        if options['files']:
+            in_use = {backup_registry.path_for(company).resolve() for company in backup_registry.companies()
+                      if backup_registry.path_for(company)}
+            for path in options['files']:
+                if not Path(path).is_file():
+                    raise CommandError(f'Arquivo não encontrado: {path}')
+                if Path(path).resolve() in in_use:
+                    raise CommandError(f'{path} é um snapshot em uso; rode sem --file para indexar uma cópia')
+                self.index_file(Path(path), plan)
+            return
+
+        companies = options['databases'] or backup_registry.companies()
+        unknown = set(companies) - set(backup_registry.companies())
+        if unknown:
+            raise CommandError(f'Empresa(s) desconhecida(s): {", ".join(sorted(unknown))}')
+        for company in companies:
+            self.index_snapshot(company, plan, options['keep'])
+
+    def index_snapshot(self, company, plan, keep):
+        """Copia o snapshot atual, indexa e instala como snapshot novo"""
+        current = backup_registry.path_for(company)
+        if current is None or not current.is_file():
+            self.stderr.write(f'{company}: arquivo de backup não encontrado, ignorando')
+            return
+        backup_dir = Path(settings.BACKUP_DIR)
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        target = new_snapshot_path(backup_dir, company)
+        temporary = backup_dir / f'.{target.name}.tmp'
+        shutil.copyfile(current, temporary)
+        try:
+            created = self.index_file(temporary, plan, label=company)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+        if not created:
+            temporary.unlink()
+            self.stdout.write(f'{company}: nenhum índice novo, snapshot mantido')
+            return
+        # Os dados não mudam: o índice de busca do snapshot atual vale para o novo
+        if search_index_path(current).is_file():
+            shutil.copyfile(search_index_path(current), search_index_path(target))
+        os.replace(temporary, target)
+        self.stdout.write(self.style.SUCCESS(f'{company}: snapshot indexado instalado em {target}'))
+        if keep > 0:
+            for path, error in prune_snapshots(backup_dir, company, keep):
+                if error:
+                    self.stderr.write(f'{path.name}: não removido ({error})')
+                else:
+                    self.stdout.write(f'{path.name}: removido')
+
+    def index_file(self, path, plan, label=None):
+        """Indexa o arquivo no lugar e mostra os planos alterados"""
+        label = label or path.name
+        queries = sample_queries()
+        conn = sqlite3.connect(path)
+        try:
+            before = query_plans(conn, queries)
+            created = apply_index_plan(conn, plan)
+            after = query_plans(conn, queries)
+        finally:
+            conn.close()
+
+        for table, columns in created:
+            self.stdout.write(f'{label}: índice {index_name(table, columns)}')
+        for query, plan_before in before.items():
+            plan_after = after.get(query, [])
+            if plan_after != plan_before:
+                self.stdout.write(f'\n{label} / {query}')
+                for line in plan_before:
+                    self.stdout.write(f'  - {line}')
+                for line in plan_after:
+                    self.stdout.write(self.style.SUCCESS(f'  + {line}'))
+        self.stdout.write(f'{label}: {len(created)} índice(s) criado(s), ANALYZE executado')
+        return created
@@ -0,0 +1,64 @@
+"""
+Gera o índice de busca FTS5 (core/search.py) ao lado dos snapshots.
+
+O arquivo ``<snapshot>.fts5`` é gravado em um temporário renomeado
+atomicamente; as conexões abertas depois disso já anexam o índice e a
+busca do admin passa a usá-lo. Snapshots que já têm índice são mantidos
+(use ``--force`` para gerar de novo, por exemplo após mudar os
+search_fields).
+"""
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.backups import search_index_path
+from core.registry import backup_registry
+from core.search import build_search_index
+
+
+class Command(BaseCommand):
+    help = 'Gera o índice de busca FTS5 dos snapshots das empresas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Empresa a indexar (padrão: todas)')
+        parser.add_argument('--file', action='append', dest='files',
+                            help='Snapshot avulso a indexar')
+        parser.add_argument('--force', action='store_true', help='Gera de novo índices já existentes')
+
+    def handle(self, *args, **options):
+        if options['files']:
+            targets = [(Path(path).name, Path(path)) for path in options['files']]
+        else:
+            companies = options['databases'] or backup_registry.companies()
+            unknown = set(companies) - set(backup_registry.companies())
+            if unknown:
+                raise CommandError(f'Empresa(s) desconhecida(s): {", ".join(sorted(unknown))}')
+            targets = [(company, backup_registry.path_for(company)) for company in companies]
+
+        for label, path in targets:
+            if path is None or not path.is_file():
+                self.stderr.write(f'{label}: arquivo de backup não encontrado, ignorando')
+                continue
+            target = search_index_path(path)
+            if target.exists() and not options['force']:
+                self.stdout.write(f'{label}: índice de busca já existe ({target.name})')
+                continue
+            self.build(label, path, target)
+
+    def build(self, label, path, target):
+        temporary = target.with_name(f'.{target.name}.tmp')
+        temporary.unlink(missing_ok=True)
+        started = time.perf_counter()
+        try:
+            built = build_search_index(path, temporary)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+        os.replace(temporary, target)
+        for model, rows in built.items():
+            self.stdout.write(f'{label}: {model._meta.db_table}: {rows} registro(s)')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'{label}: índice de busca gravado em {target.name} ({elapsed:.1f}s)'))
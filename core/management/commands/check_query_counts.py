@@ -0,0 +1,102 @@
+"""
+Verifica que cada changelist do core roda em um número constante de queries.
+
+Renderiza o changelist de cada ModelAdmin com dois tamanhos de página (e a
+exportação para Excel com duas quantidades de registros) e compara as
+queries executadas. Se o número cresce com a página, algum item do
+list_display acessa uma relação fora do select_related (N+1).
+
+Termina com erro quando algum ModelAdmin falha, para uso em CI.
+"""
+from contextlib import ExitStack
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.admin import export_to_excel
+from core.perf import QueryProfile
+from core.registry import backup_registry
+from core.routers import using_database
+
+from .benchmark_admin import admin_request
+
+
+def count_queries(aliases, action):
+    """Quantidade de queries executadas por ``action()`` nos aliases"""
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(profile))
+        action()
+    return sum(stats['count'] for stats in profile.summary().values())
+
+
+class Command(BaseCommand):
+    help = 'Confere se changelists e exportação rodam em número constante de queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Empresa a verificar (padrão: todas, sem o consolidado)')
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Nome do model a verificar (ex.: contapagarcadastro)')
+        parser.add_argument('--sizes', type=int, nargs=2, default=(5, 50), metavar=('MENOR', 'MAIOR'),
+                            help='Tamanhos de página comparados')
+
+    def handle(self, *args, **options):
+        small, large = sorted(options['sizes'])
+        if small < 1 or small == large:
+            raise CommandError('--sizes precisa de dois tamanhos positivos diferentes')
+        databases = options['databases'] or backup_registry.companies()
+        model_admins = [
+            modeladmin for model, modeladmin in admin.site._registry.items()
+            if model._meta.app_label == 'core'
+            and (not options['models'] or model._meta.model_name in options['models'])
+        ]
+
+        failures = []
+        for company in databases:
+            alias = backup_registry.alias_for(company)
+            with using_database(alias):
+                for modeladmin in model_admins:
+                    failures += self.check(company, (alias, DEFAULT_DB_ALIAS), modeladmin, small, large)
+
+        if failures:
+            raise CommandError(f'{len(failures)} verificação(ões) com queries por linha: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Todas as listagens rodam em número constante de queries'))
+
+    def changelist_queries(self, aliases, modeladmin, page_size):
+        original = modeladmin.list_per_page
+        modeladmin.list_per_page = page_size
+        try:
+            return count_queries(aliases, lambda: modeladmin.changelist_view(admin_request(modeladmin)).render())
+        finally:
+            modeladmin.list_per_page = original
+
+    def export_queries(self, aliases, modeladmin, rows):
+        request = admin_request(modeladmin)
+        queryset = modeladmin.get_queryset(request)
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:rows])
+        # A exportação é uma resposta em streaming: as queries rodam ao consumi-la
+        return count_queries(aliases, lambda: b''.join(
+            export_to_excel(modeladmin, request, queryset.filter(pk__in=ids)).streaming_content))
+
+    def check(self, company, aliases, modeladmin, small, large):
+        """Compara as queries nos dois tamanhos; retorna as falhas"""
+        model_name = modeladmin.model._meta.model_name
+        total = modeladmin.get_queryset(admin_request(modeladmin)).count()
+        if total <= small:
+            self.stdout.write(f'{company}/{model_name}: {total} registro(s), insuficiente para comparar')
+            return []
+        failures = []
+        for kind, measure in (('changelist', self.changelist_queries), ('export', self.export_queries)):
+            # Uma execução antes: caches por snapshot (lookups) não entram na conta
+            measure(aliases, modeladmin, small)
+            few, many = measure(aliases, modeladmin, small), measure(aliases, modeladmin, large)
+            label = f'{company}/{model_name}/{kind}'
+            if many > few:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'{label}: {few} queries com {small}, {many} com {large}'))
+            else:
+                self.stdout.write(f'{label}: {few} queries')
+        return failures
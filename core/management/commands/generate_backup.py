@@ -0,0 +1,315 @@
+"""
+Gera um backup sintético de empresa com o mesmo formato dos backups reais.
+
+Cria todas as tabelas não gerenciadas de core/models.py, sem índices (como
+os arquivos entregues), com:
+- códigos usados como ForeignKey (codigo_cliente_omie, ncodcc, codigo de
+  projetos/vendedores) únicos e referenciados pelas tabelas de movimento;
+- códigos de categoria no formato do DRE ('1.01.02');
+- tabelas filhas com parent_id/item_index apontando para o pai;
+- datas em TEXT no formato dd/mm/aaaa, como na API do Omie.
+
+Para escalar até milhões de linhas, as colunas comuns vêm de um conjunto
+de linhas-modelo sorteadas; só as chaves são geradas linha a linha.
+"""
+import json
+import random
+import re
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+# Tabelas filhas -> model pai (parent_id = id do pai)
+PARENT_MODELS = {
+    'contapagardistribuicao': 'contapagarcadastro',
+    'contareceberdistribuicao': 'contarecebercadastro',
+    'nfcadastroitens': 'nfcadastro',
+    'pedidovendaitens': 'pedidovendaproduto',
+}
+
+# Cadastros: (divisor de --rows, mínimo, máximo)
+MASTER_SIZES = {
+    'categoriacadastro': (200, 50, 2000),
+    'clientescadastro': (20, 100, None),
+    'contacorrentecadastro': (10000, 10, 200),
+    'familiascadastro': (10000, 20, 200),
+    'locaiscadastro': (10000, 5, 50),
+    'projetoscadastro': (1000, 10, 2000),
+    'vendedorescadastro': (2000, 10, 500),
+}
+
+SQLITE_TYPES = {
+    'BigAutoField': 'INTEGER',
+    'AutoField': 'INTEGER',
+    'IntegerField': 'INTEGER',
+    'ForeignKey': 'INTEGER',
+    'FloatField': 'REAL',
+    'DateTimeField': 'TIMESTAMP',
+}
+
+DATE_COLUMN = re.compile(r'data|ddt|(^|_)d(emissao|emi|iemi|can|inut|reg|saient|alt|inc|fat)$')
+TIME_COLUMN = re.compile(r'hora|(^|_)h(emi|emissao|saient|alt|inc|can|fat)$')
+CATEGORY_COLUMN = re.compile(r'codcateg|codigo_categoria|codigocategoria')
+FLAG_COLUMN = re.compile(
+    r'(^|_)(inativo|bloqueado|bloquear\w*|baixa_bloqueada|cancelado|faturado|encerrado|'
+    r'autorizado|denegado|devolvido\w*|retem_\w+|cret\w+|c\w+retido|disp\w+|padrao|\w*_sn|'
+    r'exterior|pessoa_fisica|contribuinte|optante\w*|produtor_rural|conta_(inativa|despesa|receita)|'
+    r'nao_\w+|definida_pelo_usuario|totalizadora|transferencia|importado_api|reservado|'
+    r'enviar\w*|consumidor_final|utilizar_emails|simples_nacional|liquidado|cliquidado)$'
+)
+
+VOCABULARY = {
+    'status_titulo': ['ABERTO', 'LIQUIDADO', 'ATRASADO', 'CANCELADO', 'A VENCER', 'VENCE HOJE'],
+    'detalhes_cstatus': ['ABERTO', 'LIQUIDADO', 'ATRASADO', 'CANCELADO', 'A VENCER'],
+    'detalhes_cnatureza': ['P', 'R'],
+    'detalhes_corigem': ['MANP', 'MANR', 'PEDV', 'NFE', 'CTR', 'BAIX'],
+    'detalhes_ctipo': ['BOL', 'PIX', 'TRA', 'DIN', 'CRT'],
+    'detalhes_cgrupo': ['CONTA_A_PAGAR', 'CONTA_A_RECEBER', 'TRANSFERENCIA'],
+    'natureza': ['D', 'R'],
+    'tipo_categoria': ['D', 'R', 'T'],
+    'estado': ['SP', 'RJ', 'MG', 'PR', 'SC', 'RS', 'BA', 'GO', 'PE', 'DF'],
+    'cidade': ['SAO PAULO (SP)', 'RIO DE JANEIRO (RJ)', 'BELO HORIZONTE (MG)', 'CURITIBA (PR)',
+               'FLORIANÓPOLIS (SC)', 'PORTO ALEGRE (RS)', 'SALVADOR (BA)', 'GOIÂNIA (GO)'],
+    'prod_ucom': ['UN', 'KG', 'CX', 'PC', 'M'],
+    'produto_unidade': ['UN', 'KG', 'CX', 'PC', 'M'],
+    'cabecalho_cstatusnfse': ['F', 'C', 'E'],
+}
+
+FIRST_WORDS = ['Comércio', 'Indústria', 'Distribuidora', 'Transportes', 'Serviços', 'Construtora',
+               'Agropecuária', 'Metalúrgica', 'Papelaria', 'Farmácia', 'Padaria', 'Oficina']
+SECOND_WORDS = ['São José', 'Aliança', 'Horizonte', 'Paraná', 'Atlântico', 'Boa Vista', 'Ipê',
+                'Conceição', 'Avenida', 'Brasil', 'Nordeste', 'União', 'Ação', 'Campo Verde']
+LAST_WORDS = ['Ltda', 'S/A', 'ME', 'EIRELI', 'EPP']
+PRODUCT_WORDS = ['Parafuso', 'Cabo', 'Tinta', 'Luva', 'Filtro', 'Correia', 'Válvula', 'Sensor',
+                 'Papel', 'Caixa', 'Óleo', 'Tubo', 'Chapa', 'Mangueira', 'Lâmpada']
+
+
+def is_child(model):
+    return model._meta.model_name in PARENT_MODELS
+
+
+def table_sizes(models, rows, items):
+    """Quantidade de linhas por model (filhos: estimativa média)"""
+    sizes = {}
+    for model in models:
+        name = model._meta.model_name
+        if name in MASTER_SIZES:
+            divisor, minimum, maximum = MASTER_SIZES[name]
+            size = max(rows // divisor, minimum)
+            sizes[name] = min(size, maximum) if maximum else size
+        elif is_child(model):
+            sizes[name] = rows * items
+        else:
+            sizes[name] = rows
+    return sizes
+
+
+def key_codes(models):
+    """{(model, coluna): base} dos códigos referenciados por ForeignKeys"""
+    bases = {}
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if field.is_relation:
+                target = field.related_model._meta.get_field(field.to_fields[0] or 'id')
+                key = (field.related_model._meta.model_name, target.column)
+                bases.setdefault(key, 10 ** 6 * (len(bases) + 1))
+    return bases
+
+
+def category_code(index):
+    """Código de categoria no formato do DRE para o índice (1, 2, ...)"""
+    index -= 1
+    return f'{1 + index // 10000}.{(index // 100) % 100 + 1:02d}.{index % 100 + 1:02d}'
+
+
+class ValueFactory:
+    """Gera valores plausíveis para as colunas comuns a partir do nome"""
+
+    def __init__(self, rng, categories, start=date(2019, 1, 1), days=365 * 7):
+        self.rng = rng
+        self.categories = categories
+        self.start = start
+        self.days = days
+
+    def company_name(self):
+        rng = self.rng
+        return f'{rng.choice(FIRST_WORDS)} {rng.choice(SECOND_WORDS)} {rng.choice(LAST_WORDS)}'
+
+    def document(self):
+        digits = f'{self.rng.randrange(10 ** 14):014d}'
+        return f'{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}'
+
+    def text(self, field):
+        column = field.column
+        rng = self.rng
+        if column in VOCABULARY:
+            return rng.choice(VOCABULARY[column])
+        if DATE_COLUMN.search(column):
+            return (self.start + timedelta(days=rng.randrange(self.days))).strftime('%d/%m/%Y')
+        if TIME_COLUMN.search(column):
+            return f'{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}'
+        if CATEGORY_COLUMN.search(column):
+            return category_code(rng.randint(1, self.categories))
+        if FLAG_COLUMN.search(column):
+            return 'S' if rng.random() < 0.15 else 'N'
+        if column.endswith('_json') or column in ('titulos', 'tags', 'departamentos'):
+            return json.dumps([{'item': rng.randrange(1000)}])
+        if column == 'cxml':
+            number = rng.randrange(10 ** 6)
+            return f'<nfeProc><NFe><infNFe Id="NFe{number}"><ide><nNF>{number}</nNF></ide></infNFe></NFe></nfeProc>'
+        if 'cnpj' in column or 'cpf' in column:
+            return self.document()
+        if 'email' in column:
+            return f'contato{rng.randrange(10 ** 5)}@example.com.br'
+        if 'razao' in column or 'fantasia' in column or column.endswith('nome') or 'destinatario' in column:
+            return self.company_name()
+        if 'prod' in column and ('xprod' in column or 'descricao' in column):
+            return f'{rng.choice(PRODUCT_WORDS)} {rng.choice(SECOND_WORDS)} {rng.randrange(100)}'
+        if 'descricao' in column or column in ('nomefamilia', 'cdesdep', 'observacao'):
+            return f'{rng.choice(PRODUCT_WORDS)} {rng.choice(SECOND_WORDS)}'
+        if 'numero' in column or 'codigo' in column or 'cod' in column or column.startswith('n'):
+            return str(rng.randrange(10 ** 6))
+        return f'{rng.choice(SECOND_WORDS)} {rng.randrange(1000)}'
+
+    def value(self, field):
+        kind = field.get_internal_type()
+        rng = self.rng
+        if kind == 'TextField':
+            return self.text(field)
+        if kind == 'FloatField':
+            return round(rng.uniform(1, 50000), 2)
+        if kind == 'IntegerField':
+            return rng.randrange(1, 100000)
+        if kind == 'DateTimeField':
+            moment = self.start + timedelta(days=rng.randrange(self.days))
+            return f'{moment.isoformat()} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00'
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Gera um backup SQLite sintético com todas as tabelas do core'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Arquivo .db a gerar')
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Linhas por tabela de movimento (cadastros e filhos escalam a partir dela)')
+        parser.add_argument('--items', type=int, default=3,
+                            help='Média de filhos por registro pai (parent_id)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente para resultados reproduzíveis')
+        parser.add_argument('--pool', type=int, default=4096,
+                            help='Linhas-modelo sorteadas para as colunas comuns')
+        parser.add_argument('--batch', type=int, default=10000, help='Linhas por executemany')
+        parser.add_argument('--force', action='store_true', help='Sobrescreve o arquivo existente')
+
+    def handle(self, *args, **options):
+        output = Path(options['output'])
+        if output.exists():
+            if not options['force']:
+                raise CommandError(f'{output} já existe (use --force para sobrescrever)')
+            output.unlink()
+        if options['rows'] < 1 or options['items'] < 1:
+            raise CommandError('--rows e --items devem ser positivos')
+
+        models = [model for model in apps.get_app_config('core').get_models() if not model._meta.managed]
+        # Pais antes dos filhos, para saber quantos registros pai existem
+        models.sort(key=is_child)
+        self.rng = random.Random(options['seed'])
+        self.sizes = table_sizes(models, options['rows'], options['items'])
+        self.codes = key_codes(models)
+        self.values = ValueFactory(self.rng, self.sizes['categoriacadastro'])
+
+        temporary = output.with_name(f'.{output.name}.tmp')
+        conn = sqlite3.connect(temporary)
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        started = time.perf_counter()
+        total = 0
+        try:
+            for model in models:
+                count = self.generate_table(conn, model, options)
+                total += count
+                self.stdout.write(f'{model._meta.db_table:<28} {count:>12,} linhas')
+            conn.commit()
+        finally:
+            conn.close()
+        temporary.replace(output)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{output}: {total:,} linhas em {elapsed:.1f}s ({output.stat().st_size / 2 ** 20:.1f} MiB)'
+        ))
+
+    def generate_table(self, conn, model, options):
+        """Cria e preenche a tabela do model; retorna a quantidade de linhas"""
+        fields = model._meta.concrete_fields
+        columns = ', '.join(
+            f'"{field.column}" {SQLITE_TYPES.get(field.get_internal_type(), "TEXT")}'
+            + (' PRIMARY KEY' if field.primary_key else '')
+            for field in fields
+        )
+        table = model._meta.db_table
+        conn.execute(f'CREATE TABLE "{table}" ({columns})')
+
+        pool = [[self.values.value(field) for field in fields] for _ in range(options['pool'])]
+        keys = self.key_generators(model, fields)
+        insert = f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(fields))})'
+
+        batch = []
+        count = 0
+        for row_id, extra in self.row_ids(model):
+            row = list(pool[self.rng.randrange(len(pool))])
+            row[0] = row_id
+            for position, generator in keys:
+                row[position] = generator(row_id, extra)
+            batch.append(row)
+            count += 1
+            if len(batch) >= options['batch']:
+                conn.executemany(insert, batch)
+                batch.clear()
+        if batch:
+            conn.executemany(insert, batch)
+        return count
+
+    def row_ids(self, model):
+        """(id, (parent_id, item_index)) de cada linha; extra é None nas tabelas sem pai"""
+        name = model._meta.model_name
+        if not is_child(model):
+            for row_id in range(1, self.sizes[name] + 1):
+                yield row_id, None
+            return
+        items = self.sizes[name] // self.sizes[PARENT_MODELS[name]]
+        row_id = 0
+        for parent_id in range(1, self.sizes[PARENT_MODELS[name]] + 1):
+            for item_index in range(self.rng.randint(1, 2 * items - 1)):
+                row_id += 1
+                yield row_id, (parent_id, item_index)
+
+    def key_generators(self, model, fields):
+        """[(posição, gerador(id, extra))] das colunas de chave do model"""
+        rng = self.rng
+        name = model._meta.model_name
+        generators = []
+        for position, field in enumerate(fields):
+            if field.primary_key:
+                continue
+            if (name, field.column) in self.codes:
+                base = self.codes[(name, field.column)]
+                generators.append((position, lambda row_id, extra, base=base: base + row_id))
+            elif field.is_relation:
+                target = field.related_model._meta
+                base = self.codes[(target.model_name, target.get_field(field.to_fields[0] or 'id').column)]
+                size = self.sizes[target.model_name]
+                generators.append((position, lambda row_id, extra, base=base, size=size:
+                                   None if rng.random() < 0.05 else base + rng.randint(1, size)))
+            elif field.column == 'parent_id' and is_child(model):
+                generators.append((position, lambda row_id, extra: extra[0]))
+            elif field.column == 'item_index' and is_child(model):
+                generators.append((position, lambda row_id, extra: extra[1]))
+            elif name == 'categoriacadastro' and field.column == 'codigo':
+                generators.append((position, lambda row_id, extra: float(row_id)))
+            elif name == 'categoriacadastro' and field.column in ('codigo_dre', 'dadosdre_codigodre'):
+                generators.append((position, lambda row_id, extra: category_code(row_id)))
+        return generators
@@ -0,0 +1,77 @@
+"""
+Instala um novo snapshot de backup sem reiniciar os workers.
+
+O arquivo é copiado para BACKUP_DIR como '<empresa>.<versão>.db' através de
+um arquivo temporário renomeado atomicamente; os processos em execução
+trocam para ele na próxima verificação do registro (core/registry.py).
+Com ``--index``, os índices do admin (core/indexes.py) são criados na cópia
+antes da troca; com ``--search``, o índice de busca FTS5 (core/search.py)
+é gerado antes de o snapshot ficar visível.
+"""
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.backups import new_snapshot_path, prune_snapshots, search_index_path
+from core.indexes import apply_index_plan, index_plan
+from core.search import build_search_index
+
+
+class Command(BaseCommand):
+    help = 'Instala um novo snapshot de backup de uma empresa em BACKUP_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company', help='Alias da empresa (ex.: cdg)')
+        parser.add_argument('file', help='Arquivo .db entregue')
+        parser.add_argument('--keep', type=int, default=2,
+                            help='Snapshots mantidos por empresa, incluindo o novo (0 = todos)')
+        parser.add_argument('--index', action='store_true',
+                            help='Cria os índices usados pelo admin antes de instalar')
+        parser.add_argument('--search', action='store_true',
+                            help='Gera o índice de busca FTS5 antes de instalar')
+
+    def handle(self, *args, **options):
+        company = options['company']
+        source = Path(options['file'])
+        if not source.is_file():
+            raise CommandError(f'Arquivo não encontrado: {source}')
+        if '.' in company:
+            raise CommandError('O alias da empresa não pode conter ".".')
+
+        backup_dir = Path(settings.BACKUP_DIR)
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        target = new_snapshot_path(backup_dir, company)
+        temporary = backup_dir / f'.{target.name}.tmp'
+
+        # Cópia + rename: os workers nunca enxergam um arquivo pela metade
+        shutil.copyfile(source, temporary)
+        if options['index']:
+            conn = sqlite3.connect(temporary)
+            try:
+                created = apply_index_plan(conn, index_plan())
+            finally:
+                conn.close()
+            self.stdout.write(f'{company}: {len(created)} índice(s) criado(s)')
+        if options['search']:
+            # O índice vai para o lugar antes do snapshot: a primeira conexão já o anexa
+            search_temporary = backup_dir / f'.{search_index_path(target).name}.tmp'
+            built = build_search_index(temporary, search_temporary)
+            os.replace(search_temporary, search_index_path(target))
+            self.stdout.write(f'{company}: índice de busca de {len(built)} tabela(s)')
+        os.replace(temporary, target)
+        self.stdout.write(self.style.SUCCESS(f'{company}: snapshot instalado em {target}'))
+
+        if options['keep'] > 0:
+            self.prune(backup_dir, company, options['keep'])
+
+    def prune(self, backup_dir, company, keep):
+        """Remove os snapshots mais antigos da empresa"""
+        for path, error in prune_snapshots(backup_dir, company, keep):
+            if error:
+                self.stderr.write(f'{path.name}: não removido ({error})')
+            else:
+                self.stdout.write(f'{path.name}: removido')
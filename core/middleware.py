@@ -1,9 +1,18 @@
 """
 Middleware para seleção de banco de dados.
-Captura o banco selecionado da sessão e configura para o router.
+Identifica a empresa da requisição (URL ou cookie) e configura para o router.
 """
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
-from .routers import set_current_database
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.cache import patch_vary_headers
+from .perf import QueryProfile, perf_history
+from .registry import available_databases, backup_registry
+from .routers import get_current_database, reset_current_database, set_current_database
+from .sites import resolve_company
 
 
 class COOPDisableMiddleware:
@@ -29,29 +38,108 @@ class COOPDisableMiddleware:
 
 class DatabaseSelectorMiddleware:
     """
-    Middleware que lê o banco de dados selecionado da sessão
-    e configura para uso no router.
+    Middleware que identifica a empresa da requisição e configura para
+    uso no router.
+
+    A empresa vem do prefixo /admin/<empresa>/ ou do cookie assinado do
+    seletor (ver core/sites.py), sem consultar a sessão no banco.
+
+    Funciona em modo síncrono (WSGI) e assíncrono (ASGI). O banco é definido
+    em uma ContextVar no início da requisição e restaurado ao final, então
+    requisições concorrentes na mesma thread ou event loop não se misturam.
     """
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
     
     def __call__(self, request):
-        # Obter banco da sessão ou usar padrão
-        db_alias = request.session.get('selected_database', 'cdg')
-        
-        # Validar se o banco existe
-        available_dbs = list(settings.DATABASE_NAMES.keys())
-        if db_alias not in available_dbs:
-            db_alias = 'cdg'
-        
-        # Configurar o banco para esta requisição
-        set_current_database(db_alias)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.select_database(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_current_database(token)
+        return self.process_response(request, response)
+    
+    async def __acall__(self, request):
+        token = self.select_database(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_current_database(token)
+        return self.process_response(request, response)
+    
+    def select_database(self, request):
+        """Configura o banco da requisição e retorna o token do contexto"""
+        db_alias, source = resolve_company(request)
+        available_dbs = available_databases()
         
         # Adicionar informação ao request para uso nos templates
         request.current_database = db_alias
-        request.current_database_name = settings.DATABASE_NAMES.get(db_alias, db_alias)
-        request.available_databases = settings.DATABASE_NAMES
+        request.current_database_name = available_dbs.get(db_alias, db_alias)
+        request.current_database_source = source
+        request.available_databases = available_dbs
         
-        response = self.get_response(request)
+        # Configurar o banco para esta requisição, fixando o snapshot atual:
+        # se um backup novo for instalado, esta requisição termina no antigo
+        backup_registry.refresh()
+        return set_current_database(backup_registry.alias_for(db_alias))
+    
+    def process_response(self, request, response):
+        # Fora do prefixo /admin/<empresa>/ a empresa vem do cookie ou do
+        # padrão (sem cookie): a mesma URL muda de conteúdo conforme ele
+        if request.current_database_source != 'url':
+            patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Middleware que mede as queries SQL de cada requisição por alias de banco.
+
+    Deve vir depois do DatabaseSelectorMiddleware para saber o snapshot da
+    requisição. Adiciona o header Server-Timing (visível no DevTools) e
+    registra o resumo no histórico exibido em /admin/perf/.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_queries = getattr(settings, 'PERF_SLOW_QUERIES', 5)
+    
+    def __call__(self, request):
+        profile = QueryProfile(self.slow_queries)
+        aliases = {DEFAULT_DB_ALIAS, get_current_database()}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(profile))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        
+        response['Server-Timing'] = profile.server_timing(total_ms)
+        self.record(request, response, profile, total_ms)
         return response
+    
+    def record(self, request, response, profile, total_ms):
+        """Guarda o resumo da requisição no histórico"""
+        match = getattr(request, 'resolver_match', None)
+        model_admin = getattr(match.func, 'model_admin', None) if match else None
+        summary = profile.summary()
+        perf_history.record({
+            'time': time.time(),
+            'method': request.method,
+            'path': request.get_full_path()[:300],
+            'status': response.status_code,
+            'view': match.view_name if match else None,
+            'model_admin': type(model_admin).__name__ if model_admin else None,
+            'company': getattr(request, 'current_database', None),
+            'total_ms': round(total_ms, 2),
+            'queries': sum(stats['count'] for stats in summary.values()),
+            'sql_ms': round(sum(stats['ms'] for stats in summary.values()), 2),
+            'aliases': summary,
+        })
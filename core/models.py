@@ -5,8 +5,11 @@
 #   * Make sure each ForeignKey and OneToOneField has `on_delete` set to the desired behavior
 #   * Remove `managed = False` lines if you wish to allow Django to create, modify, and delete the table
 # Feel free to rename the models, but don't rename db_table values or field names.
+from django.conf import settings
 from django.db import models
 
+from .consolidated import CompanyForeignKey
+
 
 class CategoriaCadastro(models.Model):
     categoria_superior = models.FloatField(blank=True, null=True)
@@ -206,7 +209,7 @@ class ContaPagarCadastro(models.Model):
     codigo_categoria = models.TextField(blank=True, null=True)
     
     # ForeignKeys para relacionamentos
-    cliente = models.ForeignKey(
+    cliente = CompanyForeignKey(
         'ClientesCadastro',
         on_delete=models.DO_NOTHING,
         db_column='codigo_cliente_fornecedor',
@@ -216,7 +219,7 @@ class ContaPagarCadastro(models.Model):
         null=True,
         db_constraint=False
     )
-    projeto = models.ForeignKey(
+    projeto = CompanyForeignKey(
         'ProjetosCadastro',
         on_delete=models.DO_NOTHING,
         db_column='codigo_projeto',
@@ -226,7 +229,7 @@ class ContaPagarCadastro(models.Model):
         null=True,
         db_constraint=False
     )
-    vendedor = models.ForeignKey(
+    vendedor = CompanyForeignKey(
         'VendedoresCadastro',
         on_delete=models.DO_NOTHING,
         db_column='codigo_vendedor',
@@ -309,7 +312,7 @@ class ContaReceberCadastro(models.Model):
     codigo_categoria = models.TextField(blank=True, null=True)
     
     # ForeignKeys para relacionamentos
-    cliente = models.ForeignKey(
+    cliente = CompanyForeignKey(
         'ClientesCadastro',
         on_delete=models.DO_NOTHING,
         db_column='codigo_cliente_fornecedor',
@@ -319,7 +322,7 @@ class ContaReceberCadastro(models.Model):
         null=True,
         db_constraint=False
     )
-    projeto_rel = models.ForeignKey(
+    projeto_rel = CompanyForeignKey(
         'ProjetosCadastro',
         on_delete=models.DO_NOTHING,
         db_column='codigo_projeto',
@@ -329,7 +332,7 @@ class ContaReceberCadastro(models.Model):
         null=True,
         db_constraint=False
     )
-    vendedor_rel = models.ForeignKey(
+    vendedor_rel = CompanyForeignKey(
         'VendedoresCadastro',
         on_delete=models.DO_NOTHING,
         db_column='codigo_vendedor',
@@ -474,7 +477,7 @@ class MovimentosFinanceiros(models.Model):
     detalhes_ctipo = models.TextField(blank=True, null=True)
     
     # ForeignKeys para relacionamentos
-    cliente = models.ForeignKey(
+    cliente = CompanyForeignKey(
         'ClientesCadastro',
         on_delete=models.DO_NOTHING,
         db_column='detalhes_ncodcliente',
@@ -484,7 +487,7 @@ class MovimentosFinanceiros(models.Model):
         null=True,
         db_constraint=False
     )
-    conta_corrente = models.ForeignKey(
+    conta_corrente = CompanyForeignKey(
         'ContaCorrenteCadastro',
         on_delete=models.DO_NOTHING,
         db_column='detalhes_ncodcc',
@@ -494,7 +497,7 @@ class MovimentosFinanceiros(models.Model):
         null=True,
         db_constraint=False
     )
-    vendedor = models.ForeignKey(
+    vendedor = CompanyForeignKey(
         'VendedoresCadastro',
         on_delete=models.DO_NOTHING,
         db_column='detalhes_ccodvendedor',
@@ -504,7 +507,7 @@ class MovimentosFinanceiros(models.Model):
         null=True,
         db_constraint=False
     )
-    projeto = models.ForeignKey(
+    projeto = CompanyForeignKey(
         'ProjetosCadastro',
         on_delete=models.DO_NOTHING,
         db_column='detalhes_ccodprojeto',
@@ -1156,7 +1159,7 @@ class PedidoVendaProduto(models.Model):
     cabecalho_data_previsao = models.TextField(blank=True, null=True)
     
     # ForeignKeys para relacionamentos
-    cliente = models.ForeignKey(
+    cliente = CompanyForeignKey(
         'ClientesCadastro',
         on_delete=models.DO_NOTHING,
         db_column='cabecalho_codigo_cliente',
@@ -1166,7 +1169,7 @@ class PedidoVendaProduto(models.Model):
         null=True,
         db_constraint=False
     )
-    vendedor = models.ForeignKey(
+    vendedor = CompanyForeignKey(
         'VendedoresCadastro',
         on_delete=models.DO_NOTHING,
         db_column='informacoes_adicionais_codvend',
@@ -1176,7 +1179,7 @@ class PedidoVendaProduto(models.Model):
         null=True,
         db_constraint=False
     )
-    projeto = models.ForeignKey(
+    projeto = CompanyForeignKey(
         'ProjetosCadastro',
         on_delete=models.DO_NOTHING,
         db_column='informacoes_adicionais_codproj',
@@ -1378,3 +1381,56 @@ class VendedoresCadastro(models.Model):
     class Meta:
         managed = False
         db_table = 'vendedores_cadastro'
+
+
+class ExportJob(models.Model):
+    """
+    Exportação executada em segundo plano (core/jobs.py). Fica no banco
+    'default', não nos backups: guarda o pedido (empresa, model, filtros da
+    listagem e colunas), o progresso e o arquivo gerado.
+    """
+    PENDING = 'pendente'
+    RUNNING = 'executando'
+    DONE = 'concluido'
+    FAILED = 'erro'
+    STATUS_CHOICES = [
+        (PENDING, 'Na fila'),
+        (RUNNING, 'Em andamento'),
+        (DONE, 'Concluída'),
+        (FAILED, 'Erro'),
+    ]
+    FORMAT_CHOICES = [('xlsx', 'Excel'), ('csv', 'CSV'), ('ndjson', 'NDJSON')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    company = models.CharField(max_length=100)
+    model = models.CharField(max_length=100)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    query_string = models.TextField(blank=True, default='')
+    columns = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    total_rows = models.IntegerField(blank=True, null=True)
+    rows_done = models.IntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True, default='')
+    file_size = models.BigIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Último sinal de vida do processo que executa o job (ver core/jobs.py)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Exportação {self.pk} ({self.model}, {self.company})"
+
+    @property
+    def progress(self):
+        """Percentual concluído (None enquanto o total não é conhecido)"""
+        if self.status == self.DONE:
+            return 100
+        if not self.total_rows:
+            return None
+        return min(99, self.rows_done * 100 // self.total_rows)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'created_at'])]
@@ -0,0 +1,357 @@
+"""
+ModelAdmin base dos models do core.
+
+Além do suporte ao modo consolidado, descobre sozinho as ForeignKeys que a
+listagem e a exportação usam: os métodos do list_display são analisados
+(AST) atrás de acessos ``obj.<fk>`` / ``obj.<fk>.<fk>`` e as relações
+encontradas entram no select_related, sem uma query extra por linha.
+A mesma análise diz quais colunas cada item lê (``display_fields``), para a
+exportação buscar só elas.
+"""
+import ast
+import functools
+import inspect
+import textwrap
+
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.urls import path, reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
+
+from .autocomplete import autocomplete_search, is_autocomplete
+from .consolidated import ConsolidatedAdminMixin
+from .exports import FORMATS, ExportChangeList, changelist_export, is_export
+from .filters import cached_list_filter
+from .group_exports import group_export
+from .jobs import can_enqueue, create_job
+from .pages import cached_page
+from .pagination import SnapshotChangeList, SnapshotCountPaginator
+from .search import full_text_search
+
+
+def forward_relation(model, name):
+    """Campo ForeignKey/OneToOne ``name`` do model (None se não for relação direta)"""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    # get_field() também aceita o attname ('cliente_id'), que é só o valor da coluna
+    if field.name != name:
+        return None
+    if field.is_relation and (field.many_to_one or field.one_to_one) and field.concrete:
+        return field
+    return None
+
+
+def relation_path(model, names):
+    """Maior prefixo de ``names`` formado por relações diretas, como 'a__b'"""
+    parts = []
+    for name in names:
+        field = forward_relation(model, name)
+        if field is None:
+            break
+        parts.append(name)
+        model = field.related_model
+    return '__'.join(parts) or None
+
+
+def _function_node(func):
+    try:
+        source = textwrap.dedent(inspect.getsource(func))
+        node = ast.parse(source).body[0]
+    except (OSError, TypeError, SyntaxError, IndexError):
+        return None
+    return node if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) else None
+
+
+def accessed_relations(func, model, target_index, owner=None, seen=None):
+    """
+    Relações acessadas pela função através do argumento de índice
+    ``target_index`` (o ``obj`` de um método do ModelAdmin, o ``self`` de um
+    método do model). Segue chamadas ``self.metodo(obj)`` do mesmo owner.
+    """
+    seen = seen if seen is not None else set()
+    if func in seen:
+        return set()
+    seen.add(func)
+    node = _function_node(func)
+    if node is None or len(node.args.args) <= target_index:
+        return set()
+    target = node.args.args[target_index].arg
+    self_name = node.args.args[0].arg if node.args.args else None
+
+    paths = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Attribute):
+            chain = []
+            current = child
+            while isinstance(current, ast.Attribute):
+                chain.append(current.attr)
+                current = current.value
+            if isinstance(current, ast.Name) and current.id == target:
+                path = relation_path(model, reversed(chain))
+                if path:
+                    paths.add(path)
+        elif (
+            owner is not None and isinstance(child, ast.Call)
+            and isinstance(child.func, ast.Attribute)
+            and isinstance(child.func.value, ast.Name) and child.func.value.id == self_name
+            and any(isinstance(arg, ast.Name) and arg.id == target for arg in child.args)
+        ):
+            helper = getattr(owner, child.func.attr, None)
+            if callable(helper):
+                paths |= accessed_relations(inspect.unwrap(helper), model, target_index, owner, seen)
+    return paths
+
+
+def list_display_relations(model_admin, list_display):
+    """Relações (caminhos para select_related) usadas pelos itens do list_display"""
+    model = model_admin.model
+    paths = set()
+    for item in list_display:
+        if callable(item):
+            paths |= accessed_relations(inspect.unwrap(item), model, 0)
+        elif hasattr(model_admin, item):
+            # Método do ModelAdmin: (self, obj)
+            method = inspect.unwrap(getattr(type(model_admin), item))
+            paths |= accessed_relations(method, model, 1, owner=type(model_admin))
+        elif '__' in item:
+            path = relation_path(model, item.split('__'))
+            if path:
+                paths.add(path)
+        elif forward_relation(model, item):
+            paths.add(item)
+        else:
+            attribute = inspect.getattr_static(model, item, None)
+            if isinstance(attribute, property):
+                attribute = attribute.fget
+            if callable(attribute):
+                # Método ou property do model: (self)
+                paths |= accessed_relations(inspect.unwrap(attribute), model, 0, owner=model)
+    return paths
+
+
+class UnknownAccess(Exception):
+    """O objeto é usado de um jeito que a análise do código não acompanha"""
+
+
+def field_path(model, names):
+    """
+    Caminho ('fk__campo') lido por ``obj.<names>``: o campo concreto, ou a
+    relação quando a cadeia termina nela. None para atributos que não são
+    do model (anotações como ``company``); propriedades, métodos e relações
+    reversas levantam UnknownAccess.
+    """
+    parts = []
+    for name in names:
+        if name == 'pk':
+            name = model._meta.pk.name
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            if parts or hasattr(model, name):
+                raise UnknownAccess(name)
+            return None
+        if not field.concrete:
+            raise UnknownAccess(name)
+        parts.append(field.name)
+        if forward_relation(model, field.name) is None:
+            return '__'.join(parts)
+        model = field.related_model
+    return '__'.join(parts)
+
+
+def _is_test(node, parents):
+    """Indica se o valor do nó só é testado (``if obj.fk:``, ``obj.fk is None``), sem ser usado"""
+    parent = parents.get(node)
+    if isinstance(parent, (ast.If, ast.IfExp, ast.While)):
+        return parent.test is node
+    if isinstance(parent, ast.BoolOp):
+        return _is_test(parent, parents)
+    return isinstance(parent, ast.Compare) or (isinstance(parent, ast.UnaryOp) and isinstance(parent.op, ast.Not))
+
+
+def accessed_fields(func, model, target_index, owner=None, seen=None):
+    """
+    Caminhos dos campos lidos pela função através do argumento de índice
+    ``target_index`` (como em accessed_relations). Levanta UnknownAccess se
+    o objeto (ou uma relação dele) é usado inteiro: passado a outra função,
+    devolvido, convertido em texto...
+    """
+    seen = seen if seen is not None else set()
+    if func in seen:
+        return set()
+    seen.add(func)
+    node = _function_node(func)
+    if node is None or len(node.args.args) <= target_index:
+        raise UnknownAccess(getattr(func, '__name__', func))
+    target = node.args.args[target_index].arg
+    self_name = node.args.args[0].arg if node.args.args else None
+    parents = {child: parent for parent in ast.walk(node) for child in ast.iter_child_nodes(parent)}
+
+    paths = set()
+    for child in ast.walk(node):
+        if not (isinstance(child, ast.Name) and child.id == target and isinstance(child.ctx, ast.Load)):
+            continue
+        parent = parents.get(child)
+        if isinstance(parent, ast.Attribute):
+            chain = []
+            current = child
+            while isinstance(parents.get(current), ast.Attribute):
+                current = parents[current]
+                chain.append(current.attr)
+            path = field_path(model, chain)
+            if path is None:
+                continue
+            # ``obj.fk_id`` (o attname) lê só o valor da coluna, não o objeto relacionado
+            attname = chain[path.count('__')] != path.rsplit('__', 1)[-1]
+            if relation_path(model, path.split('__')) == path and not attname and not _is_test(current, parents):
+                raise UnknownAccess(path)
+            paths.add(path)
+        elif isinstance(parent, ast.Call) and child in parent.args:
+            function = parent.func
+            if (
+                isinstance(function, ast.Name) and function.id == 'getattr' and parent.args[0] is child
+                and len(parent.args) > 1 and isinstance(parent.args[1], ast.Constant)
+            ):
+                path = field_path(model, [parent.args[1].value])
+                if path is not None:
+                    paths.add(path)
+            elif (
+                owner is not None and isinstance(function, ast.Attribute)
+                and isinstance(function.value, ast.Name) and function.value.id == self_name
+                and callable(getattr(owner, function.attr, None))
+            ):
+                helper = inspect.unwrap(getattr(owner, function.attr))
+                paths |= accessed_fields(helper, model, target_index, owner, seen)
+            else:
+                raise UnknownAccess(target)
+        elif not _is_test(child, parents):
+            raise UnknownAccess(target)
+    return paths
+
+
+class OmieModelAdmin(ConsolidatedAdminMixin, admin.ModelAdmin):
+    """
+    ModelAdmin base do core: modo consolidado, select_related derivado
+    do list_display (somado ao list_select_related declarado) e contagens
+    em cache por snapshot (core/pagination.py). A busca usa o índice FTS5
+    do snapshot quando existir (core/search.py) e os filtros por valor usam
+    as opções em cache (core/filters.py). Listagens e detalhes passam pelo
+    cache de páginas (core/pages.py).
+
+    ``keyset_pagination`` liga a navegação por cursor nas tabelas grandes;
+    ``autocomplete_index`` responde o autocomplete pelo índice em memória
+    (core/autocomplete.py). ``export/csv/`` e ``export/ndjson/`` exportam
+    o changelist com os filtros da query string (core/exports.py);
+    ``export/empresas/`` faz o mesmo em Excel para todas as empresas
+    (core/group_exports.py).
+    """
+    paginator = SnapshotCountPaginator
+    keyset_pagination = False
+    autocomplete_index = False
+
+    def __init__(self, model, admin_site):
+        super().__init__(model, admin_site)
+        self.derived_select_related = sorted(list_display_relations(self, self.list_display))
+        self._display_fields = {}
+
+    def display_fields(self, name):
+        """
+        Caminhos ('campo', 'fk__campo') das colunas lidas pelo método
+        ``name`` do ModelAdmin, ou None quando a análise não consegue dizer.
+        """
+        if name not in self._display_fields:
+            method = inspect.unwrap(getattr(type(self), name))
+            try:
+                self._display_fields[name] = accessed_fields(method, self.model, 1, owner=type(self))
+            except UnknownAccess:
+                self._display_fields[name] = None
+        return self._display_fields[name]
+
+    def get_list_select_related(self, request):
+        declared = super().get_list_select_related(request)
+        if declared is True:
+            return True
+        return sorted(set(declared or ()) | set(self.derived_select_related)) or declared
+
+    def get_list_filter(self, request):
+        return [cached_list_filter(self.model, item) for item in super().get_list_filter(request)]
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.autocomplete_index and search_term and is_autocomplete(request):
+            pks = autocomplete_search(self, request, search_term)
+            if pks is not None:
+                return queryset.filter(pk__in=pks), False
+        ranked = full_text_search(queryset, self.get_search_fields(request), search_term)
+        if ranked is None:
+            return super().get_search_results(request, queryset, search_term)
+        return ranked, False
+
+    def get_changelist(self, request, **kwargs):
+        return ExportChangeList if is_export(request) else SnapshotChangeList
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path(
+                'export/empresas/',
+                self.admin_site.admin_view(self.export_companies_view),
+                name='%s_%s_export_companies' % info,
+            ),
+            path(
+                'export/job/',
+                self.admin_site.admin_view(self.export_job_view),
+                name='%s_%s_export_job' % info,
+            ),
+            path(
+                'export/<str:format>/',
+                self.admin_site.admin_view(self.export_view),
+                name='%s_%s_export' % info,
+            ),
+            *super().get_urls(),
+        ]
+
+    def export_view(self, request, format):
+        """CSV ou NDJSON em streaming com os registros do changelist da query string"""
+        if format not in FORMATS:
+            return HttpResponseBadRequest(f'Formato desconhecido: {format}')
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        try:
+            return changelist_export(self, request, format)
+        except (ValueError, IncorrectLookupParameters) as error:
+            return HttpResponseBadRequest(str(error))
+
+    def export_companies_view(self, request):
+        """Excel com uma aba por empresa (lidas em paralelo) e a consolidada, com os filtros da query string"""
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        return group_export(self, request)
+
+    @method_decorator(require_POST)
+    def export_job_view(self, request):
+        """Agenda a exportação do changelist da query string (xlsx, csv ou ndjson) em segundo plano"""
+        format = request.POST.get('format', 'xlsx')
+        if format != 'xlsx' and format not in FORMATS:
+            return HttpResponseBadRequest(f'Formato desconhecido: {format}')
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        if not can_enqueue(request.user):
+            self.message_user(request, 'Aguarde o fim das exportações em andamento.', messages.WARNING)
+        else:
+            try:
+                job = create_job(self, request, format, request.META.get('QUERY_STRING', ''))
+            except ValueError as error:
+                return HttpResponseBadRequest(str(error))
+            self.message_user(request, f'Exportação #{job.pk} agendada.', messages.SUCCESS)
+        return HttpResponseRedirect(reverse('admin_export_jobs'))
+
+    def changelist_view(self, request, extra_context=None):
+        return cached_page(request, functools.partial(super().changelist_view, request, extra_context))
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        return cached_page(request, functools.partial(super().change_view, request, object_id, form_url, extra_context))
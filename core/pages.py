@@ -0,0 +1,102 @@
+"""
+Cache de páginas inteiras do admin do core.
+
+As listagens e os detalhes dependem apenas do snapshot de backup, da URL
+e das permissões de quem olha: a mesma página é servida do cache (já
+renderizada, compactada) para todos os usuários com o mesmo conjunto de
+permissões. A chave usa core/cache.py, então um backup novo troca as
+chaves e as páginas antigas apenas expiram.
+
+Antes de servir uma página guardada, o token CSRF dos formulários e o nome
+em "Bem-vindo, ..." são trocados pelos do usuário atual. Não entram no
+cache: POSTs, respostas que não sejam 200, páginas que mostraram mensagens
+e requisições com ``Cache-Control: no-cache`` (recarregar forçado) ou
+com ``request.skip_page_cache`` (ferramentas de medição, que precisam da
+página renderizada pela view a cada execução).
+"""
+import hashlib
+import re
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.html import escape
+from django.utils.translation import get_language
+
+from .cache import snapshot_key
+
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_WELCOME = re.compile(rb'(id="user-tools">.*?<strong>).*?(</strong>)', re.DOTALL)
+
+
+def page_cache():
+    """Backend do cache de páginas (None se desligado)"""
+    alias = getattr(settings, 'PAGE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def permission_digest(user):
+    """Resumo do que o usuário pode ver: permissões e links do cabeçalho"""
+    permissions = ['*'] if user.is_superuser else sorted(user.get_all_permissions())
+    profile = (user.is_active, user.is_staff, user.has_usable_password(), permissions)
+    return hashlib.blake2b(repr(profile).encode(), digest_size=8).hexdigest()
+
+
+def page_key(request):
+    """Chave: empresa, snapshot, idioma, permissões e URL com a query string"""
+    return snapshot_key('pagina', get_language(), permission_digest(request.user), request.get_full_path())
+
+
+def page_cacheable(request):
+    if getattr(request, 'skip_page_cache', False):
+        return False
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return False
+    # Mensagens pendentes precisam ser exibidas pela página renderizada
+    messages = getattr(request, '_messages', None)
+    if messages is not None and len(messages):
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '')
+
+
+def personalize(content, request):
+    """Troca o token CSRF e o nome do usuário da página guardada pelos atuais"""
+    token = get_token(request).encode()
+    content = _CSRF_INPUT.sub(lambda match: match[1] + token + match[2], content)
+    user = request.user
+    name = escape(user.get_short_name() or user.get_username()).encode()
+    return _WELCOME.sub(lambda match: match[1] + name + match[2], content, count=1)
+
+
+def cached_page(request, view):
+    """Resposta de ``view()`` pelo cache de páginas, quando a requisição permite"""
+    cache = page_cache()
+    if cache is None or not page_cacheable(request):
+        return view()
+    key = page_key(request)
+    cached = cache.get(key)
+    if cached is not None:
+        content_type, content = cached
+        response = HttpResponse(personalize(zlib.decompress(content), request), content_type=content_type)
+        response['X-Page-Cache'] = 'hit'
+        return response
+
+    response = view()
+    if hasattr(response, 'render'):
+        response.render()
+    messages = getattr(request, '_messages', None)
+    # O cookie CSRF é regravado pelo CsrfViewMiddleware ao servir do cache
+    cookies = set(response.cookies) - {settings.CSRF_COOKIE_NAME}
+    if (
+        response.status_code != 200 or response.streaming or cookies
+        or (messages is not None and messages.used)
+    ):
+        return response
+    cache.set(
+        key, (response['Content-Type'], zlib.compress(response.content)),
+        getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60),
+    )
+    response['X-Page-Cache'] = 'miss'
+    return response
@@ -0,0 +1,412 @@
+"""
+Contagens e paginação dos changelists sobre os backups.
+
+Os snapshots não mudam, então o resultado de um COUNT(*) vale enquanto o
+snapshot estiver em uso: as contagens ficam no cache com a chave da
+empresa, do snapshot e do SQL da consulta (filtros, busca).
+
+Tabelas grandes sem filtro não esperam o COUNT(*):
+- com ANALYZE (build_indexes), o total vem de sqlite_stat1, exato para um
+  snapshot imutável;
+- sem estatísticas, usa max(rowid) como estimativa e calcula a contagem
+  exata em segundo plano; as páginas seguintes já usam o valor exato.
+
+Nas tabelas grandes (``keyset_pagination`` no ModelAdmin) a navegação usa
+um cursor com os valores do ordering + pk da última linha exibida em vez
+de OFFSET: a página 4.000 custa o mesmo que a primeira, com os filtros e
+a busca de sempre. Datas em texto ordenadas por ``IsoDate`` entram na
+chave pela data ISO (core/dates.py).
+"""
+import base64
+import functools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import snapshot_cache, snapshot_key
+from .dates import IsoDate, IsoDateHierarchy, iso_date, iso_date_field, iso_date_fields
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'CHANGELIST_COUNT_WORKERS', 2), thread_name_prefix='omie-count',
+)
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def count_key(queryset):
+    """Chave da contagem: empresa, snapshot e SQL (sem ordenação) da consulta"""
+    alias = queryset.db
+    sql, params = queryset.order_by().query.get_compiler(alias).as_sql()
+    return snapshot_key('count', sql, repr(params), alias=alias)
+
+
+def estimated_count(queryset):
+    """(total, exato) pelas estatísticas do SQLite, ou (None, False) se indisponível"""
+    table = queryset.model._meta.db_table
+    try:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            if row:
+                return int(row[0].split()[0]), True
+            cursor.execute(f'SELECT max(rowid) FROM "{table}"')
+            row = cursor.fetchone()
+    except DatabaseError:
+        # Sem sqlite_stat1 (sem ANALYZE) ou view do modo consolidado
+        row = None
+    if row and row[0] is not None:
+        return int(row[0]), False
+    return None, False
+
+
+def _count_in_background(key, queryset):
+    """Calcula a contagem exata em uma thread do pool e guarda no cache"""
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+
+    def run():
+        try:
+            count = queryset.query.get_count(using=queryset.db)
+            snapshot_cache().set(key, count, getattr(settings, 'SNAPSHOT_CACHE_TIMEOUT', None))
+        except Exception:
+            logger.exception('Falha na contagem em segundo plano de %s', queryset.model.__name__)
+        finally:
+            with _pending_lock:
+                _pending.discard(key)
+            connections.close_all()
+
+    _executor.submit(run)
+
+
+def cached_count(queryset, estimate=True):
+    """
+    COUNT(*) da consulta pelo cache do snapshot. Com ``estimate``, consultas
+    sem filtro acima de CHANGELIST_COUNT_ESTIMATE_THRESHOLD linhas podem
+    retornar a estimativa enquanto a contagem exata roda em segundo plano.
+    """
+    # Fixa o alias: a thread do pool não enxerga o contexto da requisição
+    queryset = queryset.using(queryset.db)
+    try:
+        key = count_key(queryset)
+    except EmptyResultSet:
+        # Filtro que nunca casa (ex.: pk__in=[]): nem há SQL para executar
+        return 0
+    cache = snapshot_cache()
+    count = cache.get(key)
+    if count is not None:
+        return count
+
+    timeout = getattr(settings, 'SNAPSHOT_CACHE_TIMEOUT', None)
+    # No modo consolidado sqlite_stat1 só descreve o banco principal
+    federated = connections[queryset.db].settings_dict.get('ATTACH')
+    if estimate and not federated and not queryset.query.where and not queryset.query.distinct:
+        total, exact = estimated_count(queryset)
+        if exact:
+            cache.set(key, total, timeout)
+            return total
+        if total is not None and total >= getattr(settings, 'CHANGELIST_COUNT_ESTIMATE_THRESHOLD', 500000):
+            _count_in_background(key, queryset)
+            return total
+
+    count = queryset.query.get_count(using=queryset.db)
+    cache.set(key, count, timeout)
+    return count
+
+
+class CachedCountQuerySetMixin:
+    """QuerySet cujo count() passa por cached_count()"""
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return cached_count(self)
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_count_class(queryset_class):
+    return type(f'CachedCount{queryset_class.__name__}', (CachedCountQuerySetMixin, queryset_class), {})
+
+
+def with_cached_count(queryset):
+    """Cópia do queryset com count() em cache (mantém a classe original como base)"""
+    clone = queryset._chain()
+    clone.__class__ = _cached_count_class(type(queryset))
+    return clone
+
+
+class SnapshotCountPaginator(Paginator):
+    """Paginator com a contagem em cache por empresa/snapshot/filtros"""
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return cached_count(self.object_list)
+        return super().count
+
+
+# Parâmetro da URL com o cursor da paginação por chave (keyset)
+KEYSET_VAR = 'cursor'
+KEYSET_LAST = 'last'
+
+
+def keyset_columns(model, ordering):
+    """
+    Colunas (attname, decrescente, iso) do ordering, terminando na pk, ou
+    None se o ordering não puder ser usado como chave (expressões que não
+    sejam ``IsoDate``, relações).
+    """
+    opts = model._meta
+    columns = []
+    seen = set()
+    for item in ordering:
+        iso_name = iso_date_field(item)
+        if iso_name and not isinstance(item, IsoDate):
+            try:
+                field = opts.get_field(iso_name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.is_relation:
+                return None
+            if (field.attname, True) not in seen:
+                seen.add((field.attname, True))
+                columns.append((field.attname, item.descending, True))
+            continue
+        if not isinstance(item, str) or item == '?':
+            return None
+        name = item.lstrip('-')
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many or field.one_to_many:
+            return None
+        if (field.attname, False) in seen:
+            # Coluna repetida (ordenação clicada + ordering padrão): vale a primeira
+            continue
+        seen.add((field.attname, False))
+        columns.append((field.attname, item.startswith('-'), False))
+        if field.primary_key:
+            return columns
+    # Sem pk no ordering: desempata pela pk na direção da última coluna
+    columns.append((opts.pk.attname, columns[-1][1] if columns else True, False))
+    return columns
+
+
+def _lookup(attname, iso):
+    """Nome usado nos filtros e na ordenação de uma coluna da chave"""
+    return f'{attname}_iso' if iso else attname
+
+
+def row_key(row, columns):
+    """Valores da chave de uma linha (datas ISO como na consulta)"""
+    return [
+        iso_date(getattr(row, attname)) if iso else getattr(row, attname)
+        for attname, _, iso in columns
+    ]
+
+
+def encode_cursor(values):
+    """Cursor opaco para a URL com os valores da chave de uma linha"""
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, columns):
+    """Valores da chave do cursor, convertidos pelos campos do model"""
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data)
+    except (ValueError, TypeError) as error:
+        raise IncorrectLookupParameters(f'Cursor inválido: {error}')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise IncorrectLookupParameters('Cursor inválido')
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    try:
+        return [
+            value if value is None or iso else fields[attname].to_python(value)
+            for (attname, _, iso), value in zip(columns, values)
+        ]
+    except ValidationError as error:
+        raise IncorrectLookupParameters(error)
+
+
+def seek_segments(columns, values):
+    """
+    Condições, na ordem da listagem, das linhas depois do cursor.
+
+    Cada condição é um intervalo contínuo de um índice sobre as colunas
+    (``a = x AND id < y``, ``a < x``, ``a IS NULL``), então o SQLite
+    posiciona direto no cursor em vez de percorrer as linhas anteriores.
+    No SQLite NULL vem antes em ordem crescente e depois em decrescente.
+    """
+    (attname, descending, iso), rest = columns[0], columns[1:]
+    attname = _lookup(attname, iso)
+    value = values[0]
+    segments = []
+    if rest:
+        equal = Q(**{f'{attname}__isnull': True}) if value is None else Q(**{attname: value})
+        segments += [equal & segment for segment in seek_segments(rest, values[1:])]
+    if descending:
+        if value is not None:
+            segments += [Q(**{f'{attname}__lt': value}), Q(**{f'{attname}__isnull': True})]
+    elif value is None:
+        segments.append(Q(**{f'{attname}__isnull': False}))
+    else:
+        segments.append(Q(**{f'{attname}__gt': value}))
+    return segments
+
+
+def seek(queryset, columns, values, limit, reverse=False):
+    """
+    Até ``limit`` linhas depois do cursor (antes, com ``reverse``), na ordem
+    da listagem; ``values`` None começa do início (do fim, com ``reverse``).
+    """
+    if reverse:
+        columns = [(attname, not descending, iso) for attname, descending, iso in columns]
+    ordering, aliases = [], {}
+    for attname, descending, iso in columns:
+        name = _lookup(attname, iso)
+        ordering.append(f'-{name}' if descending else name)
+        if iso:
+            aliases[name] = IsoDate(attname)
+    queryset = queryset.alias(**aliases).order_by(*ordering)
+    if values is None:
+        rows = list(queryset[:limit])
+    else:
+        rows = []
+        for segment in seek_segments(columns, values):
+            rows += queryset.filter(segment)[:limit - len(rows)]
+            if len(rows) >= limit:
+                break
+    return rows[::-1] if reverse else rows
+
+
+class KeysetPage:
+    """Links de navegação de uma página paginada por chave"""
+
+    def __init__(self, changelist, columns, rows, has_previous, has_next):
+        def link(token):
+            return changelist.get_query_string({KEYSET_VAR: token}, [PAGE_VAR])
+
+        def cursor(row, direction):
+            return f'{direction}.' + encode_cursor(row_key(row, columns))
+
+        self.first_url = changelist.get_query_string(remove=[PAGE_VAR]) if has_previous else None
+        self.previous_url = link(cursor(rows[0], 'b')) if has_previous and rows else None
+        self.next_url = link(cursor(rows[-1], 'a')) if has_next and rows else None
+        self.last_url = link(KEYSET_LAST) if has_next else None
+
+
+class SnapshotChangeList(ChangeList):
+    """
+    ChangeList com as contagens em cache, buscas por relevância, datas em
+    texto como ISO (``iso_date_hierarchy``, ordenação pelas colunas) e, nos
+    ModelAdmins com ``keyset_pagination``, navegação por cursor (``?cursor=``).
+    """
+    keyset = None
+    keyset_cursor = None
+    iso_hierarchy = None
+
+    def get_queryset(self, request, exclude_parameters=None):
+        # O cursor não é filtro: sai dos parâmetros antes de montar os filtros
+        if KEYSET_VAR in self.filter_params:
+            self.keyset_cursor = self.params.pop(KEYSET_VAR, None)
+            del self.filter_params[KEYSET_VAR]
+        field_name = getattr(self.model_admin, 'iso_date_hierarchy', None)
+        if field_name and self.iso_hierarchy is None:
+            self.iso_hierarchy = IsoDateHierarchy(field_name, self.params)
+        queryset = super().get_queryset(request, exclude_parameters)
+        if self.iso_hierarchy:
+            queryset = self.iso_hierarchy.queryset(queryset)
+        return queryset
+
+    def get_filters_params(self, params=None):
+        # Os parâmetros da hierarquia são aplicados pela data ISO, não como lookups
+        lookup_params = super().get_filters_params(params)
+        if self.iso_hierarchy:
+            for parameter in self.iso_hierarchy.parameters():
+                lookup_params.pop(parameter, None)
+        return lookup_params
+
+    @cached_property
+    def iso_hierarchy_context(self):
+        return self.iso_hierarchy.context(self) if self.iso_hierarchy else None
+
+    def get_ordering_field(self, field_name):
+        # Clique no cabeçalho de uma data em texto: ordena pela data ISO
+        order_field = super().get_ordering_field(field_name)
+        if isinstance(order_field, str) and order_field in iso_date_fields(self.model_admin):
+            return IsoDate(order_field)
+        return order_field
+
+    def get_ordering(self, request, queryset):
+        # Busca pelo índice FTS5 sem ordenação escolhida: mais relevantes primeiro
+        if ORDER_VAR not in self.params and 'search_rank' in queryset.query.extra_select:
+            return ['search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Links de ordenação, filtros e facetas recomeçam do início
+        if KEYSET_VAR not in (new_params or {}):
+            remove = [*(remove or ()), KEYSET_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        root_queryset = self.root_queryset
+        self.root_queryset = with_cached_count(root_queryset)
+        try:
+            super().get_results(request)
+        finally:
+            self.root_queryset = root_queryset
+        if not getattr(self.model_admin, 'keyset_pagination', False):
+            return
+        columns = keyset_columns(self.model, self.queryset.query.order_by)
+        if columns and self.multi_page and not (self.show_all and self.can_show_all):
+            self.paginate_by_key(columns)
+
+    def paginate_by_key(self, columns):
+        """Troca a página por OFFSET pela página do cursor"""
+        limit = self.list_per_page
+        cursor = self.keyset_cursor
+        if not cursor:
+            # Primeira página (ou ?p= de links antigos): já veio do paginator
+            rows = list(self.result_list)
+            has_previous, has_next = self.page_num > 1, self.page_num < self.paginator.num_pages
+        elif cursor == KEYSET_LAST:
+            rows = seek(self.queryset, columns, None, limit, reverse=True)
+            has_previous, has_next = self.result_count > limit, False
+        else:
+            direction, _, token = cursor.partition('.')
+            if direction not in ('a', 'b'):
+                raise IncorrectLookupParameters('Cursor inválido')
+            values = decode_cursor(token, self.model, columns)
+            # Uma linha a mais indica se há outra página na mesma direção
+            rows = seek(self.queryset, columns, values, limit + 1, reverse=direction == 'b')
+            more = len(rows) > limit
+            if direction == 'a':
+                rows, has_previous, has_next = rows[:limit], True, more
+            elif more:
+                rows, has_previous, has_next = rows[1:], True, True
+            else:
+                # Voltou até o início: mostra a primeira página cheia
+                rows = seek(self.queryset, columns, None, limit)
+                has_previous, has_next = False, True
+        self.result_list = rows
+        self.keyset = KeysetPage(self, columns, rows, has_previous, has_next)
@@ -0,0 +1,103 @@
+"""
+Instrumentação de SQL por requisição.
+
+Cada requisição registra, por alias de banco, a quantidade de queries, o
+tempo total de SQL e as queries mais lentas. O resumo vai no header
+``Server-Timing`` e para um histórico em memória (por processo), exibido
+na página /admin/perf/.
+"""
+import heapq
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+# Caracteres aceitos em nomes de métricas do Server-Timing (token HTTP)
+_NON_TOKEN = re.compile(r"[^A-Za-z0-9!#$%&'*+\-.^_`|~]")
+
+
+class QueryProfile:
+    """execute_wrapper que acumula as estatísticas de SQL de uma requisição"""
+
+    def __init__(self, slow_queries=5):
+        self.slow_queries = slow_queries
+        self.aliases = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            alias = context['connection'].alias
+            stats = self.aliases.setdefault(alias, {'count': 0, 'ms': 0.0, 'slowest': []})
+            stats['count'] += 1
+            stats['ms'] += elapsed
+            entry = (elapsed, sql[:500])
+            if len(stats['slowest']) < self.slow_queries:
+                heapq.heappush(stats['slowest'], entry)
+            else:
+                heapq.heappushpop(stats['slowest'], entry)
+
+    def summary(self):
+        """{alias: {count, ms, slowest}} com as lentas em ordem decrescente"""
+        return {
+            alias: {
+                'count': stats['count'],
+                'ms': round(stats['ms'], 2),
+                'slowest': [(round(ms, 2), sql) for ms, sql in sorted(stats['slowest'], reverse=True)],
+            }
+            for alias, stats in self.aliases.items()
+        }
+
+    def server_timing(self, total_ms):
+        """Valor do header Server-Timing"""
+        metrics = []
+        for alias, stats in self.aliases.items():
+            name = _NON_TOKEN.sub('-', f'db-{alias}')
+            metrics.append(f'{name};dur={stats["ms"]:.1f};desc="{stats["count"]} queries"')
+        metrics.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(metrics)
+
+
+class PerfHistory:
+    """Histórico circular das últimas requisições instrumentadas"""
+
+    def __init__(self, size):
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def breakdown(self):
+        """Agregado por (ModelAdmin, empresa), do mais lento para o mais rápido"""
+        groups = {}
+        for entry in self.entries():
+            key = (entry['model_admin'] or entry['view'] or '-', entry['company'])
+            group = groups.setdefault(key, {
+                'model_admin': key[0], 'company': key[1], 'requests': 0,
+                'queries': 0, 'sql_ms': 0.0, 'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            group['requests'] += 1
+            group['queries'] += entry['queries']
+            group['sql_ms'] += entry['sql_ms']
+            group['total_ms'] += entry['total_ms']
+            group['max_ms'] = max(group['max_ms'], entry['total_ms'])
+        for group in groups.values():
+            requests = group['requests']
+            group['avg_queries'] = round(group['queries'] / requests, 1)
+            group['avg_sql_ms'] = round(group['sql_ms'] / requests, 1)
+            group['avg_total_ms'] = round(group['total_ms'] / requests, 1)
+            group['max_ms'] = round(group['max_ms'], 1)
+        return sorted(groups.values(), key=lambda group: group['avg_total_ms'], reverse=True)
+
+
+perf_history = PerfHistory(getattr(settings, 'PERF_HISTORY_SIZE', 1000))
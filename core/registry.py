@@ -0,0 +1,235 @@
+"""
+Registro dos snapshots de backup das empresas.
+
+Cada snapshot é registrado como um alias próprio em ``connections``: o
+primeiro usa o nome da empresa (``cdg``) e os seguintes recebem um sufixo
+(``cdg@2``, ``cdg@3``...). Trocar de snapshot é só apontar a empresa para
+o novo alias: requisições em andamento mantêm o alias fixado no início da
+requisição (ContextVar do router) e terminam no arquivo antigo, enquanto as
+novas já abrem o arquivo novo. Nada é sobrescrito e não é preciso reiniciar.
+
+Cada processo verifica BACKUP_DIR a cada BACKUP_REFRESH_INTERVAL segundos,
+então basta entregar o novo arquivo (ver o comando ``install_backup``).
+A verificação e a troca acontecem sob o lock do registro: requisições
+simultâneas nunca registram o mesmo arquivo duas vezes.
+
+Um alias substituído continua configurado por BACKUP_ALIAS_GRACE segundos,
+para as requisições e downloads em streaming que o fixaram terminarem. Depois
+disso cada thread fecha a sua conexão com ele no fim da requisição
+(``close_retired_connections``) e o alias só sai de ``connections.settings``
+quando nenhuma conexão com ele continua aberta: enquanto está configurado, o
+``close_all()`` e o ``close_old_connections()`` do Django ainda o alcançam.
+``settings.DATABASES`` nunca é alterado em tempo de execução.
+
+O modo consolidado (CONSOLIDATED_DATABASE) é registrado da mesma forma e
+ganha um alias novo sempre que alguma empresa troca de snapshot; com mais
+backups do que o SQLite consegue anexar, ele é desativado (e registrado no
+log) em vez de falhar na primeira consulta.
+"""
+import logging
+import threading
+import time
+import weakref
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .backups import TooManyBackups, backup_database, company_label, discover_backups, federated_database
+from .routers import get_current_database
+
+logger = logging.getLogger(__name__)
+
+
+class BackupRegistry:
+    """Mapeia cada empresa para o alias do seu snapshot atual"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._aliases = {}  # empresa -> alias do snapshot atual
+        self._versions = {}  # empresa -> quantidade de snapshots registrados
+        self._retired = []  # [(alias substituído, instante da troca)]
+        self._closing = set()  # aliases expirados com conexões ainda abertas
+        self._handles = {}  # alias -> WeakSet das conexões (uma por thread)
+        self._last_refresh = time.monotonic()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        """Registra os snapshots descobertos na inicialização (settings)"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for company in getattr(settings, 'BACKUP_FILES', settings.DATABASE_NAMES):
+                self._versions[company] = 1
+                self._aliases[company] = company
+            self._loaded = True
+            self._register_consolidated()
+
+    def is_registered(self, company):
+        """Indica se a empresa (ou o modo consolidado) está registrada"""
+        self._ensure_loaded()
+        return company in self._aliases
+
+    def companies(self):
+        """Empresas registradas (sem o modo consolidado)"""
+        self._ensure_loaded()
+        return [company for company in self._aliases if company != consolidated_database()]
+
+    def alias_for(self, company):
+        """Alias do snapshot atual da empresa (aliases já resolvidos são mantidos)"""
+        self._ensure_loaded()
+        return self._aliases.get(company, company)
+
+    def company_for(self, alias):
+        """Empresa dona de um alias de snapshot"""
+        return connections.settings.get(alias, {}).get('BACKUP_COMPANY', alias)
+
+    def path_for(self, alias):
+        """Caminho do arquivo de backup do alias (ou do snapshot atual da empresa)"""
+        alias = self.alias_for(alias)
+        path = connections.settings.get(alias, {}).get('BACKUP_PATH')
+        return Path(path) if path else None
+
+    def _register(self, company, database):
+        """Registra um alias novo para a empresa (com o lock adquirido)"""
+        version = self._versions.get(company, 0) + 1
+        alias = company if version == 1 else f'{company}@{version}'
+        # configure_settings() preenche os padrões do Django (exige um 'default')
+        configured = connections.configure_settings({DEFAULT_DB_ALIAS: {}, alias: database})
+        connections.settings[alias] = configured[alias]
+        previous = self._aliases.get(company)
+        if previous is not None and previous != alias:
+            self._retired.append((previous, time.monotonic()))
+        self._versions[company] = version
+        self._aliases[company] = alias
+        return alias
+
+    def _register_snapshot(self, company, path):
+        """Registra o arquivo como snapshot atual da empresa (com o lock adquirido)"""
+        alias = self._register(company, backup_database(path))
+        settings.DATABASE_NAMES.setdefault(company, company_label(company))
+        return alias
+
+    def track_connection(self, connection):
+        """Guarda a conexão (de qualquer thread) aberta com um alias de snapshot"""
+        with self._lock:
+            self._handles.setdefault(connection.alias, weakref.WeakSet()).add(connection)
+
+    def closing_aliases(self):
+        """Aliases expirados que ainda esperam as outras threads fecharem as conexões"""
+        return frozenset(self._closing)
+
+    def _drop_retired(self, now):
+        """
+        Expira os aliases substituídos há mais de BACKUP_ALIAS_GRACE segundos
+        e remove de ``connections.settings`` os que não têm mais conexões
+        abertas em nenhuma thread (com o lock adquirido).
+        """
+        grace = getattr(settings, 'BACKUP_ALIAS_GRACE', 3600)
+        expired = [alias for alias, since in self._retired if now - since >= grace]
+        self._retired = [(alias, since) for alias, since in self._retired if alias not in expired]
+        self._closing.update(expired)
+        dropped = []
+        for alias in sorted(self._closing):
+            connections[alias].close()
+            # As outras threads fecham as delas no fim da requisição
+            if any(handle.connection is not None for handle in self._handles.get(alias, ())):
+                continue
+            del connections[alias]
+            connections.settings.pop(alias, None)
+            self._handles.pop(alias, None)
+            self._closing.discard(alias)
+            dropped.append(alias)
+        return dropped
+
+    def _register_consolidated(self):
+        """(Re)registra o modo consolidado com os snapshots atuais"""
+        consolidated = consolidated_database()
+        if not consolidated:
+            return
+        try:
+            database = federated_database(consolidated, {
+                company: self.path_for(company) for company in sorted(self.companies())
+            })
+        except TooManyBackups as error:
+            # Some do seletor em vez de falhar na primeira consulta
+            logger.error('%s Modo consolidado desativado.', error)
+            previous = self._aliases.pop(consolidated, None)
+            if previous is not None:
+                self._retired.append((previous, time.monotonic()))
+            return
+        if database:
+            self._register(consolidated, database)
+
+    def register(self, company, path):
+        """Registra o snapshot e torna-o o atual da empresa; retorna o alias"""
+        self._ensure_loaded()
+        with self._lock:
+            alias = self._register_snapshot(company, path)
+            self._register_consolidated()
+        return alias
+
+    def refresh(self, force=False):
+        """
+        Procura snapshots novos em BACKUP_DIR e troca as empresas afetadas.
+        Sem ``force``, respeita BACKUP_REFRESH_INTERVAL entre verificações.
+        Retorna {empresa: alias} das trocas feitas.
+        """
+        interval = getattr(settings, 'BACKUP_REFRESH_INTERVAL', 30)
+        if not force and time.monotonic() - self._last_refresh < interval:
+            return {}
+        self._ensure_loaded()
+        with self._lock:
+            # Outra requisição pode ter feito a verificação enquanto esta esperava o lock
+            now = time.monotonic()
+            if not force and now - self._last_refresh < interval:
+                return {}
+            self._last_refresh = now
+            swapped = {}
+            for company, path in discover_backups(settings.BACKUP_DIR).items():
+                current = self.path_for(company)
+                if current is None or Path(path) != current:
+                    swapped[company] = self._register_snapshot(company, path)
+            if swapped:
+                self._register_consolidated()
+            self._drop_retired(now)
+        return swapped
+
+
+def consolidated_database():
+    """Alias lógico do modo consolidado (None se desativado)"""
+    return getattr(settings, 'CONSOLIDATED_DATABASE', None)
+
+
+def available_databases():
+    """Opções do seletor de empresa: empresas + modo consolidado"""
+    databases = dict(settings.DATABASE_NAMES)
+    if consolidated_database() and backup_registry.is_registered(consolidated_database()):
+        databases[consolidated_database()] = settings.CONSOLIDATED_DATABASE_NAME
+    return databases
+
+
+backup_registry = BackupRegistry()
+
+
+def track_backup_connection(sender, connection, **kwargs):
+    """Handler do connection_created: registra as conexões com os snapshots"""
+    if 'BACKUP_PATH' in connection.settings_dict:
+        backup_registry.track_connection(connection)
+
+
+def close_retired_connections(sender, **kwargs):
+    """Handler do request_finished: fecha as conexões da thread com aliases expirados"""
+    closing = backup_registry.closing_aliases()
+    if not closing:
+        return
+    for connection in connections.all(initialized_only=True):
+        if connection.alias in closing:
+            connection.close()
+
+
+def get_current_company():
+    """Empresa do snapshot em uso no contexto atual"""
+    return backup_registry.company_for(get_current_database())
@@ -1,27 +1,53 @@
 """
 Database Router para suporte a múltiplos bancos de dados.
-Permite selecionar qual banco utilizar baseado na sessão do usuário.
+Permite selecionar qual banco utilizar baseado na empresa da requisição (URL ou cookie).
+
+O banco atual fica em uma ContextVar, e não em threading.local: sob ASGI
+várias requisições compartilham a mesma thread, e cada uma precisa enxergar
+apenas a empresa que ela própria selecionou.
 """
-import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_DATABASE = 'cdg'  # CDG como padrão
 
-# Thread-local storage para armazenar o banco atual
-_thread_locals = threading.local()
+# Contexto da requisição/tarefa atual com o banco selecionado
+_current_database = ContextVar('current_database', default=DEFAULT_DATABASE)
 
 
 def set_current_database(db_alias):
-    """Define o banco de dados atual para a thread"""
-    _thread_locals.current_db = db_alias
+    """
+    Define o banco de dados atual para o contexto.
+    Retorna o token que deve ser passado para reset_current_database().
+    """
+    return _current_database.set(db_alias)
+
+
+def reset_current_database(token):
+    """Restaura o banco que estava ativo antes de set_current_database()"""
+    _current_database.reset(token)
 
 
 def get_current_database():
-    """Retorna o banco de dados atual da thread"""
-    return getattr(_thread_locals, 'current_db', 'cdg')  # CDG como padrão
+    """Retorna o banco de dados atual do contexto"""
+    return _current_database.get()
+
+
+@contextmanager
+def using_database(db_alias):
+    """Executa o bloco com o banco informado, restaurando o anterior ao sair"""
+    token = set_current_database(db_alias)
+    try:
+        yield db_alias
+    finally:
+        reset_current_database(token)
 
 
 class MultiDatabaseRouter:
     """
     Router que direciona queries para o banco de dados selecionado.
-    - Modelos do app 'core' usam o banco selecionado na sessão
+    - Modelos do app 'core' usam o banco selecionado na requisição (exceto
+      os gerenciados pelo Django, como ExportJob, que ficam no 'default')
     - Modelos do Django (auth, sessions, etc) usam o banco 'default'
     """
     
@@ -32,7 +58,7 @@ class MultiDatabaseRouter:
         """Retorna o banco para leitura"""
         if model._meta.app_label in self.DJANGO_APPS:
             return 'default'
-        if model._meta.app_label == 'core':
+        if self.is_backup_model(model):
             return get_current_database()
         return 'default'
     
@@ -40,10 +66,15 @@ class MultiDatabaseRouter:
         """Retorna o banco para escrita"""
         if model._meta.app_label in self.DJANGO_APPS:
             return 'default'
-        if model._meta.app_label == 'core':
+        if self.is_backup_model(model):
             return get_current_database()
         return 'default'
     
+    @staticmethod
+    def is_backup_model(model):
+        """Models do core espelhados dos backups (managed=False); os demais ficam no default"""
+        return model._meta.app_label == 'core' and not model._meta.managed
+    
     def allow_relation(self, obj1, obj2, **hints):
         """Permite relações entre objetos do mesmo banco"""
         return True
@@ -52,8 +83,9 @@ class MultiDatabaseRouter:
         """
         Controla onde as migrações podem ser executadas.
         - Apps do Django só migram no 'default'
-        - App 'core' não precisa de migrações (managed=False)
+        - App 'core': as tabelas dos backups não são migradas (managed=False);
+          os models próprios (ex.: ExportJob) ficam no 'default'
         """
-        if app_label in self.DJANGO_APPS:
+        if app_label in self.DJANGO_APPS or app_label == 'core':
             return db == 'default'
         return None
@@ -0,0 +1,216 @@
+"""
+Busca do admin por índice full-text (FTS5) ao lado de cada snapshot.
+
+Os search_fields viram ``LIKE '%termo%'`` em todas as colunas (com JOINs
+nas relações), o que percorre a tabela inteira a cada busca. O comando
+build_search_index grava, ao lado do snapshot ``<empresa>.<versão>.db``,
+o arquivo ``<empresa>.<versão>.fts5`` com uma tabela FTS5 por ModelAdmin:
+uma linha por registro (rowid = pk) com o texto dos search_fields, já com
+os valores das relações.
+
+O arquivo é anexado somente leitura nas conexões do snapshot
+(core/backups.py) e a busca vira um MATCH ordenado por relevância (bm25):
+ignora acentos, busca pelo prefixo de cada palavra e exige todas as
+palavras ("frase entre aspas" busca a frase). Sem o arquivo, com
+search_fields diferentes dos indexados ou no modo consolidado, vale a
+busca padrão do Django.
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+
+from django.contrib import admin
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.utils.text import smart_split, unescape_string_literal
+
+from .backups import SEARCH_SCHEMA, backup_uri
+
+# unicode61 com remove_diacritics: 'João' e 'joao' viram o mesmo token
+SEARCH_TOKENIZER = 'unicode61 remove_diacritics 2'
+# Índices de prefixo para buscas curtas ('jo*', 'mar*')
+SEARCH_PREFIXES = '2 3'
+META_TABLE = 'busca_meta'
+BATCH_SIZE = 5000
+
+
+def search_columns(search_fields):
+    """Caminhos dos search_fields sem os prefixos de lookup (^, =, @)"""
+    return [field.lstrip('^=@') for field in search_fields]
+
+
+def search_table(model):
+    """Tabela FTS5 do model no arquivo de busca"""
+    return f'{model._meta.db_table}_busca'
+
+
+def _column_path(model, path):
+    """Campos percorridos por 'relacao__campo' (None se o caminho não for válido)"""
+    fields = []
+    names = path.split('__')
+    try:
+        for name in names[:-1]:
+            field = model._meta.get_field(name)
+            if not (field.many_to_one or field.one_to_one) or not field.concrete:
+                return None
+            fields.append(field)
+            model = field.related_model
+        field = model._meta.get_field(names[-1])
+    except FieldDoesNotExist:
+        return None
+    if field.is_relation or not field.concrete:
+        return None
+    return fields + [field]
+
+
+def indexed_models():
+    """{model: colunas} dos ModelAdmins do core com search_fields indexáveis"""
+    models = {}
+    for model, modeladmin in admin.site._registry.items():
+        if model._meta.app_label != 'core' or not modeladmin.search_fields:
+            continue
+        columns = search_columns(modeladmin.search_fields)
+        if all(_column_path(model, path) for path in columns):
+            models[model] = columns
+    return models
+
+
+def select_sql(model, columns):
+    """SELECT da pk e das colunas de busca, com LEFT JOIN nas relações"""
+    joins = {}
+    expressions = []
+    for path in columns:
+        *relations, field = _column_path(model, path)
+        alias = 't0'
+        for relation in relations:
+            key = (alias, relation.name)
+            if key not in joins:
+                joined = f't{len(joins) + 1}'
+                joins[key] = (joined, (
+                    f'LEFT JOIN "{relation.related_model._meta.db_table}" {joined} '
+                    f'ON {joined}."{relation.target_field.column}" = {alias}."{relation.column}"'
+                ))
+            alias = joins[key][0]
+        expressions.append(f'{alias}."{field.column}"')
+    pk = model._meta.pk.column
+    return (
+        f'SELECT t0."{pk}", {", ".join(expressions)} FROM "{model._meta.db_table}" t0 '
+        + ' '.join(join for _, join in joins.values())
+        + f' ORDER BY t0."{pk}"'
+    )
+
+
+def _text(value):
+    if isinstance(value, float) and value.is_integer():
+        # Números de documento gravados como REAL: 1234.0 -> '1234'
+        return str(int(value))
+    return None if value is None else str(value)
+
+
+def build_search_index(source, target):
+    """
+    Grava em ``target`` as tabelas FTS5 dos models indexáveis, lendo o
+    backup ``source``. Retorna {model: linhas indexadas}.
+    """
+    reader = sqlite3.connect(backup_uri(source, immutable=False), uri=True)
+    writer = sqlite3.connect(target)
+    built = {}
+    try:
+        writer.execute(f'CREATE TABLE {META_TABLE} (tabela TEXT PRIMARY KEY, colunas TEXT, linhas INTEGER)')
+        for model, columns in indexed_models().items():
+            try:
+                cursor = reader.execute(select_sql(model, columns))
+            except sqlite3.OperationalError:
+                # Tabela ou coluna ausente neste backup
+                continue
+            table = search_table(model)
+            names = ', '.join(f'"{path}"' for path in columns)
+            writer.execute(
+                f'CREATE VIRTUAL TABLE "{table}" USING fts5({names}, content=\'\', '
+                f'tokenize=\'{SEARCH_TOKENIZER}\', prefix=\'{SEARCH_PREFIXES}\')'
+            )
+            insert = f'INSERT INTO "{table}"(rowid, {names}) VALUES ({", ".join("?" * (len(columns) + 1))})'
+            count = 0
+            previous = None
+            while rows := cursor.fetchmany(BATCH_SIZE):
+                batch = []
+                for pk, *values in rows:
+                    # JOIN com to_field repetido: uma linha por registro
+                    if pk != previous:
+                        batch.append((pk, *map(_text, values)))
+                        previous = pk
+                writer.executemany(insert, batch)
+                count += len(batch)
+            writer.execute(f'INSERT INTO "{table}"("{table}") VALUES (\'optimize\')')
+            writer.execute(f'INSERT INTO {META_TABLE} VALUES (?, ?, ?)', (table, json.dumps(columns), count))
+            built[model] = count
+        writer.commit()
+    finally:
+        reader.close()
+        writer.close()
+    return built
+
+
+def search_index_meta(path):
+    """{tabela: colunas} de um arquivo de busca (lido de novo só se o arquivo mudar)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    # Um build_search_index novo no mesmo caminho muda a chave do cache
+    return _search_index_meta(str(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=64)
+def _search_index_meta(path, inode, mtime_ns, size):
+    try:
+        conn = sqlite3.connect(backup_uri(path), uri=True)
+        try:
+            rows = conn.execute(f'SELECT tabela, colunas FROM {META_TABLE}').fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+    return {table: json.loads(columns) for table, columns in rows}
+
+
+def match_expression(term):
+    """Consulta FTS5 do termo: todas as palavras por prefixo, frases entre aspas"""
+    parts = []
+    for bit in smart_split(term):
+        if bit[:1] in ('"', "'") and bit[-1:] == bit[0] and len(bit) > 1:
+            words = re.findall(r'\w+', unescape_string_literal(bit))
+            if words:
+                parts.append('"' + ' '.join(words) + '"')
+        else:
+            parts += [f'"{word}"*' for word in re.findall(r'\w+', bit)]
+    return ' '.join(parts) or None
+
+
+def full_text_search(queryset, search_fields, term):
+    """
+    Queryset filtrado pelo índice de busca e com a coluna ``search_rank``
+    (menor = mais relevante), ou None quando o índice não serve.
+    """
+    match = match_expression(term) if search_fields else None
+    if not match:
+        return None
+    connection = connections[queryset.db]
+    connection.ensure_connection()
+    path = getattr(connection, 'search_index', None)
+    table = search_table(queryset.model)
+    if not path or search_index_meta(path).get(table) != search_columns(search_fields):
+        return None
+    # JOIN com a tabela FTS5: uma subconsulta correlacionada para o rank
+    # refaria o MATCH a cada linha. O nome entre aspas passa sem nova
+    # citação pelo compilador (tabela de outro schema)
+    source = f'"{SEARCH_SCHEMA}"."{table}"'
+    db_table, pk = queryset.model._meta.db_table, queryset.model._meta.pk.column
+    return queryset.extra(
+        select={'search_rank': f'{source}.rank'},
+        tables=[source],
+        where=[f'{source}.rowid = "{db_table}"."{pk}"', f'"{table}" MATCH %s'],
+        params=[match],
+    )
@@ -0,0 +1,117 @@
+"""
+Seleção de empresa sem sessão.
+
+A empresa da requisição vem, nesta ordem:
+1. do prefixo da URL ``/admin/<empresa>/...``, servido por um AdminSite
+   próprio da empresa (cada aba do navegador pode olhar uma empresa e
+   caches HTTP podem usar a URL como chave);
+2. de um cookie assinado gravado pelo seletor de empresa;
+3. do banco padrão.
+
+Nenhum dos caminhos consulta a sessão no banco ``default``.
+"""
+import re
+
+from django.conf import settings
+from django.contrib import admin
+
+from .registry import available_databases, backup_registry
+from .routers import DEFAULT_DATABASE
+
+# Cookie assinado com a empresa escolhida no seletor
+COMPANY_COOKIE = getattr(settings, 'COMPANY_COOKIE_NAME', 'omie_company')
+COMPANY_COOKIE_SALT = 'core.company'
+
+# Segmentos de /admin/ que nunca são empresas (apps e views do admin)
+RESERVED_PREFIXES = {'perf', 'exportacoes', 'login', 'logout', 'password_change', 'jsi18n', 'r', 'autocomplete'}
+
+_PREFIX = re.compile(r'^/admin/(?P<company>[^/]+)/')
+
+
+class CompanyAdminSite(admin.AdminSite):
+    """AdminSite servido em /admin/<empresa>/ com os mesmos ModelAdmins do admin.site"""
+
+    def __init__(self, company, label):
+        super().__init__(name=f'admin_{company}')
+        self.company = company
+        self.site_header = f'{admin.site.site_header} - {label}'
+        self.site_title = admin.site.site_title
+        self.index_title = admin.site.index_title
+        self._actions = dict(admin.site._actions)
+        self._global_actions = dict(admin.site._global_actions)
+        self._registry = {
+            model: type(model_admin)(model, self)
+            for model, model_admin in admin.site._registry.items()
+        }
+
+
+def is_company_prefix(company):
+    """Indica se o segmento pode ser usado como prefixo de empresa"""
+    from django.apps import apps
+
+    return (
+        company not in RESERVED_PREFIXES
+        and company not in {config.label for config in apps.get_app_configs()}
+    )
+
+
+def is_served_company(company):
+    """
+    Indica se a empresa tem prefixo próprio em /admin/. Vem do registro, e
+    não dos sites montados pelo urls.py, porque o middleware roda antes do
+    primeiro import do URLconf (empresas descobertas depois da inicialização
+    só ganham o AdminSite no próximo restart)
+    """
+    return backup_registry.is_registered(company) and is_company_prefix(company)
+
+
+def company_sites():
+    """Um CompanyAdminSite por empresa (e para o consolidado) registrada na inicialização"""
+    return [
+        CompanyAdminSite(company, label)
+        for company, label in available_databases().items() if is_served_company(company)
+    ]
+
+
+def company_from_path(path):
+    """Empresa do prefixo /admin/<empresa>/ (None se não houver)"""
+    match = _PREFIX.match(path)
+    if match and is_served_company(match['company']):
+        return match['company']
+    return None
+
+
+def company_from_cookie(request):
+    """Empresa do cookie assinado (None se ausente ou adulterado)"""
+    return request.get_signed_cookie(COMPANY_COOKIE, default=None, salt=COMPANY_COOKIE_SALT)
+
+
+def set_company_cookie(request, response, company):
+    """Grava a empresa escolhida no cookie assinado"""
+    response.set_signed_cookie(
+        COMPANY_COOKIE, company, salt=COMPANY_COOKIE_SALT,
+        max_age=getattr(settings, 'COMPANY_COOKIE_AGE', 60 * 60 * 24 * 365),
+        secure=request.is_secure(), httponly=True, samesite='Lax',
+    )
+
+
+def company_path(path, company):
+    """Troca o prefixo de empresa de um caminho do admin (mantém os sem prefixo)"""
+    current = company_from_path(path)
+    if current is None:
+        return path
+    rest = path[len(f'/admin/{current}/'):]
+    if not is_served_company(company):
+        return f'/admin/{rest}'
+    return f'/admin/{company}/{rest}'
+
+
+def resolve_company(request):
+    """(empresa, origem) da requisição: 'url', 'cookie' ou 'default'"""
+    company = company_from_path(request.path_info)
+    if company:
+        return company, 'url'
+    company = company_from_cookie(request)
+    if company in available_databases():
+        return company, 'cookie'
+    return DEFAULT_DATABASE, 'default'
@@ -0,0 +1,50 @@
+"""
+Backup sintético (generate_backup) registrado como empresa para os testes
+que consultam as tabelas dos backups.
+"""
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+
+from core.registry import BackupRegistry
+
+
+class SyntheticBackupMixin:
+    """
+    Mixin de TestCase: gera o backup de ``backup_company`` uma vez por
+    classe e o registra em ``cls.registry`` (um BackupRegistry só dos
+    testes, sem o modo consolidado); ``cls.alias`` é o alias dele.
+    """
+    backup_company = 'empresa_teste'
+    backup_rows = 200
+
+    @classmethod
+    def setUpClass(cls):
+        cls.backup_dir = Path(cls.enterClassContext(tempfile.TemporaryDirectory()))
+        path = cls.backup_dir / f'{cls.backup_company}.db'
+        call_command(
+            'generate_backup', str(path), rows=cls.backup_rows, items=2, pool=64, seed=7, stdout=StringIO(),
+        )
+        cls.enterClassContext(override_settings(
+            BACKUP_DIR=cls.backup_dir,
+            BACKUP_FILES={},
+            DATABASE_NAMES={},
+            CONSOLIDATED_DATABASE=None,
+        ))
+        cls.registry = BackupRegistry()
+        cls.alias = cls.registry.register(cls.backup_company, path)
+        cls.addClassCleanup(cls.forget_backup)
+        # O backup só existe depois que o runner preparou os bancos de teste:
+        # entra em ``databases`` aqui, antes do TestCase validar os aliases
+        cls.databases = {'default', cls.alias}
+        super().setUpClass()
+
+    @classmethod
+    def forget_backup(cls):
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        connections.settings.pop(cls.alias)
@@ -0,0 +1,40 @@
+"""
+Modo consolidado: limite de bancos anexados do SQLite e colunas
+qualificadas pela empresa nas views federadas.
+"""
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core import backups
+from core.backups import TooManyBackups, federated_columns, federated_database
+from core.models import ClientesCadastro, ContaPagarCadastro, NfCadastroItens
+
+
+class FederatedDatabaseTests(SimpleTestCase):
+
+    def backups_for(self, count):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        paths = {f'empresa{index}': directory / f'empresa{index}.db' for index in range(count)}
+        for path in paths.values():
+            sqlite3.connect(path).close()
+        return paths
+
+    def test_backups_up_to_attach_limit_are_attached(self):
+        with mock.patch.object(backups, 'attach_limit', return_value=2):
+            database = federated_database('grupo', self.backups_for(3))
+        self.assertEqual([name for name, index, path in database['ATTACH']], ['empresa0', 'empresa1', 'empresa2'])
+
+    def test_backups_above_attach_limit_raise(self):
+        with mock.patch.object(backups, 'attach_limit', return_value=2):
+            with self.assertRaisesMessage(TooManyBackups, 'SQLITE_MAX_ATTACHED'):
+                federated_database('grupo', self.backups_for(4))
+
+    def test_only_ids_and_parent_id_are_qualified(self):
+        columns = federated_columns()
+        self.assertEqual(columns[ContaPagarCadastro._meta.db_table], {'id'})
+        self.assertEqual(columns[ClientesCadastro._meta.db_table], {'id'})
+        self.assertEqual(columns[NfCadastroItens._meta.db_table], {'id', 'parent_id'})
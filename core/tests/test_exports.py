@@ -0,0 +1,106 @@
+"""
+Arquivos .xlsx gerados em streaming (core/exports.py) lidos de volta pelo
+openpyxl: o XML das linhas é montado à mão no formato que ele grava, então
+uma versão nova do openpyxl que mude esse formato quebra estes testes.
+"""
+import io
+import math
+
+from django.test import SimpleTestCase
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from core.exports import FLUSH_ROWS, row_xml, stream_sheets, stream_workbook, stream_xlsx
+
+HEADERS = ['Texto', 'Inteiro', 'Decimal', 'Booleano', 'Vazio']
+ROWS = [
+    ['Ação & <Cia> "Ltda"', 1234, 1234.5, True, None],
+    ['com\x01controle', -7, 0.1 + 0.2, False, ''],
+    ['', 10 ** 15, 1e20, None, 'fim'],
+    [None, 0, math.nan, True, None],
+]
+# Como o openpyxl lê de volta: vazio e NaN viram None, controles somem e
+# os números têm 16 dígitos significativos (%.16g, como ele grava)
+EXPECTED = [
+    ('Ação & <Cia> "Ltda"', 1234, 1234.5, True, None),
+    ('comcontrole', -7, 0.3, False, None),
+    (None, 10 ** 15, 1e20, None, 'fim'),
+    (None, 0, None, True, None),
+]
+
+
+def read_workbook(chunks):
+    return load_workbook(io.BytesIO(b''.join(chunks)))
+
+
+def sheet_values(sheet, width):
+    """Linhas da aba com ``width`` colunas (o openpyxl não devolve células vazias no fim)"""
+    return [
+        tuple(row) + (None,) * (width - len(row))
+        for row in sheet.iter_rows(values_only=True)
+    ]
+
+
+def openpyxl_workbook(headers, rows):
+    """O mesmo conteúdo gravado pelo próprio openpyxl, para comparação"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in [headers, *rows]:
+        sheet.append([
+            (ILLEGAL_CHARACTERS_RE.sub('', value) or None) if isinstance(value, str) else value
+            for value in row
+        ])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return load_workbook(buffer)
+
+
+class StreamedXlsxTests(SimpleTestCase):
+
+    def test_cells_round_trip(self):
+        workbook = read_workbook(stream_xlsx('Contas a pagar', HEADERS, ROWS))
+        sheet = workbook.active
+        self.assertEqual(sheet.title, 'Contas a pagar')
+        self.assertEqual(sheet_values(sheet, len(HEADERS)), [tuple(HEADERS), *EXPECTED])
+        self.assertTrue(sheet['A1'].font.b)
+        self.assertFalse(sheet['A2'].font.b)
+        self.assertGreater(sheet.column_dimensions['A'].width, len('Texto'))
+
+    def test_cells_match_openpyxl_writer(self):
+        streamed = read_workbook(stream_xlsx('Contas a pagar', HEADERS, ROWS)).active
+        written = openpyxl_workbook(HEADERS, ROWS).active
+        self.assertEqual(sheet_values(streamed, len(HEADERS)), sheet_values(written, len(HEADERS)))
+        for streamed_row, written_row in zip(streamed.iter_rows(min_row=2), written.iter_rows(min_row=2)):
+            self.assertEqual(
+                [cell.data_type for cell in streamed_row if cell.value is not None],
+                [cell.data_type for cell in written_row if cell.value is not None],
+            )
+
+    def test_rows_across_flushes_keep_their_order(self):
+        rows = [[f'linha {index}', index] for index in range(FLUSH_ROWS * 2 + 3)]
+        chunks = list(stream_xlsx('Linhas', ['Nome', 'Número'], rows))
+        self.assertGreater(len(chunks), 2)
+        sheet = read_workbook(chunks).active
+        self.assertEqual(sheet.max_row, len(rows) + 1)
+        self.assertEqual(sheet_values(sheet, 2)[1:], [tuple(row) for row in rows])
+
+    def test_workbook_with_several_sheets(self):
+        long_title = 'Movimentos financeiros de todas as empresas'
+        workbook = read_workbook(stream_workbook([
+            ('Clientes', ['Nome'], [['Ana'], ['Bruno']]),
+            (long_title, ['Valor'], [[1.5]]),
+            ('Vazia', ['Nada'], []),
+        ]))
+        self.assertEqual(workbook.sheetnames, ['Clientes', long_title[:31], 'Vazia'])
+        self.assertEqual(sheet_values(workbook['Clientes'], 1), [('Nome',), ('Ana',), ('Bruno',)])
+        self.assertEqual(sheet_values(workbook[long_title[:31]], 1), [('Valor',), (1.5,)])
+        self.assertEqual(sheet_values(workbook['Vazia'], 1), [('Nada',)])
+
+    def test_rows_without_references(self):
+        # As abas do export por empresa juntam linhas geradas sem a referência das células
+        headers = ['Empresa', *HEADERS]
+        block = ''.join(row_xml(None, None, ['cdg', *row]) for row in ROWS).encode()
+        sheet = read_workbook(stream_sheets([('Grupo', headers, [10] * len(headers), [block])])).active
+        self.assertEqual(sheet_values(sheet, len(headers)), [
+            tuple(headers), *[('cdg', *row) for row in EXPECTED],
+        ])
@@ -0,0 +1,47 @@
+"""
+Exportação de todas as empresas (core/group_exports.py): os temporários
+são apagados e as empresas na fila canceladas quando a resposta fecha,
+mesmo que o envio nem tenha começado.
+"""
+import tempfile
+from concurrent.futures import Future
+from pathlib import Path
+
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase
+
+from core.group_exports import _CleanedChunks
+
+
+def chunks():
+    yield b'a'
+    yield b'b'
+
+
+class GroupExportCleanupTests(SimpleTestCase):
+
+    def streamed(self, chunks):
+        directory = Path(tempfile.mkdtemp(prefix='omie-empresas-teste-'))
+        (directory / 'cdg.xml').write_bytes(b'<row/>')
+        futures = [Future(), Future()]
+        response = StreamingHttpResponse(_CleanedChunks(chunks, futures, directory))
+        return response, futures, directory
+
+    def test_closing_before_streaming_cleans_up(self):
+        response, futures, directory = self.streamed(chunks())
+        response.close()
+        self.assertFalse(directory.exists())
+        self.assertTrue(all(future.cancelled() for future in futures))
+
+    def test_closing_midway_cleans_up(self):
+        response, futures, directory = self.streamed(chunks())
+        self.assertEqual(next(iter(response)), b'a')
+        response.close()
+        self.assertFalse(directory.exists())
+        self.assertTrue(all(future.cancelled() for future in futures))
+
+    def test_full_stream_is_passed_through(self):
+        response, futures, directory = self.streamed(chunks())
+        self.assertEqual(b''.join(response), b'ab')
+        response.close()
+        self.assertFalse(directory.exists())
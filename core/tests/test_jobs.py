@@ -0,0 +1,145 @@
+"""
+Exportações em segundo plano (core/jobs.py): o ExportJob fica no banco
+'default' qualquer que seja a empresa da requisição, o job gera o arquivo
+a partir do snapshot da empresa e jobs em andamento de um processo que
+morreu deixam de ocupar a vaga do usuário.
+"""
+import csv
+import io
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from core import jobs, workers
+from core.management.commands.benchmark_admin import admin_request
+from core.models import ContaPagarCadastro, ExportJob
+from core.routers import MultiDatabaseRouter, using_database
+from core.tests.fixtures import SyntheticBackupMixin
+
+
+class ExportJobRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = MultiDatabaseRouter()
+
+    def test_export_job_uses_default_database_for_any_company(self):
+        with using_database('empresa_qualquer'):
+            self.assertEqual(self.router.db_for_read(ExportJob), 'default')
+            self.assertEqual(self.router.db_for_write(ExportJob), 'default')
+            self.assertEqual(self.router.db_for_read(ContaPagarCadastro), 'empresa_qualquer')
+
+    def test_export_job_migrates_only_on_default(self):
+        self.assertIs(self.router.allow_migrate('default', 'core', model_name='exportjob'), True)
+        self.assertIs(self.router.allow_migrate('empresa_qualquer', 'core', model_name='exportjob'), False)
+
+
+class RunJobTests(SyntheticBackupMixin, TestCase):
+    backup_company = 'exportacoes_teste'
+
+    def setUp(self):
+        self.export_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(EXPORT_DIR=self.export_dir))
+        self.enterContext(mock.patch.object(jobs, 'backup_registry', self.registry))
+        self.user = User.objects.create_superuser('exportador', password='senha')
+        self.modeladmin = admin.site._registry[ContaPagarCadastro]
+
+    def create_job(self, format, **fields):
+        with using_database(self.alias):
+            columns = jobs.job_columns(self.modeladmin, admin_request(self.modeladmin), format)
+        fields.setdefault('company', self.backup_company)
+        return ExportJob.objects.create(
+            user=self.user, model='core.contapagarcadastro', format=format, columns=columns, **fields,
+        )
+
+    def expected_count(self, **filters):
+        with using_database(self.alias):
+            return ContaPagarCadastro.objects.filter(**filters).count()
+
+    def test_run_job_writes_xlsx_from_company_snapshot(self):
+        job = self.create_job('xlsx')
+        jobs.run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE, job.error)
+        total = self.expected_count()
+        self.assertEqual((job.total_rows, job.rows_done, job.progress), (total, total, 100))
+        self.assertIsNotNone(job.heartbeat_at)
+        path = jobs.job_file(job)
+        self.assertEqual(path.stat().st_size, job.file_size)
+        self.assertEqual(list(self.export_dir.glob('*.part')), [])
+        sheet = load_workbook(path).active
+        self.assertEqual(sheet.max_row, total + 1)
+        self.assertEqual(len(next(sheet.iter_rows(values_only=True))), len(job.columns))
+
+    def test_run_job_applies_the_changelist_query_string(self):
+        with using_database(self.alias):
+            code = ContaPagarCadastro.objects.order_by('pk').values_list('codigo_lancamento_omie', flat=True)[0]
+        job = self.create_job('csv', query_string=f'codigo_lancamento_omie={code}')
+        jobs.run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE, job.error)
+        rows = list(csv.reader(io.StringIO(jobs.job_file(job).read_text(encoding='utf-8-sig'))))
+        self.assertEqual(len(rows) - 1, self.expected_count(codigo_lancamento_omie=code))
+        self.assertLess(len(rows) - 1, self.expected_count())
+        self.assertEqual(job.rows_done, len(rows) - 1)
+
+    def test_job_claimed_by_another_worker_is_not_run(self):
+        job = self.create_job('csv', status=ExportJob.RUNNING, started_at=timezone.now())
+        jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+        self.assertEqual(list(self.export_dir.iterdir()), [])
+
+    def test_failed_job_records_the_error(self):
+        job = self.create_job('csv', company='empresa_sem_backup')
+        jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertTrue(job.error)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(EXPORT_MAX_ACTIVE_JOBS=1, EXPORT_STALE_AFTER=60)
+    def test_stale_running_job_frees_the_user_slot(self):
+        started = timezone.now() - timedelta(hours=1)
+        stale = self.create_job('csv', status=ExportJob.RUNNING, started_at=started, heartbeat_at=started)
+        self.assertTrue(jobs.can_enqueue(self.user))
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ExportJob.FAILED)
+        self.assertTrue(stale.error)
+
+        self.create_job('csv', status=ExportJob.RUNNING, started_at=started, heartbeat_at=timezone.now())
+        self.assertFalse(jobs.can_enqueue(self.user))
+
+    @override_settings(EXPORT_STALE_AFTER=60)
+    def test_new_pool_fails_stale_jobs_and_requeues_pending(self):
+        started = timezone.now() - timedelta(hours=1)
+        stale = self.create_job('csv', status=ExportJob.RUNNING, started_at=started)
+        pending = self.create_job('csv')
+        pool = mock.Mock()
+        jobs._requeue(pool)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ExportJob.FAILED)
+        pool.submit.assert_called_once_with(workers.run, pending.pk)
+
+    @override_settings(EXPORT_MAX_ACTIVE_JOBS=1)
+    def test_pending_jobs_resume_after_restart(self):
+        # Processo novo: nenhum pool, e o job ficou na fila do processo anterior
+        self.enterContext(mock.patch.dict(jobs._pools, clear=True))
+        executor = self.enterContext(mock.patch.object(jobs, 'ProcessPoolExecutor'))
+        pending = self.create_job('csv')
+
+        self.assertFalse(jobs.can_enqueue(self.user))
+        executor.return_value.submit.assert_called_once_with(workers.run, pending.pk)
+
+        # Com o pool criado, as próximas verificações não reenviam nada
+        jobs.can_enqueue(self.user)
+        executor.return_value.submit.assert_called_once()
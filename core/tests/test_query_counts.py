@@ -0,0 +1,72 @@
+"""
+Número de queries das listagens do core: constante com o tamanho da página.
+
+Um backup sintético (generate_backup) é registrado como empresa e o
+changelist de cada ModelAdmin é renderizado com dois tamanhos de página,
+assim como a exportação para Excel com duas quantidades de registros. Se
+o número de queries cresce com a página, algum item do list_display lê
+uma relação fora do select_related (N+1). É a mesma conferência do
+comando check_query_counts, rodando na suíte.
+"""
+from django.contrib import admin
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.admin import export_to_excel
+from core.management.commands.benchmark_admin import admin_request
+from core.routers import using_database
+from core.tests.fixtures import SyntheticBackupMixin
+
+# Os cadastros menores do backup sintético têm 5 linhas
+SMALL, LARGE = 2, 5
+
+
+class ChangelistQueryCountTests(SyntheticBackupMixin, TestCase):
+    backup_company = 'consultas_teste'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model_admins = [
+            modeladmin for model, modeladmin in admin.site._registry.items()
+            if model._meta.app_label == 'core' and not model._meta.managed
+        ]
+
+    def setUp(self):
+        self.enterContext(using_database(self.alias))
+
+    def render_changelist(self, modeladmin, page_size):
+        original = modeladmin.list_per_page
+        modeladmin.list_per_page = page_size
+        try:
+            response = modeladmin.changelist_view(admin_request(modeladmin)).render()
+        finally:
+            modeladmin.list_per_page = original
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context_data['cl'].result_list), page_size)
+
+    def consume_export(self, modeladmin, rows):
+        request = admin_request(modeladmin)
+        queryset = modeladmin.get_queryset(request)
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:rows])
+        self.assertEqual(len(ids), rows)
+        b''.join(export_to_excel(modeladmin, request, queryset.filter(pk__in=ids)).streaming_content)
+
+    def assertConstantQueries(self, action):
+        """Mesmo número de queries com SMALL e LARGE (a primeira execução aquece os caches)"""
+        action(SMALL)
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            action(SMALL)
+        with self.assertNumQueries(len(queries), using=self.alias):
+            action(LARGE)
+
+    def test_changelists_run_constant_queries(self):
+        for modeladmin in self.model_admins:
+            with self.subTest(model=modeladmin.model._meta.model_name):
+                self.assertConstantQueries(lambda size: self.render_changelist(modeladmin, size))
+
+    def test_exports_run_constant_queries(self):
+        for modeladmin in self.model_admins:
+            with self.subTest(model=modeladmin.model._meta.model_name):
+                self.assertConstantQueries(lambda rows: self.consume_export(modeladmin, rows))
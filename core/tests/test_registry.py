@@ -0,0 +1,117 @@
+"""
+Troca de snapshots no registro: verificações simultâneas registram cada
+arquivo novo uma única vez e os aliases substituídos saem de
+``connections`` depois de BACKUP_ALIAS_GRACE, quando nenhuma thread tem mais
+conexão aberta com eles.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from django.core.signals import request_finished
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from core import registry
+from core.registry import BackupRegistry
+
+COMPANY = 'registro_teste'
+
+
+def create_backup(path, mtime):
+    sqlite3.connect(path).close()
+    os.utime(path, (mtime, mtime))
+
+
+class BackupRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        create_backup(self.directory / f'{COMPANY}.db', time.time() - 60)
+        self.enterContext(override_settings(
+            BACKUP_DIR=self.directory,
+            BACKUP_FILES={},
+            DATABASE_NAMES={},
+            CONSOLIDATED_DATABASE=None,
+            BACKUP_REFRESH_INTERVAL=0,
+            BACKUP_ALIAS_GRACE=3600,
+        ))
+        self.registry = BackupRegistry()
+        self.registry.refresh(force=True)
+        self.addCleanup(self.forget_aliases)
+
+    def forget_aliases(self):
+        for alias in [alias for alias in connections.settings if alias.split('@')[0] == COMPANY]:
+            connections[alias].close()
+            del connections[alias]
+            connections.settings.pop(alias)
+
+    def install_snapshot(self, version):
+        path = self.directory / f'{COMPANY}.{version}.db'
+        create_backup(path, time.time())
+        return path
+
+    def test_concurrent_refresh_registers_new_snapshot_once(self):
+        path = self.install_snapshot('20260101T000000')
+        workers = 8
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def refresh():
+            barrier.wait()
+            results.append(self.registry.refresh())
+
+        threads = [threading.Thread(target=refresh) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        swaps = [result for result in results if result]
+        self.assertEqual(swaps, [{COMPANY: f'{COMPANY}@2'}])
+        self.assertEqual(self.registry.path_for(COMPANY), path)
+        self.assertNotIn(f'{COMPANY}@3', connections.settings)
+
+    def test_replaced_alias_is_dropped_after_grace(self):
+        self.install_snapshot('20260101T000000')
+        self.assertEqual(self.registry.refresh(), {COMPANY: f'{COMPANY}@2'})
+        # Ainda dentro da carência: requisições em andamento continuam no antigo
+        self.assertIn(COMPANY, connections.settings)
+
+        with override_settings(BACKUP_ALIAS_GRACE=0):
+            self.install_snapshot('20260102T000000')
+            self.assertEqual(self.registry.refresh(), {COMPANY: f'{COMPANY}@3'})
+            # A verificação seguinte remove o que foi substituído até aqui
+            self.assertEqual(self.registry.refresh(), {})
+
+        self.assertNotIn(COMPANY, connections.settings)
+        self.assertNotIn(f'{COMPANY}@2', connections.settings)
+        self.assertEqual(self.registry.alias_for(COMPANY), f'{COMPANY}@3')
+        self.assertEqual(self.registry.path_for(COMPANY).name, f'{COMPANY}.20260102T000000.db')
+
+    def test_expired_alias_waits_for_connections_of_other_threads(self):
+        self.enterContext(mock.patch.object(registry, 'backup_registry', self.registry))
+        # O alias só existe depois do setUpClass; libera a conexão dele em outra thread
+        self.enterContext(mock.patch.object(type(self), 'databases', {COMPANY}))
+        # Uma thread de servidor que atendeu uma requisição no snapshot antigo
+        server = self.enterContext(ThreadPoolExecutor(max_workers=1))
+        server.submit(lambda: connections[COMPANY].ensure_connection()).result()
+
+        with override_settings(BACKUP_ALIAS_GRACE=0):
+            self.install_snapshot('20260101T000000')
+            self.registry.refresh()
+            self.registry.refresh()
+            # Expirado, mas continua configurado até a outra thread fechar a conexão
+            self.assertEqual(self.registry.closing_aliases(), {COMPANY})
+            self.assertIn(COMPANY, connections.settings)
+
+            server.submit(request_finished.send, sender=self.__class__).result()
+            self.registry.refresh()
+
+        self.assertEqual(self.registry.closing_aliases(), set())
+        self.assertNotIn(COMPANY, connections.settings)
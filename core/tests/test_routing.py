@@ -0,0 +1,148 @@
+"""
+Roteamento por empresa com requisições concorrentes.
+
+Várias requisições de empresas diferentes ficam em andamento ao mesmo
+tempo, em threads (servidor WSGI com threads) e em tarefas de um mesmo
+event loop (servidor ASGI). Cada uma deve enxergar só o alias da própria
+empresa, no router e na ContextVar, e o banco anterior deve voltar ao
+final, inclusive quando a view levanta uma exceção.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signing import get_cookie_signer
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from core.middleware import DatabaseSelectorMiddleware
+from core.models import ContaPagarCadastro
+from core.registry import backup_registry
+from core.routers import (
+    DEFAULT_DATABASE, MultiDatabaseRouter, get_current_database, using_database,
+)
+from core.sites import COMPANY_COOKIE, COMPANY_COOKIE_SALT
+
+# Tempo máximo de espera pelas outras requisições (segundos)
+TIMEOUT = 10
+
+
+class ViewFailed(Exception):
+    pass
+
+
+class CompanyRoutingTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.companies = list(settings.DATABASE_NAMES)
+        cls.factory = RequestFactory()
+        cls.router = MultiDatabaseRouter()
+
+    def request_for(self, company):
+        return self.factory.get(f'/admin/{company}/core/contapagarcadastro/')
+
+    def seen(self):
+        """(ContextVar, banco do router para um model dos backups) no contexto atual"""
+        return get_current_database(), self.router.db_for_read(ContaPagarCadastro)
+
+    def expected(self, company):
+        alias = backup_registry.alias_for(company)
+        return alias, alias
+
+    def test_threads_see_only_their_company(self):
+        barrier = threading.Barrier(len(self.companies), timeout=TIMEOUT)
+
+        def view(request):
+            before = self.seen()
+            # Todas as requisições em andamento antes de qualquer uma terminar
+            barrier.wait()
+            return HttpResponse(repr((before, self.seen())))
+
+        middleware = DatabaseSelectorMiddleware(view)
+        with ThreadPoolExecutor(max_workers=len(self.companies)) as executor:
+            responses = list(executor.map(lambda company: middleware(self.request_for(company)), self.companies))
+
+        for company, response in zip(self.companies, responses):
+            expected = self.expected(company)
+            self.assertEqual(response.content.decode(), repr((expected, expected)), company)
+        self.assertEqual(get_current_database(), DEFAULT_DATABASE)
+
+    def test_async_tasks_on_one_loop_see_only_their_company(self):
+        async def run():
+            started = 0
+            all_started = asyncio.Event()
+
+            async def view(request):
+                nonlocal started
+                before = self.seen()
+                started += 1
+                if started == len(self.companies):
+                    all_started.set()
+                # As tarefas se intercalam na mesma thread enquanto esperam
+                await asyncio.wait_for(all_started.wait(), TIMEOUT)
+                await asyncio.sleep(0)
+                return HttpResponse(repr((before, self.seen())))
+
+            middleware = DatabaseSelectorMiddleware(view)
+            responses = await asyncio.gather(*(middleware(self.request_for(company)) for company in self.companies))
+            return responses, self.seen()
+
+        responses, after = asyncio.run(run())
+        for company, response in zip(self.companies, responses):
+            expected = self.expected(company)
+            self.assertEqual(response.content.decode(), repr((expected, expected)), company)
+        self.assertEqual(after, self.expected(DEFAULT_DATABASE))
+
+    def test_context_is_reset_after_exception_in_sync_view(self):
+        def view(request):
+            raise ViewFailed
+
+        middleware = DatabaseSelectorMiddleware(view)
+        for company in self.companies:
+            with self.assertRaises(ViewFailed):
+                middleware(self.request_for(company))
+            self.assertEqual(get_current_database(), DEFAULT_DATABASE)
+
+    def test_context_is_reset_after_exception_in_async_view(self):
+        async def view(request):
+            await asyncio.sleep(0)
+            raise ViewFailed
+
+        async def run():
+            middleware = DatabaseSelectorMiddleware(view)
+            results = await asyncio.gather(
+                *(middleware(self.request_for(company)) for company in self.companies),
+                return_exceptions=True,
+            )
+            return results, get_current_database()
+
+        results, after = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ViewFailed) for result in results))
+        self.assertEqual(after, DEFAULT_DATABASE)
+
+    def test_using_database_restores_previous_alias_after_exception(self):
+        company, other = self.companies[:2]
+        with using_database(company):
+            with self.assertRaises(ViewFailed):
+                with using_database(other):
+                    self.assertEqual(self.router.db_for_read(ContaPagarCadastro), other)
+                    raise ViewFailed
+            self.assertEqual(get_current_database(), company)
+        self.assertEqual(get_current_database(), DEFAULT_DATABASE)
+
+    def test_vary_cookie_unless_company_comes_from_url(self):
+        middleware = DatabaseSelectorMiddleware(lambda request: HttpResponse())
+        company = self.companies[-1]
+        cookie = get_cookie_signer(salt=COMPANY_COOKIE + COMPANY_COOKIE_SALT).sign(company)
+        requests = {
+            'url': self.request_for(company),
+            'cookie': self.factory.get('/admin/core/contapagarcadastro/', HTTP_COOKIE=f'{COMPANY_COOKIE}={cookie}'),
+            'default': self.factory.get('/admin/core/contapagarcadastro/'),
+        }
+        for source, request in requests.items():
+            response = middleware(request)
+            self.assertEqual(request.current_database_source, source)
+            self.assertEqual(response.has_header('Vary'), source != 'url', source)
@@ -1,20 +1,91 @@
-from django.shortcuts import redirect
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.http import require_POST
 from django.contrib.admin.views.decorators import staff_member_required
-from django.conf import settings
+from .jobs import active_jobs, job_file, purge_expired, resume_pending_jobs
+from .models import ExportJob
+from .perf import perf_history
+from .registry import available_databases
+from .sites import company_from_path, company_path, set_company_cookie
 
 
 @require_POST
 @staff_member_required
 def select_database(request):
-    """View para selecionar o banco de dados via sessão"""
+    """View para selecionar o banco de dados via cookie assinado"""
     db_alias = request.POST.get('database', 'cdg')
     
-    # Validar se o banco existe
-    available_dbs = list(settings.DATABASE_NAMES.keys())
-    if db_alias in available_dbs:
-        request.session['selected_database'] = db_alias
-    
     # Redirecionar de volta para a página anterior ou admin
     referer = request.META.get('HTTP_REFERER', '/admin/')
-    return redirect(referer)
+    if not url_has_allowed_host_and_scheme(referer, {request.get_host()}, request.is_secure()):
+        referer = '/admin/'
+    
+    # Validar se o banco existe
+    available_dbs = available_databases()
+    if db_alias not in available_dbs:
+        return redirect(referer)
+    
+    # Em uma página /admin/<empresa>/ troca o prefixo (a escolha vale só para
+    # a aba); nas demais grava o cookie
+    url = urlsplit(referer)
+    path = company_path(url.path, db_alias)
+    response = redirect(urlunsplit(('', '', path, url.query, '')))
+    if company_from_path(path) is None:
+        set_company_cookie(request, response, db_alias)
+    return response
+
+
+@staff_member_required
+def performance(request):
+    """Página com o custo de SQL das últimas requisições por ModelAdmin e empresa"""
+    entries = perf_history.entries()
+    slowest = sorted(
+        (
+            {'ms': ms, 'sql': sql, 'alias': alias, 'path': entry['path'], 'company': entry['company']}
+            for entry in entries
+            for alias, stats in entry['aliases'].items()
+            for ms, sql in stats['slowest']
+        ),
+        key=lambda query: query['ms'],
+        reverse=True,
+    )[:20]
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Desempenho das consultas',
+        'breakdown': perf_history.breakdown(),
+        'slowest': slowest,
+        'recent': list(reversed(entries[-50:])),
+        'total_requests': len(entries),
+    }
+    return render(request, 'admin/perf.html', context)
+
+
+@staff_member_required
+def export_jobs(request):
+    """Página com as exportações em segundo plano do usuário"""
+    purge_expired()
+    resume_pending_jobs()
+    jobs = ExportJob.objects.filter(user=request.user)[:50]
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Minhas exportações',
+        'jobs': jobs,
+        'refresh': active_jobs(request.user).exists(),
+        'retention_days': getattr(settings, 'EXPORT_RETENTION_DAYS', 7),
+    }
+    return render(request, 'admin/export_jobs.html', context)
+
+
+@staff_member_required
+def export_job_download(request, pk):
+    """Download do arquivo de uma exportação concluída (só para o dono)"""
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+    path = job_file(job)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name.split('-', 1)[1])
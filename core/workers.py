@@ -0,0 +1,38 @@
+"""
+Ponto de entrada dos processos do pool de exportações (core/jobs.py).
+
+Os processos são criados com 'spawn': a função enviada ao pool é
+importada antes de qualquer inicialização, então este módulo não pode
+depender de models. O Django é configurado no initializer e o job só é
+importado depois disso.
+"""
+import os
+
+
+def init_worker(nice):
+    """Inicializa um processo do pool: prioridade baixa e Django configurado"""
+    try:
+        os.nice(nice)
+    except (AttributeError, OSError):
+        pass
+    import django
+    django.setup()
+
+
+def run(pk):
+    """Executa o ExportJob ``pk`` neste processo e fecha as conexões abertas por ele"""
+    from django.db import connections
+
+    from .jobs import run_job
+
+    try:
+        run_job(pk)
+    finally:
+        connections.close_all()
+
+
+def company_part(*args):
+    """Lê as linhas de uma empresa para a exportação de todas as empresas (core/group_exports.py)"""
+    from .group_exports import company_part
+
+    return company_part(*args)